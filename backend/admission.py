@@ -0,0 +1,262 @@
+import asyncio
+import math
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional
+
+from metrics import Counter, Histogram, registry
+from shared_state import SharedState
+
+
+# Client the current request is admitted for; None for background work
+current_client: ContextVar[Optional[str]] = ContextVar("current_client", default=None)
+
+QUEUE_WAIT = registry.register(Histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for admission", ("outcome",)
+))
+REJECTED = registry.register(Counter(
+    "llm_admission_rejected_total", "LLM calls turned away by admission control", ("reason",)
+))
+
+
+class AdmissionRejected(Exception):
+    """An LLM call was not admitted; retry after `retry_after` seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"LLM capacity exceeded ({reason}), retry after {math.ceil(retry_after)}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class QueueFull(Exception):
+    pass
+
+
+class TokenBucket:
+    """Per-minute quota refilled continuously, as provider RPM/TPM limits are.
+
+    A rate of 0 disables the bucket. `reserve` debits up front and returns
+    how long the caller has to wait for the debit to be covered; the level
+    may go negative so that waiters queue up in order.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60
+        self.capacity = burst or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        if not self.rate or not amount:
+            return 0.0
+        self._refill()
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float):
+        if self.rate and amount:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+    def consume(self, amount: float):
+        """Debit usage known only after the call, e.g. completion tokens"""
+        if self.rate and amount:
+            self._refill()
+            self.level -= amount
+
+
+class Ticket:
+    """Admission held for one LLM call; release it exactly once when the call ends"""
+
+    def __init__(self, controller: "AdmissionController", client: Optional[str]):
+        self.controller = controller
+        self.client = client
+        self.released = False
+
+    def consume_tokens(self, tokens: int):
+        self.controller.tokens.consume(tokens)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self.client)
+
+
+class AdmissionController:
+    """Admission control in front of the LLM provider.
+
+    A call is admitted once it fits the request and token rate limits and
+    holds both a global and a per-client concurrency slot. Callers wait in a
+    bounded queue; when the queue is full, or the wait would exceed
+    `queue_timeout`, the call is rejected with AdmissionRejected carrying a
+    Retry-After hint instead of piling more load onto the provider.
+
+    Concurrency is limited per process. With a cross-process `shared` state,
+    the request and token rates are also counted in one-minute windows
+    shared by all workers, so N workers together stay under the provider's
+    limits rather than each using all of them.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        per_client: int = 4,
+        max_queue: int = 256,
+        queue_timeout: float = 10.0,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        shared: Optional[SharedState] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_client = per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.shared = shared if shared is not None and shared.shared else None
+        self._global = asyncio.Semaphore(max_concurrency)
+        # client -> [semaphore, callers holding or waiting for it]
+        self._clients: Dict[str, list] = {}
+
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        """Bind the semaphores to the running loop"""
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._clients.clear()
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected += 1
+        REJECTED.inc(reason=reason)
+        raise AdmissionRejected(reason, max(1.0, retry_after))
+
+    def _client_semaphore(self, client: str) -> asyncio.Semaphore:
+        entry = self._clients.get(client)
+        if entry is None:
+            entry = self._clients[client] = [asyncio.Semaphore(self.per_client), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _forget_client(self, client: str):
+        entry = self._clients.get(client)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._clients[client]
+
+    async def acquire(self, client: Optional[str] = None, tokens: int = 0) -> Ticket:
+        """Wait for admission; raises AdmissionRejected instead of waiting too long"""
+        started = time.monotonic()
+        if self.shared is not None:
+            await self._check_shared_rates(tokens)
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if delay > self.queue_timeout:
+            self.requests.refund(1)
+            self.tokens.refund(tokens)
+            self._reject("rate_limited", delay)
+
+        client_semaphore = self._client_semaphore(client) if client else None
+        holding = []
+        try:
+            if delay:
+                await self._queued(lambda: asyncio.sleep(delay))
+            for semaphore in (client_semaphore, self._global):
+                if semaphore is None:
+                    continue
+                if semaphore.locked():
+                    remaining = self.queue_timeout - (time.monotonic() - started)
+                    await self._queued(lambda: asyncio.wait_for(semaphore.acquire(), max(0.0, remaining)))
+                else:
+                    await semaphore.acquire()
+                holding.append(semaphore)
+        except QueueFull:
+            self._abandon(client, holding, tokens)
+            self._reject("queue_full", self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(client, holding, tokens)
+            self._observe_wait(started, "timeout")
+            reason = "client_busy" if not holding and client_semaphore is not None else "timeout"
+            self._reject(reason, self.queue_timeout)
+        except BaseException:
+            self._abandon(client, holding, tokens)
+            raise
+
+        self._observe_wait(started, "admitted")
+        self.admitted += 1
+        self.in_flight += 1
+        return Ticket(self, client)
+
+    async def _check_shared_rates(self, tokens: int):
+        """Count the call against the rate limits of every worker together"""
+        now = time.time()
+        window = int(now // 60)
+        retry_after = 60 - now % 60
+        limits = (
+            (f"llm_rpm:{window}", 1, self.requests_per_minute),
+            (f"llm_tpm:{window}", tokens, self.tokens_per_minute),
+        )
+        for key, amount, limit in limits:
+            if limit and amount and await self.shared.incr(key, amount, ttl=120) > limit:
+                self._reject("rate_limited", retry_after)
+
+    async def _queued(self, wait: Callable[[], Awaitable]):
+        """Await `wait()` as one of the bounded queue's waiters"""
+        if self.waiting >= self.max_queue:
+            raise QueueFull()
+        self.waiting += 1
+        try:
+            await wait()
+        finally:
+            self.waiting -= 1
+
+    def _abandon(self, client: Optional[str], holding: list, tokens: int):
+        """Undo a partial acquire: free held slots and give back the rate quota"""
+        for semaphore in holding:
+            semaphore.release()
+        if client:
+            self._forget_client(client)
+        self.requests.refund(1)
+        self.tokens.refund(tokens)
+
+    def _observe_wait(self, started: float, outcome: str):
+        elapsed = time.monotonic() - started
+        QUEUE_WAIT.observe(elapsed, outcome=outcome)
+        if outcome == "admitted":
+            self.wait_total += elapsed
+            self.wait_max = max(self.wait_max, elapsed)
+
+    def _release(self, client: Optional[str]):
+        self.in_flight -= 1
+        self._global.release()
+        if client:
+            entry = self._clients.get(client)
+            if entry is not None:
+                entry[0].release()
+            self._forget_client(client)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "clients": len(self._clients),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_avg": self.wait_total / self.admitted if self.admitted else 0.0,
+            "wait_max": self.wait_max,
+            "max_concurrency": self.max_concurrency,
+            "per_client": self.per_client,
+            "max_queue": self.max_queue,
+        }
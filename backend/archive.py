@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Tuple
+
+import bson
+
+from message_store import PREVIEW_LENGTH, MessageStore
+
+
+logger = logging.getLogger(__name__)
+
+# Fields that describe the stored layout rather than the conversation
+LAYOUT_FIELDS = ("first_seq", "message_count", "last_message", "archived", "archived_at")
+
+
+def encode(conversation: dict) -> bytes:
+    """Compressed BSON, so datetimes and every other field survive the round trip"""
+    return zlib.compress(bson.encode(conversation), 6)
+
+
+def decode(blob: bytes) -> dict:
+    return bson.decode(zlib.decompress(blob))
+
+
+def window(conversation: dict, before: Optional[int] = None, limit: Optional[int] = None, after: Optional[int] = None) -> dict:
+    """Apply MessageStore.get_conversation's message window to a full conversation"""
+    messages = conversation.get("messages", [])
+    count = len(messages)
+    if after is not None:
+        start = min(after + 1, count)
+        end = min(start + limit, count) if limit else count
+    else:
+        end = count if before is None else min(before, count)
+        start = max(0, end - limit) if limit else 0
+    return {**conversation, "messages": messages[start:end], "message_count": count, "first_seq": start}
+
+
+class ArchiveBackend:
+    """Where archived conversations are kept, as one compressed blob each"""
+
+    name = ""
+
+    async def put(self, conversation_id: str, blob: bytes):
+        raise NotImplementedError
+
+    async def get(self, conversation_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def delete(self, conversation_id: str):
+        raise NotImplementedError
+
+
+class CollectionArchive(ArchiveBackend):
+    """Blobs in their own collection, outside the hot conversations working set"""
+
+    name = "collection"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def put(self, conversation_id, blob):
+        await self.collection.update_one(
+            {"_id": conversation_id},
+            {"$set": {"blob": bson.Binary(blob), "size": len(blob), "archived_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def get(self, conversation_id):
+        doc = await self.collection.find_one({"_id": conversation_id}, {"blob": 1})
+        return bytes(doc["blob"]) if doc else None
+
+    async def delete(self, conversation_id):
+        await self.collection.delete_one({"_id": conversation_id})
+
+
+class DiskArchive(ArchiveBackend):
+    """Blobs as files under `root`, named by a hash of the id so any id is a safe path"""
+
+    name = "disk"
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, conversation_id: str) -> Path:
+        digest = hashlib.sha256(conversation_id.encode()).hexdigest()
+        return self.root / digest[:2] / f"{digest}.bson.z"
+
+    def _write(self, path: Path, blob: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(f".{os.getpid()}.tmp")
+        partial.write_bytes(blob)
+        # Readers see either the old file or the complete new one
+        os.replace(partial, path)
+
+    async def put(self, conversation_id, blob):
+        await asyncio.to_thread(self._write, self._path(conversation_id), blob)
+
+    async def get(self, conversation_id):
+        try:
+            return await asyncio.to_thread(self._path(conversation_id).read_bytes)
+        except FileNotFoundError:
+            return None
+
+    async def delete(self, conversation_id):
+        await asyncio.to_thread(self._path(conversation_id).unlink, missing_ok=True)
+
+
+class Archiver:
+    """Moves idle conversations out of the hot collections.
+
+    A conversation not updated for `idle_days` is copied to `backend` as a
+    compressed blob, then its hot document is reduced to a stub (see
+    MessageStore). Reads of a stub load the blob, keeping the most recent
+    ones in an LRU of `cache_size` conversations, without touching the hot
+    collections. Writing to an archived conversation restores it first.
+
+    The LRU is per process, so each cached copy is tagged with the stub's
+    `archived_at`: once another worker restores and re-archives the
+    conversation, the stub's new timestamp no longer matches and the blob
+    is read again.
+
+    Stubs carry no message text, so with `index_text` the archiver keeps each
+    archived conversation's message contents in the `archived_text`
+    collection for MongoTextSearch. That text stays in Mongo uncompressed:
+    archiving still shrinks the hot collections, but saves less disk.
+    """
+
+    def __init__(
+        self,
+        store: MessageStore,
+        backend: ArchiveBackend,
+        idle_days: float = 0,
+        batch_size: int = 100,
+        interval: float = 3600,
+        cache_size: int = 64,
+        index_text: bool = False,
+    ):
+        self.store = store
+        self.backend = backend
+        self.idle_days = idle_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.cache_size = cache_size
+        self.index_text = index_text
+        # conversation id -> (archived_at of the stub it was loaded for, conversation)
+        self._cache: "OrderedDict[str, Tuple[datetime, dict]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.archived = 0
+        self.skipped = 0
+        self.restored = 0
+        self.reads = 0
+        self.cache_hits = 0
+        self.bytes_archived = 0
+        self.last_run_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.idle_days > 0
+
+    def start(self, lock=None):
+        """Run archive passes every `interval` seconds; `lock(name, ttl)` keeps other workers out"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop(lock), name="archiver")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self, lock):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if lock is None:
+                    await self.archive_idle()
+                    continue
+                async with lock("archiver", self.interval) as held:
+                    if held:
+                        await self.archive_idle()
+            except Exception as e:
+                logger.error(f"Error archiving idle conversations: {str(e)}")
+
+    async def archive_idle(self) -> int:
+        """Archive up to one batch of conversations idle for longer than `idle_days`"""
+        started = time.perf_counter()
+        cutoff = datetime.utcnow() - timedelta(days=self.idle_days)
+        idle = await self.store.db.conversations.find(
+            {"updated_at": {"$lt": cutoff}, "archived": {"$ne": True}},
+            {"_id": 0, "id": 1}
+        ).sort("updated_at", 1).limit(self.batch_size).to_list(self.batch_size)
+
+        archived = 0
+        for conversation in idle:
+            if await self.archive(conversation["id"]):
+                archived += 1
+        self.last_run_seconds = time.perf_counter() - started
+        if archived:
+            logger.info(f"Archived {archived} idle conversations in {self.last_run_seconds:.2f}s")
+        return archived
+
+    async def archive(self, conversation_id: str) -> bool:
+        """Copy a conversation to the archive and stub it; False if it changed meanwhile or is gone"""
+        conversation = await self.store.get_conversation(conversation_id)
+        if conversation is None or conversation.get("archived"):
+            return False
+
+        document = {key: value for key, value in conversation.items() if key not in LAYOUT_FIELDS}
+        messages = document.get("messages", [])
+        blob = encode(document)
+        await self.backend.put(conversation_id, blob)
+        if self.index_text:
+            await self.store.db.archived_text.replace_one(
+                {"_id": conversation_id},
+                {"content": [message.get("content", "") for message in messages]},
+                upsert=True
+            )
+
+        stub = {
+            "archived": True,
+            "archived_at": datetime.utcnow(),
+            "message_count": len(messages),
+            "last_message": messages[-1]["content"][:PREVIEW_LENGTH] if messages else None,
+        }
+        if not await self.store.stub_conversation(conversation_id, conversation["updated_at"], stub):
+            # A new turn arrived after the copy was read; it stays hot
+            await self._delete(conversation_id)
+            self.skipped += 1
+            return False
+        self._cache.pop(conversation_id, None)
+        self.archived += 1
+        self.bytes_archived += len(blob)
+        return True
+
+    async def load(self, conversation_id: str, archived_at: Optional[datetime] = None) -> Optional[dict]:
+        """The full archived conversation, from the cache or the backend
+
+        `archived_at` is the stub's; a cached copy is used only if it was
+        loaded for the same one. Without it the backend is always read.
+        """
+        self.reads += 1
+        cached = self._cache.get(conversation_id)
+        if cached is not None and archived_at is not None and cached[0] == archived_at:
+            self._cache.move_to_end(conversation_id)
+            self.cache_hits += 1
+            return cached[1]
+
+        blob = await self.backend.get(conversation_id)
+        if blob is None:
+            self._cache.pop(conversation_id, None)
+            return None
+        conversation = await asyncio.to_thread(decode, blob)
+        if archived_at is not None:
+            self._cache[conversation_id] = (archived_at, conversation)
+            self._cache.move_to_end(conversation_id)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return conversation
+
+    async def restore(self, conversation_id: str) -> bool:
+        """Move an archived conversation back to the hot collections; False if it is not archived"""
+        conversation = await self.load(conversation_id)
+        if conversation is None:
+            return False
+        if not await self.store.restore_conversation(conversation):
+            return False
+        self._cache.pop(conversation_id, None)
+        await self._delete(conversation_id)
+        self.restored += 1
+        return True
+
+    async def remove(self, conversation_id: str):
+        """Forget an archived copy, e.g. when the conversation is deleted"""
+        self._cache.pop(conversation_id, None)
+        await self._delete(conversation_id)
+
+    async def _delete(self, conversation_id: str):
+        await self.backend.delete(conversation_id)
+        if self.index_text:
+            await self.store.db.archived_text.delete_one({"_id": conversation_id})
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "enabled": self.enabled,
+            "archived": self.archived,
+            "skipped": self.skipped,
+            "restored": self.restored,
+            "reads": self.reads,
+            "cache_hits": self.cache_hits,
+            "cached": len(self._cache),
+            "bytes_archived": self.bytes_archived,
+            "last_run_seconds": self.last_run_seconds,
+        }
+
+
+ARCHIVE_BACKENDS = {
+    CollectionArchive.name: lambda db, path: CollectionArchive(db.conversation_archive),
+    DiskArchive.name: lambda db, path: DiskArchive(path),
+}
+
+
+def create_archive_backend(name: str, db, path: str) -> ArchiveBackend:
+    """Build the archive backend selected by name"""
+    try:
+        return ARCHIVE_BACKENDS[name](db, path)
+    except KeyError:
+        raise ValueError(f"Unknown archive backend '{name}', expected one of {sorted(ARCHIVE_BACKENDS)}")
@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Set
+
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, ReturnDocument
+
+from admission import AdmissionRejected, current_client
+from context import estimate_tokens
+from resilience import CircuitOpen
+
+
+logger = logging.getLogger(__name__)
+
+Complete = Callable[[str, str, str], Awaitable[str]]
+
+# Fields of an item returned in the results stream
+RESULT_FIELDS = {"_id": 0, "index": 1, "custom_id": 1, "status": 1, "response": 1, "error": 1, "latency": 1}
+
+
+class BatchItem(BaseModel):
+    """One line of a batch upload"""
+    custom_id: Optional[str] = None
+    message: str = Field(min_length=1)
+    system_message: Optional[str] = None
+
+
+class BatchRunner:
+    """Runs batch jobs: prompts answered one by one, outside any conversation.
+
+    A job's items are stored in `items` as they are uploaded and processed
+    by `concurrency` workers per process. A worker claims an item with a
+    lease of `lease` seconds, and its result is written as soon as it is
+    known, so the results are the checkpoint: after a restart or on another
+    process, workers pick up the items still pending, and items whose lease
+    ran out, e.g. because the process holding them died. An item is given
+    up after `max_attempts` claims.
+
+    Each job is its own admission client, so a batch gets at most the
+    per-client share of the LLM slots and interactive traffic keeps the rest.
+    Calls rejected by admission or an open circuit are put back and retried
+    after the suggested delay without counting as an attempt.
+    """
+
+    def __init__(
+        self,
+        jobs,
+        items,
+        complete: Complete,
+        system_message: str = "",
+        concurrency: int = 4,
+        lease: float = 300,
+        max_attempts: int = 3,
+        poll_interval: float = 5,
+        retention: float = 7 * 86400,
+    ):
+        self.jobs = jobs
+        self.items = items
+        self.complete = complete
+        self.system_message = system_message
+        self.concurrency = concurrency
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._claimed: Set = set()
+
+        # Metrics
+        self.completed = 0
+        self.failed = 0
+        self.deferred = 0
+        self.latency_total = 0.0
+
+    def start(self):
+        """Start the worker tasks"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"batch-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        """Stop the workers and hand their unfinished items back for the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._claimed:
+            await self.items.update_many(
+                {"_id": {"$in": list(self._claimed)}, "status": "running"},
+                {"$set": {"status": "pending"}, "$unset": {"lease_until": ""}, "$inc": {"attempts": -1}}
+            )
+            self._claimed.clear()
+
+    async def create_job(self) -> str:
+        job_id = str(uuid.uuid4())
+        await self.jobs.insert_one({
+            "id": job_id,
+            "status": "receiving",
+            "total": None,
+            "completed": 0,
+            "failed": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+        })
+        return job_id
+
+    async def add_items(self, job_id: str, start: int, items: List[BatchItem]):
+        """Store a chunk of uploaded items; workers may start on them right away"""
+        await self.items.insert_many([
+            {**item.dict(), "job_id": job_id, "index": start + offset, "status": "pending", "attempts": 0}
+            for offset, item in enumerate(items)
+        ], ordered=False)
+        self._wakeup.set()
+
+    async def open_job(self, job_id: str, total: int):
+        """Mark the upload complete; the job finishes once all `total` items have a result"""
+        job = await self.jobs.find_one_and_update(
+            {"id": job_id, "status": "receiving"},
+            {"$set": {"status": "running", "total": total, "started_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            await self._maybe_finish(job)
+
+    async def discard(self, job_id: str):
+        """Drop a job whose upload failed"""
+        await self.jobs.delete_one({"id": job_id})
+        await self.items.delete_many({"job_id": job_id})
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """Stop a job: pending items are cancelled, results so far are kept"""
+        job = await self.jobs.find_one_and_update(
+            {"id": job_id, "status": {"$in": ["receiving", "running"]}},
+            {"$set": {"status": "cancelled", "finished_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return await self.get_job(job_id)
+        await self.items.update_many({"job_id": job_id, "status": "pending"}, {"$set": {"status": "cancelled"}})
+        await self._expire(job_id)
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        return await self.jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def results(self, job_id: str, after: Optional[int] = None, batch_size: int = 100) -> AsyncIterator[dict]:
+        """Finished items in upload order, optionally only those after index `after`"""
+        query = {"job_id": job_id, "status": {"$in": ["completed", "failed"]}}
+        if after is not None:
+            query["index"] = {"$gt": after}
+        cursor = self.items.find(query, RESULT_FIELDS).sort("index", ASCENDING).batch_size(batch_size)
+        async for item in cursor:
+            yield item
+
+    async def _worker(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                item = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error claiming batch item: {str(e)}")
+                item = None
+            if item is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._claimed.add(item["_id"])
+            try:
+                await self._run(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error recording batch item {item['job_id']}:{item['index']}: {str(e)}")
+            self._claimed.discard(item["_id"])
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.items.find_one_and_update(
+            {"$or": [{"status": "pending"}, {"status": "running", "lease_until": {"$lt": now}}]},
+            {"$set": {"status": "running", "lease_until": now + timedelta(seconds=self.lease)}, "$inc": {"attempts": 1}},
+            sort=[("_id", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run(self, item: dict):
+        if item["attempts"] > self.max_attempts:
+            await self._finish(item, error=f"Gave up after {self.max_attempts} attempts")
+            return
+
+        current_client.set(f"batch:{item['job_id']}")
+        started = time.perf_counter()
+        try:
+            response = await self.complete(
+                f"batch_{item['job_id']}_{item['index']}",
+                item.get("system_message") or self.system_message,
+                item["message"]
+            )
+        except (AdmissionRejected, CircuitOpen) as e:
+            # Not the item's fault: put it back and let the provider recover
+            self.deferred += 1
+            await self.items.update_one(
+                {"_id": item["_id"], "status": "running"},
+                {"$set": {"status": "pending"}, "$unset": {"lease_until": ""}, "$inc": {"attempts": -1}}
+            )
+            await asyncio.sleep(e.retry_after)
+            return
+        except Exception as e:
+            await self._finish(item, error=str(e), latency=time.perf_counter() - started)
+            return
+        await self._finish(item, response=response, latency=time.perf_counter() - started)
+
+    async def _finish(self, item: dict, response: Optional[str] = None, error: Optional[str] = None, latency: float = 0.0):
+        status = "failed" if error is not None else "completed"
+        result = await self.items.update_one(
+            {"_id": item["_id"], "status": "running"},
+            {
+                "$set": {"status": status, "response": response, "error": error, "latency": latency, "finished_at": datetime.utcnow()},
+                "$unset": {"lease_until": ""}
+            }
+        )
+        if result.matched_count == 0:
+            return
+
+        if error is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+        self.latency_total += latency
+        job = await self.jobs.find_one_and_update(
+            {"id": item["job_id"]},
+            {"$inc": {
+                status: 1,
+                "prompt_tokens": estimate_tokens(item["message"]),
+                "completion_tokens": estimate_tokens(response or ""),
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            await self._maybe_finish(job)
+
+    async def _maybe_finish(self, job: dict):
+        if job["status"] != "running" or job["completed"] + job["failed"] < job["total"]:
+            return
+        result = await self.jobs.update_one(
+            {"id": job["id"], "status": "running"},
+            {"$set": {"status": "completed", "finished_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            await self._expire(job["id"])
+            logger.info(f"Batch job {job['id']} finished: {job['completed']} completed, {job['failed']} failed")
+
+    async def _expire(self, job_id: str):
+        """Let the TTL index remove a finished job after `retention`"""
+        expires_at = datetime.utcnow() + timedelta(seconds=self.retention)
+        await self.jobs.update_one({"id": job_id}, {"$set": {"expires_at": expires_at}})
+        await self.items.update_many({"job_id": job_id}, {"$set": {"expires_at": expires_at}})
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "workers": len(self._tasks),
+            "in_flight": len(self._claimed),
+            "completed": self.completed,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "latency_avg": self.latency_total / finished if finished else 0.0,
+        }
+
+
+def progress(job: dict) -> dict:
+    """A job with its pending count, throughput and estimated time left"""
+    total = job.get("total")
+    processed = job["completed"] + job["failed"]
+    started = job.get("started_at") or job["created_at"]
+    elapsed = max(((job.get("finished_at") or datetime.utcnow()) - started).total_seconds(), 0.0)
+    rate = processed / elapsed if elapsed else 0.0
+    remaining = total - processed if total is not None else None
+    return {
+        **{key: value for key, value in job.items() if key not in ("_id", "expires_at")},
+        "processed": processed,
+        "pending": remaining,
+        "elapsed_seconds": elapsed,
+        "items_per_second": rate,
+        "tokens_per_second": (job["prompt_tokens"] + job["completion_tokens"]) / elapsed if elapsed else 0.0,
+        "eta_seconds": remaining / rate if rate and remaining is not None and job["status"] == "running" else None,
+    }
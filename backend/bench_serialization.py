@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the conversation read path.
+
+Builds a stored conversation document with N messages and times turning it
+into a response body two ways:
+
+    models  rebuild ChatMessage/ConversationWindow, validate them again through
+            the response_model and encode with jsonable_encoder + json.dumps
+            (what GET /api/conversations/{id} used to do)
+    fast    encode the stored document directly with fast_json.dumps
+
+Usage:
+    python bench_serialization.py --messages 100 1000 5000 --repeat 20
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List, Optional
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field
+
+import fast_json
+
+
+# Same shapes as the models in server.py; importing server would need a
+# database and the LLM client.
+class ChatMessage(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    role: str
+    content: str
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    avatar: str
+
+
+class ConversationWindow(BaseModel):
+    id: str
+    title: str
+    messages: List[ChatMessage]
+    created_at: datetime
+    updated_at: datetime
+    message_count: int
+    first_seq: int
+
+
+def make_document(count: int, length: int) -> dict:
+    started = datetime.utcnow()
+    messages = [
+        {
+            "id": str(uuid.uuid4()),
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": ("lorem ipsum " * (length // 12 + 1))[:length],
+            "timestamp": started + timedelta(seconds=i),
+            "avatar": "👤" if i % 2 == 0 else "🤖",
+        }
+        for i in range(count)
+    ]
+    return {
+        "id": str(uuid.uuid4()),
+        "title": "Benchmark conversation",
+        "messages": messages,
+        "created_at": started,
+        "updated_at": started + timedelta(seconds=count),
+        "message_count": count,
+        "first_seq": 0,
+    }
+
+
+def models_path(document: dict) -> bytes:
+    conversation = dict(document)
+    conversation["messages"] = [ChatMessage(**msg) for msg in conversation["messages"]]
+    window = ConversationWindow(**conversation)
+    # FastAPI re-validates the returned object against response_model
+    validated = ConversationWindow.model_validate(window.model_dump())
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_path(document: dict) -> bytes:
+    return fast_json.dumps(document)
+
+
+def best_of(encode: Callable[[dict], bytes], document: dict, repeat: int) -> float:
+    best: Optional[float] = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(document)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the model-based and direct conversation encoders")
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 1000, 5000], help="conversation sizes to time")
+    parser.add_argument("--length", type=int, default=400, help="characters per message")
+    parser.add_argument("--repeat", type=int, default=10, help="runs per size; the best one is reported")
+    args = parser.parse_args()
+
+    encoder = "orjson" if fast_json.orjson is not None else "json"
+    print(f"fast path encoder: {encoder}")
+    print(f"{'messages':>10}{'bytes':>12}{'models ms':>12}{'fast ms':>10}{'speedup':>10}")
+    for count in args.messages:
+        document = make_document(count, args.length)
+        assert json.loads(models_path(document)) == json.loads(fast_path(document))
+        slow = best_of(models_path, document, args.repeat)
+        fast = best_of(fast_path, document, args.repeat)
+        size = len(fast_path(document))
+        print(f"{count:>10}{size:>12}{slow * 1000:>12.2f}{fast * 1000:>10.2f}{slow / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Load-generation benchmark for the chat API.
+
+Runs the FastAPI app in-process against FakeLlmChat (see fake_llm.py) and an
+in-memory Mongo (mongomock-motor), or a real Mongo with --mongo-url. Concurrent
+workers drive a weighted mix of send/list/get/delete requests. The report has
+p50/p95/p99 latency per operation, requests per second and event-loop lag.
+
+With --workers the app runs as separate uvicorn worker processes, as
+serve.py starts it, and is driven over HTTP; a list of worker counts reports
+how throughput scales. Event-loop lag is then the load generator's.
+
+Usage:
+    python benchmark.py --concurrency 32 --duration 20 --output bench.json
+    python benchmark.py --mix send=1 --llm-latency 0.5 --tokens-per-second 40
+    python benchmark.py --output new.json --compare old.json
+    python benchmark.py --workers 1,2,4 --mongo-url mongodb://localhost:27017
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+
+DEFAULT_MIX = "send=0.3,list=0.3,get=0.3,delete=0.1"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": len(ordered) + errors,
+        "errors": errors,
+        "rps": round((len(ordered) + errors) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+    }
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("send", "list", "get", "delete"):
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}' in mix")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_app(args):
+    """Import server.py wired to the fake LLM and the selected Mongo"""
+    import fake_llm
+    fake_llm.install(
+        latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        failure_rate=args.llm_failure_rate,
+        hang_rate=args.llm_hang_rate,
+    )
+
+    os.environ.setdefault('DB_NAME', 'benchmark')
+    # The simulated clients are told apart by X-Client-Id, as behind a trusted proxy
+    os.environ.setdefault('TRUST_CLIENT_ID', 'true')
+    if args.mongo_url:
+        os.environ['MONGO_URL'] = args.mongo_url
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("mongomock-motor is required without --mongo-url: pip install mongomock-motor")
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+        os.environ.setdefault('MONGO_URL', 'mongodb://benchmark')
+
+    import logging
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    return server
+
+
+async def monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01):
+    """Record how late the event loop wakes up from a fixed sleep"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+class Workload:
+    def __init__(self, client, mix: Dict[str, float], rng: random.Random, clients: int = 16):
+        self.client = client
+        self.clients = clients
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.rng = rng
+        self.conversation_ids: List[str] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def seed(self, count: int):
+        for i in range(count):
+            response = await self.client.post("/api/chat/send", json={"message": f"Seed conversation {i}"})
+            response.raise_for_status()
+            self.conversation_ids.append(response.json()["conversation_id"])
+
+    def pick_conversation(self):
+        return self.rng.choice(self.conversation_ids) if self.conversation_ids else None
+
+    async def send(self):
+        conversation_id = self.pick_conversation() if self.rng.random() < 0.5 else None
+        payload = {"message": f"Benchmark question {self.rng.randrange(1_000_000)}"}
+        if conversation_id:
+            payload["conversation_id"] = conversation_id
+        # Spread sends over several client ids so per-client admission limits behave as in production
+        headers = {"X-Client-Id": f"benchmark-{self.rng.randrange(self.clients)}"}
+        response = await self.client.post("/api/chat/send", json=payload, headers=headers)
+        if response.status_code == 200 and not conversation_id:
+            self.conversation_ids.append(response.json()["conversation_id"])
+        return response
+
+    async def list(self):
+        return await self.client.get("/api/conversations")
+
+    async def get(self):
+        conversation_id = self.pick_conversation()
+        if not conversation_id:
+            return await self.list()
+        return await self.client.get(f"/api/conversations/{conversation_id}")
+
+    async def delete(self):
+        if len(self.conversation_ids) < 2:
+            return await self.list()
+        conversation_id = self.conversation_ids.pop(self.rng.randrange(len(self.conversation_ids)))
+        return await self.client.delete(f"/api/conversations/{conversation_id}")
+
+    async def worker(self, deadline: float, remaining: List[int]):
+        while time.perf_counter() < deadline:
+            if remaining[0] is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            name = self.rng.choices(self.operations, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(self, name)()
+                ok = response.status_code < 400 or (name in ("get", "delete") and response.status_code == 404)
+            except Exception:
+                ok = False
+            if ok:
+                self.latencies[name].append(time.perf_counter() - started)
+            else:
+                self.errors[name] += 1
+
+
+async def measure(client, args) -> dict:
+    """Seed conversations through `client`, drive the workload and summarize it"""
+    workload = Workload(client, args.mix, random.Random(args.seed), clients=args.clients)
+    await workload.seed(args.seed_conversations)
+
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+
+    remaining = [args.requests]
+    started = time.perf_counter()
+    deadline = started + (args.duration if args.requests is None else float("inf"))
+    await asyncio.gather(*(workload.worker(deadline, remaining) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_task
+
+    all_latencies = [value for values in workload.latencies.values() for value in values]
+    lag = sorted(lag_samples)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "mongo": args.mongo_url or "mongomock",
+            "workers": None,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 3),
+            "mix": args.mix,
+            "clients": args.clients,
+            "llm_latency_s": args.llm_latency,
+            "tokens_per_second": args.tokens_per_second,
+            "response_tokens": args.response_tokens,
+            "llm_failure_rate": args.llm_failure_rate,
+            "llm_hang_rate": args.llm_hang_rate,
+        },
+        "overall": summarize(all_latencies, sum(workload.errors.values()), elapsed),
+        "operations": {
+            name: summarize(workload.latencies[name], workload.errors[name], elapsed)
+            for name in args.mix
+        },
+        "event_loop_lag_ms": {
+            "p50": round(percentile(lag, 50) * 1000, 3),
+            "p99": round(percentile(lag, 99) * 1000, 3),
+            "max": round(lag[-1] * 1000, 3) if lag else 0.0,
+        },
+    }
+
+
+async def run(args) -> dict:
+    """Benchmark the app in this process, through an ASGI transport"""
+    import httpx
+
+    server = load_app(args)
+    app = server.app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            return await measure(client, args)
+
+
+def worker_app():
+    """uvicorn app factory for worker processes; settings come from BENCHMARK_ARGS"""
+    args = argparse.Namespace(**json.loads(os.environ["BENCHMARK_ARGS"]))
+    return load_app(args).app
+
+
+async def wait_ready(client, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with status {process.returncode} before becoming ready")
+        try:
+            if (await client.get("/api/health/ready")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit(f"Server not ready after {timeout}s")
+
+
+async def run_workers(args, workers: int) -> dict:
+    """Benchmark `workers` uvicorn processes over HTTP, as serve.py runs them
+
+    Every worker needs to see the same data, so this is meant for --mongo-url;
+    with mongomock each worker has a private database and follow-up requests
+    that land on another worker fail. The load generator runs in this process,
+    so give it a spare core or its own limits will show up as the ceiling.
+    """
+    import httpx
+
+    env = dict(os.environ, WORKERS=str(workers), BENCHMARK_ARGS=json.dumps({
+        "llm_latency": args.llm_latency,
+        "tokens_per_second": args.tokens_per_second,
+        "response_tokens": args.response_tokens,
+        "llm_failure_rate": args.llm_failure_rate,
+        "llm_hang_rate": args.llm_hang_rate,
+        "mongo_url": args.mongo_url,
+    }))
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "benchmark:worker_app", "--factory",
+            "--host", "127.0.0.1", "--port", str(args.port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=ROOT_DIR,
+        env=env,
+    )
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None, limits=limits) as client:
+            await wait_ready(client, process)
+            report = await measure(client, args)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    report["meta"]["workers"] = workers
+    return report
+
+
+def print_report(report: dict):
+    meta = report["meta"]
+    workers = f"  workers {meta['workers']}" if meta.get("workers") else ""
+    print(f"revision {meta['revision']}  concurrency {meta['concurrency']}  duration {meta['duration_s']}s  mongo {meta['mongo']}{workers}")
+    print(f"{'operation':<10}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report["operations"].items()) + [("overall", report["overall"])]
+    for name, stats in rows:
+        print(f"{name:<10}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    lag = report["event_loop_lag_ms"]
+    print(f"event loop lag ms: p50 {lag['p50']}  p99 {lag['p99']}  max {lag['max']}")
+
+
+def print_comparison(report: dict, baseline: dict):
+    print(f"\ncompared with {baseline['meta']['revision']}:")
+    rows = [("overall", report["overall"], baseline["overall"])]
+    rows += [
+        (name, stats, baseline["operations"][name])
+        for name, stats in report["operations"].items()
+        if name in baseline.get("operations", {})
+    ]
+    for name, new, old in rows:
+        changes = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            delta = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            changes.append(f"{key} {old[key]} -> {new[key]} ({delta:+.1f}%)")
+        print(f"  {name:<10}" + "  ".join(changes))
+
+
+def print_scaling(reports: List[dict]):
+    base = reports[0]["overall"]["rps"]
+    print(f"\n{'workers':<10}{'rps':>10}{'speedup':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for report in reports:
+        overall = report["overall"]
+        speedup = overall["rps"] / base if base else 0.0
+        print(f"{report['meta']['workers']:<10}{overall['rps']:>10}{speedup:>10.2f}"
+              f"{overall['p50_ms']:>10}{overall['p99_ms']:>10}{overall['errors']:>8}")
+
+
+def parse_workers(text: str) -> List[int]:
+    try:
+        counts = [int(part) for part in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected worker counts like 1,2,4, got '{text}'")
+    if any(count < 1 for count in counts):
+        raise argparse.ArgumentTypeError("Worker counts must be at least 1")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat API in-process against a fake LLM")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent client workers")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests instead of --duration")
+    parser.add_argument("--clients", type=int, default=16, help="distinct client ids sends are spread over")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed-conversations", type=int, default=20, help="conversations created before measuring")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the operation sequence")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="fake LLM generation speed")
+    parser.add_argument("--response-tokens", type=int, default=50, help="fake LLM answer length")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="probability a fake LLM call fails")
+    parser.add_argument("--llm-hang-rate", type=float, default=0.0, help="probability a fake LLM call never answers")
+    parser.add_argument("--mongo-url", default=None, help="use this MongoDB instead of mongomock")
+    parser.add_argument("--workers", type=parse_workers, default=None,
+                        help="run uvicorn with this many worker processes instead of in-process; "
+                             "a list like 1,2,4 runs each and reports the scaling")
+    parser.add_argument("--port", type=int, default=8765, help="port for --workers servers")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    parser.add_argument("--compare", default=None, help="JSON report of a previous run to compare against")
+    args = parser.parse_args()
+
+    if args.workers:
+        if not args.mongo_url:
+            print("warning: without --mongo-url every worker has its own mongomock database", file=sys.stderr)
+        reports = []
+        for workers in args.workers:
+            reports.append(asyncio.run(run_workers(args, workers)))
+            print_report(reports[-1])
+            print()
+        if len(reports) > 1:
+            print_scaling(reports)
+        report = reports[-1]
+    else:
+        reports = [asyncio.run(run(args))]
+        report = reports[0]
+        print_report(report)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report if len(reports) == 1 else {"runs": reports}, indent=2))
+    if args.compare:
+        print_comparison(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
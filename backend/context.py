@@ -0,0 +1,270 @@
+import logging
+import math
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Set
+
+from pydantic import BaseModel
+from pymongo import DESCENDING
+
+from shared_state import SharedState
+
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+# Per-message overhead for role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_SYSTEM_MESSAGE = "Summarize the conversation below for an assistant that will continue it. Keep names, facts, decisions and open questions. Reply with the summary only, in under 200 words."
+
+# Longest a worker may hold a conversation's summary lock, e.g. if it dies mid-refresh
+SUMMARY_LOCK_TTL = 300
+
+Complete = Callable[[str, str, str], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate, no tokenizer round-trip"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def render_transcript(messages: List[dict]) -> str:
+    lines = []
+    for message in messages:
+        speaker = "Assistant" if message.get("role") == "assistant" else "User"
+        lines.append(f"{speaker}: {message.get('content', '')}")
+    return "\n\n".join(lines)
+
+
+class PromptContext(BaseModel):
+    text: str
+    tokens: int
+    messages_used: int = 0
+    messages_dropped: int = 0
+    summary_used: bool = False
+
+
+def build_prompt(
+    history: List[dict],
+    message: str,
+    token_budget: int,
+    system_message: str = "",
+    summary: Optional[str] = None,
+) -> PromptContext:
+    """Fit as much recent history as the token budget allows in front of `message`
+
+    History is taken newest first until the budget runs out. The new message
+    and the summary are always included, even if together they exceed it.
+    """
+    used = estimate_tokens(system_message) + estimate_tokens(message) + MESSAGE_OVERHEAD_TOKENS
+    if summary:
+        used += estimate_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+
+    kept = []
+    for past in reversed(history):
+        cost = message_tokens(past)
+        if used + cost > token_budget:
+            break
+        kept.append(past)
+        used += cost
+    kept.reverse()
+
+    if not kept and not summary:
+        return PromptContext(text=message, tokens=used, messages_dropped=len(history))
+
+    sections = []
+    if summary:
+        sections.append(f"Summary of the earlier conversation:\n{summary}")
+    if kept:
+        sections.append(f"Conversation so far:\n{render_transcript(kept)}")
+    sections.append(f"Reply to the user's latest message:\n{message}")
+
+    return PromptContext(
+        text="\n\n".join(sections),
+        tokens=used,
+        messages_used=len(kept),
+        messages_dropped=len(history) - len(kept),
+        summary_used=bool(summary),
+    )
+
+
+class ContextBuilder:
+    """Assembles the prompt for a turn from the stored conversation.
+
+    Reads at most `max_messages` previous messages and trims them to
+    `token_budget`. With a `complete` callable, messages that fall out of the
+    window are folded into a rolling summary stored on the conversation as
+    {"text", "upto_seq", "version"}; messages it covers are left out of the
+    prompt. Dropped messages are summarized in closed segments of
+    `summary_segment`, so the model is called once per segment rather than
+    on every turn, at the cost of up to a segment of messages being in
+    neither the prompt nor the summary meanwhile. The summary is refreshed
+    in the background and the cached version is used until then, so building
+    a prompt never waits on the model. Every version is also kept in the
+    conversation_summaries collection, the latest `summary_versions` per
+    conversation. With a `state`, workers take a shared lock per conversation
+    so only one of them summarizes it at a time. With `restore`, an archived
+    conversation is brought back before its history is read.
+    """
+
+    def __init__(
+        self,
+        store,
+        max_messages: int = 20,
+        token_budget: int = 4000,
+        complete: Optional[Complete] = None,
+        spawn: Optional[Callable] = None,
+        summary_batch: int = 200,
+        summary_segment: int = 10,
+        summary_versions: int = 10,
+        state: Optional[SharedState] = None,
+        restore: Optional[Callable[[str], Awaitable[bool]]] = None,
+    ):
+        self.store = store
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self.complete = complete
+        self.spawn = spawn
+        self.summary_batch = summary_batch
+        self.summary_segment = summary_segment
+        self.summary_versions = summary_versions
+        self.state = state
+        self.restore = restore
+        self._refreshing: Set[str] = set()
+
+        # Metrics
+        self.prompts = 0
+        self.summaries_used = 0
+        self.summaries_written = 0
+        self.summary_failures = 0
+        self.messages_covered = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_messages > 0
+
+    async def build(self, conversation_id: str, message: str, system_message: str = "") -> Optional[PromptContext]:
+        """Prompt for the not yet stored `message`; None if the conversation does not exist"""
+        conversation = await self.store.get_conversation(conversation_id, limit=self.max_messages)
+        if not conversation:
+            return None
+        if conversation.get("archived") and self.restore is not None and await self.restore(conversation_id):
+            conversation = await self.store.get_conversation(conversation_id, limit=self.max_messages)
+
+        history = conversation.get("messages", [])
+        first_seq = conversation.get("first_seq", 0)
+        summary = (conversation.get("summary") or {}) if self.complete else {}
+        covered = summary.get("upto_seq", 0)
+
+        # Messages the summary already covers would only repeat it
+        skipped = max(0, min(covered - first_seq, len(history)))
+        history = history[skipped:]
+        context = build_prompt(history, message, self.token_budget, system_message, summary=summary.get("text"))
+        self.prompts += 1
+        if context.summary_used:
+            self.summaries_used += 1
+            self.messages_covered += skipped
+
+        # Everything before the first message kept in the prompt should be
+        # summarized, one closed segment at a time
+        window_start = first_seq + skipped + context.messages_dropped
+        closed = (window_start - covered) // self.summary_segment * self.summary_segment
+        if self.complete and closed > 0:
+            self.schedule_summary(conversation_id, covered + closed)
+        return context
+
+    def schedule_summary(self, conversation_id: str, upto_seq: int):
+        if conversation_id in self._refreshing or self.spawn is None:
+            return
+        self._refreshing.add(conversation_id)
+        self.spawn(self._refresh_summary(conversation_id, upto_seq))
+
+    async def _refresh_summary(self, conversation_id: str, upto_seq: int):
+        try:
+            if self.state is None:
+                await self._summarize(conversation_id, upto_seq)
+                return
+            async with self.state.lock(f"summary:{conversation_id}", ttl=SUMMARY_LOCK_TTL) as held:
+                if held:
+                    await self._summarize(conversation_id, upto_seq)
+        except Exception as e:
+            self.summary_failures += 1
+            logger.error(f"Error summarizing conversation {conversation_id}: {str(e)}")
+        finally:
+            self._refreshing.discard(conversation_id)
+
+    async def _summarize(self, conversation_id: str, upto_seq: int):
+        conversation = await self.store.db.conversations.find_one(
+            {"id": conversation_id}, {"_id": 0, "summary": 1}
+        )
+        if conversation is None:
+            return
+        summary = conversation.get("summary") or {}
+        covered = summary.get("upto_seq", 0)
+        # Fold in at most one batch of whole segments per refresh; the next turn picks up the rest
+        batch = max(self.summary_batch // self.summary_segment, 1) * self.summary_segment
+        end = min(upto_seq, covered + batch)
+        if end <= covered:
+            return
+
+        window = await self.store.get_conversation(conversation_id, before=end, limit=end - covered)
+        if not window or not window.get("messages"):
+            return
+
+        text = render_transcript(window["messages"])
+        if summary.get("text"):
+            text = f"Existing summary:\n{summary['text']}\n\nNew messages:\n{text}"
+        new_summary = await self.complete(f"summary_{conversation_id}", SUMMARY_SYSTEM_MESSAGE, text)
+        version = summary.get("version", 0) + 1
+        current = {"text": new_summary.strip(), "upto_seq": end, "version": version}
+
+        # Only store it if nobody else advanced the summary meanwhile
+        result = await self.store.db.conversations.update_one(
+            {"id": conversation_id, "summary.upto_seq": summary.get("upto_seq")},
+            {"$set": {"summary": current}}
+        )
+        if result.matched_count == 0:
+            return
+        self.summaries_written += 1
+
+        summaries = self.store.db.conversation_summaries
+        await summaries.insert_one({
+            **current,
+            "conversation_id": conversation_id,
+            "from_seq": covered,
+            "created_at": datetime.utcnow(),
+        })
+        await summaries.delete_many({
+            "conversation_id": conversation_id,
+            "version": {"$lte": version - self.summary_versions}
+        })
+
+    async def list_summaries(self, conversation_id: str) -> List[dict]:
+        """Stored summary versions of a conversation, newest first"""
+        cursor = self.store.db.conversation_summaries.find(
+            {"conversation_id": conversation_id}, {"_id": 0}
+        ).sort("version", DESCENDING)
+        return await cursor.to_list(self.summary_versions)
+
+    async def delete_summaries(self, conversation_id: str):
+        await self.store.db.conversation_summaries.delete_many({"conversation_id": conversation_id})
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "summary": self.complete is not None,
+            "prompts": self.prompts,
+            "summaries_used": self.summaries_used,
+            "summaries_written": self.summaries_written,
+            "summary_failures": self.summary_failures,
+            "refreshing": len(self._refreshing),
+            "messages_covered": self.messages_covered,
+        }
+
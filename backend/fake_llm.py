@@ -0,0 +1,118 @@
+"""
+Local stand-in for emergentintegrations' LlmChat, for benchmarks and tests.
+
+FakeLlmChat has the same constructor, `with_model` and `send_message` as the
+real client, plus `stream_message`. It answers after a configurable latency
+at a configurable token rate, and can fail or hang on purpose, so nothing
+leaves the machine.
+
+    import fake_llm
+    fake_llm.install(latency=0.2, tokens_per_second=80)
+    import server  # now uses FakeLlmChat
+"""
+
+import asyncio
+import random
+import sys
+import types
+from typing import AsyncIterator, Optional
+
+WORDS = (
+    "the model returns a short answer made of plain words so that benchmarks "
+    "measure the server rather than the text it moves around"
+).split()
+
+
+class UserMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeProviderError(Exception):
+    """Raised when a fake call is configured to fail, like a provider's 503"""
+
+    status_code = 503
+
+
+class FakeLlmChat:
+    # Seconds before the first token
+    latency = 0.05
+    # Generation speed once the first token is out; 0 means instant
+    tokens_per_second = 100.0
+    # Length of every answer in tokens (one word per token)
+    response_tokens = 50
+    # Probability that a call raises FakeProviderError
+    failure_rate = 0.0
+    # Probability that a call never answers, to exercise timeouts
+    hang_rate = 0.0
+    # Per-model failure_rate overrides, e.g. {"gemini-2.0-flash": 1.0} to force a fallback
+    model_failure_rates = {}
+
+    calls = 0
+
+    def __init__(self, api_key: str, session_id: str, system_message: str, **kwargs):
+        self.api_key = api_key
+        self.session_id = session_id
+        self.system_message = system_message
+        self.provider = None
+        self.model = None
+
+    @classmethod
+    def configure(cls, **settings):
+        for name, value in settings.items():
+            if not hasattr(cls, name):
+                raise AttributeError(f"FakeLlmChat has no setting '{name}'")
+            setattr(cls, name, value)
+
+    def with_model(self, provider: str, model: str) -> "FakeLlmChat":
+        self.provider = provider
+        self.model = model
+        return self
+
+    def _answer(self, message: UserMessage):
+        if self.system_message.startswith("Generate a short"):
+            return ["Benchmark", "conversation"]
+        return [WORDS[i % len(WORDS)] for i in range(self.response_tokens)]
+
+    async def _start(self):
+        FakeLlmChat.calls += 1
+        if self.hang_rate and random.random() < self.hang_rate:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.latency)
+        failure_rate = self.model_failure_rates.get(self.model, self.failure_rate)
+        if failure_rate and random.random() < failure_rate:
+            raise FakeProviderError(f"Fake {self.model} call failed")
+
+    async def send_message(self, message: UserMessage) -> str:
+        await self._start()
+        words = self._answer(message)
+        if self.tokens_per_second:
+            await asyncio.sleep(len(words) / self.tokens_per_second)
+        return " ".join(words)
+
+    async def stream_message(self, message: UserMessage) -> AsyncIterator[str]:
+        await self._start()
+        delay = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for i, word in enumerate(self._answer(message)):
+            if delay:
+                await asyncio.sleep(delay)
+            yield word if i == 0 else f" {word}"
+
+
+def install(**settings) -> Optional[types.ModuleType]:
+    """Register this module as `emergentintegrations.llm.chat`
+
+    Must run before server.py is imported. Returns the module that was
+    replaced, if any.
+    """
+    FakeLlmChat.configure(**settings)
+
+    module = types.ModuleType("emergentintegrations.llm.chat")
+    module.LlmChat = FakeLlmChat
+    module.UserMessage = UserMessage
+
+    previous = sys.modules.get("emergentintegrations.llm.chat")
+    sys.modules.setdefault("emergentintegrations", types.ModuleType("emergentintegrations"))
+    sys.modules.setdefault("emergentintegrations.llm", types.ModuleType("emergentintegrations.llm"))
+    sys.modules["emergentintegrations.llm.chat"] = module
+    return previous
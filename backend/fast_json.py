@@ -0,0 +1,40 @@
+import json
+from datetime import datetime
+from typing import Any
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode stored documents to JSON, with orjson when it is installed
+
+    Both encoders write naive datetimes in isoformat, the same output
+    FastAPI produces for the Pydantic models.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """JSON response for documents that were validated when they were written
+
+    Returning it from an endpoint skips response_model validation and
+    jsonable_encoder, which dominate read latency for large conversations.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,23 @@
+# gunicorn settings for running server:app with uvicorn workers:
+#
+#     pip install gunicorn
+#     gunicorn -c gunicorn.conf.py server:app
+#
+# HOST, PORT and WORKERS are the same settings serve.py uses; see its
+# docstring for what changes when running more than one worker.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from settings import get_settings
+
+_settings = get_settings()
+
+bind = f"{_settings.host}:{_settings.port}"
+workers = _settings.workers
+worker_class = "uvicorn.workers.UvicornWorker"
+# The lifespan warms Mongo and the LLM client; give it the startup budget before killing a worker
+timeout = max(30, int(_settings.startup_timeout) + 10)
+graceful_timeout = 30
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+Work = Callable[[], Awaitable]
+
+
+class StartupTracker:
+    """Times the server's cold start and tracks whether it is ready for traffic.
+
+    `import_seconds` is how long importing the app took. Each warm-up step
+    run through `step` records its duration and outcome. The server is ready
+    once `finish` has been called and every required step succeeded.
+
+    A required step that failed, e.g. because Mongo was unreachable at boot,
+    is retried in the background every `retry_interval` seconds after
+    `finish` until it succeeds, so the server becomes ready on its own.
+    """
+
+    def __init__(self, import_seconds: float = 0.0, retry_interval: float = 5.0):
+        self.import_seconds = import_seconds
+        self.retry_interval = retry_interval
+        self.startup_seconds = 0.0
+        self.steps: Dict[str, dict] = {}
+        self.started = time.monotonic()
+        self.finished = False
+        # name -> (work, timeout) of required steps still failing
+        self._failed: Dict[str, Tuple[Work, float]] = {}
+        self._retry_task: Optional[asyncio.Task] = None
+
+    async def step(self, name: str, work: Work, timeout: float, required: bool = True) -> bool:
+        """Run `work()` once, recording how it went; returns whether it succeeded"""
+        started = time.perf_counter()
+        error: Optional[str] = None
+        try:
+            await asyncio.wait_for(work(), timeout)
+        except asyncio.TimeoutError:
+            error = f"timed out after {timeout}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        elapsed = time.perf_counter() - started
+        attempts = self.steps.get(name, {}).get("attempts", 0) + 1
+        self.steps[name] = {
+            "ok": error is None, "required": required, "seconds": round(elapsed, 4), "error": error, "attempts": attempts
+        }
+        if error and required:
+            self._failed[name] = (work, timeout)
+        else:
+            self._failed.pop(name, None)
+        if error:
+            logger.error(f"Startup step {name} failed after {elapsed:.2f}s: {error}")
+        else:
+            logger.info(f"Startup step {name} done in {elapsed:.2f}s")
+        return error is None
+
+    def finish(self, started: float):
+        self.startup_seconds = time.perf_counter() - started
+        self.finished = True
+        logger.info(f"Startup finished in {self.startup_seconds:.2f}s (import {self.import_seconds:.2f}s)")
+        if self._failed and self._retry_task is None:
+            self._retry_task = asyncio.create_task(self._retry(), name="startup-retry")
+
+    async def stop(self):
+        if self._retry_task is not None:
+            self._retry_task.cancel()
+            await asyncio.gather(self._retry_task, return_exceptions=True)
+            self._retry_task = None
+
+    async def _retry(self):
+        while self._failed:
+            await asyncio.sleep(self.retry_interval)
+            for name, (work, timeout) in list(self._failed.items()):
+                if await self.step(name, work, timeout):
+                    logger.info(f"Startup step {name} succeeded on retry")
+        self._retry_task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished and all(step["ok"] for step in self.steps.values() if step["required"])
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "import_seconds": round(self.import_seconds, 4),
+            "startup_seconds": round(self.startup_seconds, 4),
+            "uptime_seconds": round(time.monotonic() - self.started, 1),
+        }
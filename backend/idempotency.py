@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of a request's identifying fields"""
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+class IdempotencyError(Exception):
+    """A request reused an idempotency key in a way that cannot be answered"""
+
+    status_code = 409
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class KeyInProgress(IdempotencyError):
+    status_code = 409
+
+
+class KeyReused(IdempotencyError):
+    status_code = 422
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    The first caller starts the work as a task; callers arriving while it
+    runs await the same task and get the same result or exception. The task
+    is shielded, so a caller that disconnects does not cancel the work for
+    the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+        # Metrics
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(call())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finished(key, done))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(future)
+
+    def _finished(self, key: str, future: asyncio.Future):
+        self._calls.pop(key, None)
+        # Mark the exception as retrieved when every caller has gone away
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+class IdempotencyStore:
+    """Results of completed requests, keyed by client-supplied idempotency keys.
+
+    A key is claimed with a pending record before the work starts, so a retry
+    that reaches another worker while the first attempt is still running
+    gets KeyInProgress instead of repeating it. Pending claims expire after
+    `pending_ttl` in case the worker holding them dies. Completed results are
+    kept for `ttl` and removed by a TTL index on `expires_at`.
+    """
+
+    def __init__(self, collection, ttl: float = 86400, pending_ttl: float = 120):
+        self.collection = collection
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+
+        # Metrics
+        self.claimed = 0
+        self.replayed = 0
+        self.conflicts = 0
+
+    async def claim(self, key: str, request_hash: str) -> Optional[dict]:
+        """Claim `key` for a new request; returns the stored response if it already completed"""
+        now = datetime.utcnow()
+        # Take over claims left pending by a worker that went away
+        await self.collection.delete_one({"_id": key, "response": None, "expires_at": {"$lte": now}})
+        try:
+            await self.collection.insert_one({
+                "_id": key,
+                "request_hash": request_hash,
+                "response": None,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.pending_ttl),
+            })
+            self.claimed += 1
+            return None
+        except DuplicateKeyError:
+            pass
+
+        existing = await self.collection.find_one({"_id": key})
+        if existing is None:
+            # Released between our insert and read; the client can simply retry
+            self.conflicts += 1
+            raise KeyInProgress("A request with this idempotency key is still being processed")
+        if existing["request_hash"] != request_hash:
+            self.conflicts += 1
+            raise KeyReused("This idempotency key was already used for a different request")
+        if existing["response"] is None:
+            self.conflicts += 1
+            raise KeyInProgress("A request with this idempotency key is still being processed")
+        self.replayed += 1
+        return existing["response"]
+
+    async def complete(self, key: str, response: dict):
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"response": response, "expires_at": now + timedelta(seconds=self.ttl)}}
+        )
+
+    async def release(self, key: str):
+        """Drop a pending claim after a failure so the request can be retried"""
+        await self.collection.delete_one({"_id": key, "response": None})
+
+    def stats(self) -> dict:
+        return {
+            "claimed": self.claimed,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+        }
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Index declarations for the chat database.
+
+The server creates these indexes on startup. create_index is a no-op when an
+identical index already exists, so this is safe to run on every boot.
+
+Usage:
+    python indexes.py            # create missing indexes
+    python indexes.py --check    # explain() the server's queries and report collection scans
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+
+logger = logging.getLogger(__name__)
+
+# (collection, keys, options)
+INDEXES = [
+    ("conversations", [("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+    ("conversations", [("updated_at", DESCENDING), ("id", DESCENDING)], {"name": "updated_at_desc"}),
+    ("messages", [("conversation_id", ASCENDING), ("seq", ASCENDING)], {"unique": True, "name": "conversation_seq_unique"}),
+    ("status_checks", [("client_name", ASCENDING), ("timestamp", DESCENDING)], {"name": "client_timestamp"}),
+    ("response_cache", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ("idempotency_keys", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ("shared_state", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ("conversation_summaries", [("conversation_id", ASCENDING), ("version", DESCENDING)], {"unique": True, "name": "conversation_version_unique"}),
+    ("conversation_tombstones", [("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+    ("batch_jobs", [("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+    ("batch_jobs", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ("batch_items", [("job_id", ASCENDING), ("index", ASCENDING)], {"unique": True, "name": "job_index_unique"}),
+    ("batch_items", [("status", ASCENDING), ("_id", ASCENDING)], {"name": "status_id"}),
+    ("batch_items", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ("conversation_tombstones", [("deleted_at", ASCENDING)], {"name": "deleted_at"}),
+    ("conversation_tombstones", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+]
+
+# Representative queries issued by server.py: (collection, filter, sort)
+QUERIES = [
+    ("conversations", {"id": "probe"}, None),
+    ("conversations", {}, [("updated_at", DESCENDING), ("id", DESCENDING)]),
+    ("conversations", {"updated_at": {"$gt": datetime(2000, 1, 1)}}, [("updated_at", ASCENDING), ("id", ASCENDING)]),
+    ("conversations", {"updated_at": {"$lt": datetime(2000, 1, 1)}, "archived": {"$ne": True}}, [("updated_at", ASCENDING)]),
+    ("conversation_summaries", {"conversation_id": "probe"}, [("version", DESCENDING)]),
+    ("batch_items", {"status": "pending"}, [("_id", ASCENDING)]),
+    ("batch_items", {"job_id": "probe", "status": {"$in": ["completed", "failed"]}}, [("index", ASCENDING)]),
+    ("conversation_tombstones", {"deleted_at": {"$gt": datetime(2000, 1, 1)}}, None),
+    ("messages", {"conversation_id": "probe", "seq": {"$lt": 100}}, [("seq", DESCENDING)]),
+    ("status_checks", {}, [("timestamp", DESCENDING)]),
+    ("status_checks", {"client_name": "probe", "timestamp": {"$gte": datetime(2000, 1, 1)}}, [("timestamp", DESCENDING)]),
+]
+
+
+async def ensure_indexes(db, indexes=INDEXES):
+    """Create every declared index, logging how long each build took"""
+    for collection, keys, options in indexes:
+        started = time.perf_counter()
+        try:
+            name = await db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            # e.g. duplicate ids in legacy data; keep serving without the index
+            logger.error(f"Could not create index {options.get('name')} on {collection}: {str(e)}")
+            continue
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.info(f"Index {collection}.{name} ready in {elapsed:.1f}ms")
+
+
+async def ensure_ttl(db, collection: str, field: str, seconds: int):
+    """Expire documents `seconds` after `field`
+
+    The TTL lives on the single-field index on `field`, which also serves
+    time-range queries. An existing index on the field, with or without a
+    TTL, is changed in place with collMod, so changing the retention needs
+    no index rebuild.
+    """
+    keys = [(field, ASCENDING)]
+    try:
+        for name, info in (await db[collection].index_information()).items():
+            if list(info["key"]) != keys:
+                continue
+            if info.get("expireAfterSeconds") != seconds:
+                await db.command({"collMod": collection, "index": {"name": name, "expireAfterSeconds": seconds}})
+                logger.info(f"Index {collection}.{name} now expires documents after {seconds}s")
+            return
+        name = await db[collection].create_index(keys, expireAfterSeconds=seconds, name=f"{field}_ttl")
+        logger.info(f"Index {collection}.{name} ready, expiring documents after {seconds}s")
+    except OperationFailure as e:
+        logger.error(f"Could not set retention on {collection}.{field}: {str(e)}")
+
+
+def plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explain() plan tree"""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return [stage for stage in stages if stage]
+
+
+async def check_queries(db) -> List[dict]:
+    """Explain each known query and return the ones that still scan a collection"""
+    scans = []
+    for collection, query, sort in QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = plan_stages(explanation["queryPlanner"]["winningPlan"])
+        if "COLLSCAN" in stages:
+            scans.append({"collection": collection, "filter": query, "sort": sort, "stages": stages})
+    return scans
+
+
+async def main():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from settings import get_settings
+
+    parser = argparse.ArgumentParser(description="Create or check the chat database indexes")
+    parser.add_argument("--check", action="store_true", help="report queries that would still scan a collection")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    client = AsyncIOMotorClient(settings.mongo_url)
+    db = client[settings.db_name]
+    try:
+        if not args.check:
+            await ensure_indexes(db)
+            await ensure_ttl(db, "status_checks", "timestamp", settings.status_retention)
+            return
+
+        scans = await check_queries(db)
+        for scan in scans:
+            logger.warning(f"COLLSCAN on {scan['collection']} filter={scan['filter']} sort={scan['sort']}: {' <- '.join(scan['stages'])}")
+        if not scans:
+            logger.info(f"All {len(QUERIES)} queries use an index")
+        raise SystemExit(1 if scans else 0)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
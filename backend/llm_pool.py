@@ -0,0 +1,287 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from admission import AdmissionController, Ticket, current_client
+from context import estimate_tokens
+from resilience import CircuitBreaker, CircuitOpen, ResiliencePolicy, backoff_delay, hedged, is_retryable
+
+
+if TYPE_CHECKING:
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def load_integration():
+    """Import the LLM integration on first use; it pulls in the provider SDKs, which is slow"""
+    from emergentintegrations.llm import chat
+    return chat
+
+
+class LlmClientPool:
+    """Reusable LlmChat clients behind admission control.
+
+    Clients are cheap to build; what is costly is connection setup, and every
+    client shares one keep-alive HTTP pool (see `start`). A client also
+    holds its session's history, so callers that keep the history in the
+    integration get their client with cache=True: it is keyed by (provider,
+    model, system message, session id) and kept in an LRU, so follow-up
+    turns of a conversation reuse it. Callers that assemble each prompt
+    themselves use cache=False and leave nothing behind. Every call
+    made through `send` or inside `slot` is admitted by `admission`, which
+    caps concurrency globally and per client and enforces rate limits.
+
+    Calls through `send` and `stream` follow `policy`: each attempt has a
+    deadline, transient errors are retried with jittered backoff, a slow
+    attempt can be hedged with a second one, and each model has a circuit
+    breaker. When the primary model's breaker is open or its attempts are
+    exhausted, the call moves to the fallback model. Hedges and fallbacks
+    use fresh clients and send only the prompt, without the client's own
+    history.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        provider: str = "gemini",
+        model: str = "gemini-2.0-flash",
+        max_clients: int = 1024,
+        max_concurrency: int = 32,
+        max_connections: int = 100,
+        keepalive_expiry: float = 60.0,
+        admission: Optional[AdmissionController] = None,
+        policy: Optional[ResiliencePolicy] = None,
+    ):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+        self.max_clients = max_clients
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._clients: "OrderedDict[tuple, LlmChat]" = OrderedDict()
+        self.admission = admission or AdmissionController(max_concurrency=max_concurrency)
+        self.policy = policy or ResiliencePolicy()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._http_client = None
+
+        # Metrics
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def start(self):
+        """Share one keep-alive HTTP connection pool across all provider calls"""
+        self.admission.start()
+        try:
+            import httpx
+            import litellm
+        except ImportError:
+            logger.info("litellm not available, LLM calls use the integration's own HTTP client")
+            return
+
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        )
+        litellm.aclient_session = self._http_client
+
+    async def aclose(self):
+        """Close the shared HTTP pool and drop cached clients"""
+        self._clients.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def get(
+        self,
+        session_id: str,
+        system_message: str,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        cache: bool = True,
+    ) -> "LlmChat":
+        """Return the client bound to `session_id`, building it on first use
+
+        With cache=False a new client is always built and not kept, so it
+        shares no state with the cached client of the same session.
+        """
+        provider = provider or self.provider
+        model = model or self.model
+        if not cache:
+            return self._build(session_id, system_message, provider, model)
+
+        key = (provider, model, system_message, session_id)
+        chat = self._clients.get(key)
+        if chat is not None:
+            self._clients.move_to_end(key)
+            self.reused += 1
+            return chat
+
+        chat = self._clients[key] = self._build(session_id, system_message, provider, model)
+        if len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)
+            self.evicted += 1
+        return chat
+
+    def _build(self, session_id: str, system_message: str, provider: str, model: str) -> "LlmChat":
+        chat = load_integration().LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(provider, model)
+        self.created += 1
+        return chat
+
+    def message(self, text: str) -> "UserMessage":
+        return load_integration().UserMessage(text=text)
+
+    async def admit(self, prompt: str = "") -> Ticket:
+        """Wait for admission of a call for the current client, charging the prompt's tokens"""
+        return await self.admission.acquire(current_client.get(), tokens=estimate_tokens(prompt))
+
+    @asynccontextmanager
+    async def slot(self, prompt: str = "", ticket: Optional[Ticket] = None):
+        """Hold an admitted call slot, e.g. for the length of a stream
+
+        Pass a ticket from `admit` to use a slot acquired earlier, such as
+        before a streaming response was started.
+        """
+        if ticket is None:
+            ticket = await self.admit(prompt)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = CircuitBreaker(self.policy.breaker_threshold, self.policy.breaker_reset)
+        return breaker
+
+    def _fresh_client(self, chat: "LlmChat", model: str) -> "LlmChat":
+        """Uncached client for the same session and system message, e.g. for a hedge or fallback"""
+        return self._build(chat.session_id, chat.system_message, self.provider, model)
+
+    async def _attempts(self, chat: "LlmChat", model: str, call: Callable[[Any], Awaitable[Any]]):
+        """Call one model with deadlines, retries and hedging, feeding its breaker"""
+        policy = self.policy
+        breaker = self.breaker(model)
+
+        def hedge_client():
+            self.hedges += 1
+            return self._fresh_client(chat, model)
+
+        for attempt in range(policy.max_attempts):
+            if not breaker.allow():
+                raise CircuitOpen(model, breaker.retry_after())
+            try:
+                result, hedge_won = await hedged(call, chat, hedge_client, policy.timeout, policy.hedge_after)
+            except Exception as e:
+                # Only provider-side trouble counts; a rejected prompt says nothing about its health
+                if is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                if not is_retryable(e) or attempt + 1 == policy.max_attempts:
+                    raise
+                self.retries += 1
+                logger.warning(f"LLM call to {model} failed ({type(e).__name__}: {str(e)}), retrying")
+                await asyncio.sleep(backoff_delay(attempt, policy.backoff_base, policy.backoff_max))
+                continue
+            except BaseException:
+                # Cancelled, e.g. the client went away; a half-open probe must not stay claimed
+                breaker.release()
+                raise
+            breaker.record_success()
+            if hedge_won:
+                self.hedge_wins += 1
+            return result
+
+    async def _call(self, chat: "LlmChat", call: Callable[[Any], Awaitable[Any]]):
+        """Run `call` on the primary model, falling back to the cheaper one if it fails"""
+        try:
+            return await self._attempts(chat, self.model, call)
+        except Exception as e:
+            fallback = self.policy.fallback_model
+            if not fallback or fallback == self.model:
+                raise
+            if not isinstance(e, CircuitOpen) and not is_retryable(e):
+                raise
+            self.fallbacks += 1
+            logger.warning(f"Falling back to {fallback} after {type(e).__name__}: {str(e)}")
+            return await self._attempts(self._fresh_client(chat, fallback), fallback, call)
+
+    async def send(self, chat: "LlmChat", message: "UserMessage") -> str:
+        """Send one message through a pooled client"""
+        async with self.slot(message.text) as ticket:
+            response = await self._call(chat, lambda client: client.send_message(message))
+            ticket.consume_tokens(estimate_tokens(response))
+            return response
+
+    async def stream(self, chat: "LlmChat", message: "UserMessage") -> AsyncIterator[str]:
+        """Yield response deltas; call inside `slot`
+
+        Retries, hedging and fallback apply until the first delta arrives.
+        After that each further delta must arrive within the policy timeout,
+        and a failure ends the stream since part of the answer has been sent.
+        Clients without a streaming API yield the whole reply as one delta.
+        """
+        if getattr(chat, "stream_message", None) is None:
+            yield await self._call(chat, lambda client: client.send_message(message))
+            return
+
+        async def open_stream(client):
+            deltas = client.stream_message(message).__aiter__()
+            try:
+                first = await deltas.__anext__()
+            except StopAsyncIteration:
+                first = ""
+            return first, deltas
+
+        first, deltas = await self._call(chat, open_stream)
+        yield first
+        while True:
+            try:
+                delta = await asyncio.wait_for(deltas.__anext__(), self.policy.timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            yield delta
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._clients),
+            "max_clients": self.max_clients,
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted,
+            "in_flight": self.admission.in_flight,
+            "waiting": self.admission.waiting,
+            "max_concurrency": self.admission.max_concurrency,
+            "shared_http_pool": self._http_client is not None,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "breakers_open": sum(breaker.state == "open" for breaker in self._breakers.values()),
+        }
@@ -0,0 +1,460 @@
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+
+# Length of the last-message preview returned with conversation summaries
+PREVIEW_LENGTH = 100
+# Largest count $slice accepts, for "everything from here on"
+MAX_SLICE = 2 ** 31 - 1
+# Fields marking a conversation whose messages were moved to the archive
+STUB_FIELDS = ("archived", "archived_at")
+
+
+class MessageStore:
+    """Storage engine for conversations and their messages.
+
+    Every message has a sequence number (`seq`), its 0-based position in the
+    conversation, which windowed reads use as a cursor.
+
+    An archived conversation is a stub: its document stays in place with
+    `archived` set, `message_count` and `last_message` for the sidebar, and
+    no messages. Appends to a stub fail as if it did not exist, so callers
+    restore it first.
+    """
+
+    name = ""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def touch(self, conversation_id: str) -> bool:
+        """Mark a conversation as active; returns False if it does not exist"""
+        conversation = await self.db.conversations.find_one_and_update(
+            {"id": conversation_id},
+            {"$set": {"updated_at": datetime.utcnow()}},
+            projection={"_id": 1}
+        )
+        return conversation is not None
+
+    async def create_conversation(self, conversation: dict):
+        """Insert a new conversation document including its messages"""
+        raise NotImplementedError
+
+    async def create_conversations(self, conversations: List[dict]) -> List[str]:
+        """Bulk-insert conversations with unordered writes; returns the ids that were inserted
+
+        Documents that fail, e.g. on a duplicate id, are skipped without
+        stopping the rest of the batch.
+        """
+        raise NotImplementedError
+
+    async def append_messages(self, conversation_id: str, messages: List[dict]) -> bool:
+        """Append messages to a conversation; returns False if it does not exist"""
+        raise NotImplementedError
+
+    async def get_conversation(
+        self,
+        conversation_id: str,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Optional[dict]:
+        """Load a conversation with the window of messages ending just before `before`
+
+        The result carries `message_count` and `first_seq`, the sequence
+        number of the first returned message, to use as the next `before`.
+        With `after`, the window instead holds the first `limit` messages
+        (all of them without a limit) whose seq is greater than `after`.
+        """
+        raise NotImplementedError
+
+    async def get_recent_messages(self, conversation_ids: List[str], limit: int) -> List[dict]:
+        """{id, messages} of several conversations at once, each with only its last `limit` messages
+
+        Archive stubs come back with their STUB_FIELDS and no messages.
+        """
+        raise NotImplementedError
+
+    async def list_summaries(self, query: dict, sort: list, limit: int) -> List[dict]:
+        """Conversation documents without messages, plus message_count and last_message"""
+        raise NotImplementedError
+
+    async def list_conversations(self, query: dict, sort: list, limit: int) -> List[dict]:
+        """Conversation documents with all of their messages"""
+        raise NotImplementedError
+
+    def iter_conversations(self, batch_size: int = 100) -> AsyncIterator[dict]:
+        """Yield every conversation with all of its messages, ordered by id
+
+        Documents are read through a cursor `batch_size` at a time, so only
+        one batch is held in memory however many conversations exist.
+        """
+        raise NotImplementedError
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        """Delete a conversation and its messages; returns False if it does not exist"""
+        raise NotImplementedError
+
+    async def stub_conversation(self, conversation_id: str, updated_at: datetime, stub: dict) -> bool:
+        """Drop a conversation's messages, leaving the `stub` fields set
+
+        Only applies if the conversation was not updated after `updated_at`,
+        so a turn stored after the archive copy was read is never lost.
+        """
+        raise NotImplementedError
+
+    async def restore_conversation(self, conversation: dict) -> bool:
+        """Put an archived conversation's messages back and clear the stub; False if it is not a stub"""
+        raise NotImplementedError
+
+
+async def insert_unordered(collection, documents: List[dict]) -> int:
+    """insert_many that keeps going past failed documents; returns the inserted count"""
+    try:
+        result = await collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        return e.details.get("nInserted", 0)
+
+
+async def insert_unordered_indexes(collection, documents: List[dict]) -> List[int]:
+    """Like insert_unordered, but returns the positions of the documents that were inserted"""
+    try:
+        await collection.insert_many(documents, ordered=False)
+        return list(range(len(documents)))
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        return [index for index in range(len(documents)) if index not in failed]
+
+
+class EmbeddedMessageStore(MessageStore):
+    """Messages kept as an array inside the conversation document"""
+
+    name = "embedded"
+
+    async def create_conversation(self, conversation: dict):
+        await self.db.conversations.insert_one(conversation)
+
+    async def create_conversations(self, conversations):
+        if not conversations:
+            return []
+        inserted = await insert_unordered_indexes(self.db.conversations, conversations)
+        return [conversations[index]["id"] for index in inserted]
+
+    async def append_messages(self, conversation_id: str, messages: List[dict]) -> bool:
+        result = await self.db.conversations.update_one(
+            {"id": conversation_id, "archived": {"$ne": True}},
+            {
+                "$push": {"messages": {"$each": messages}},
+                "$set": {"updated_at": datetime.utcnow()}
+            }
+        )
+        return result.matched_count > 0
+
+    async def get_conversation(self, conversation_id, before=None, limit=None, after=None):
+        messages = {"$ifNull": ["$messages", []]}
+        if after is not None:
+            # Past the end of the array $slice returns an empty window
+            window = {"$slice": [messages, after + 1, limit or MAX_SLICE]}
+        elif before is None:
+            window = {"$slice": [messages, -limit]} if limit else messages
+        elif before > 0:
+            # The last `limit` of the first `before` messages, which past the
+            # end of the array are simply the last `limit`
+            window = {"$slice": [messages, before]}
+            if limit:
+                window = {"$slice": [window, -limit]}
+        else:
+            window = {"$literal": []}
+
+        # Slice server-side so only the requested window leaves Mongo
+        conversations = await self.db.conversations.aggregate([
+            {"$match": {"id": conversation_id}},
+            {"$addFields": {"message_count": {"$size": messages}, "messages": window}},
+            {"$project": {"_id": 0}}
+        ]).to_list(1)
+        if not conversations:
+            return None
+
+        conversation = conversations[0]
+        count = conversation["message_count"]
+        if after is not None:
+            conversation["first_seq"] = min(after + 1, count)
+        else:
+            end = count if before is None else min(before, count)
+            conversation["first_seq"] = end - len(conversation["messages"])
+        return conversation
+
+    async def get_recent_messages(self, conversation_ids, limit):
+        conversations = await self.db.conversations.find(
+            {"id": {"$in": conversation_ids}},
+            {"_id": 0, "id": 1, **{field: 1 for field in STUB_FIELDS}, "messages": {"$slice": -limit}}
+        ).to_list(None)
+        for conversation in conversations:
+            conversation.setdefault("messages", [])
+        return conversations
+
+    async def list_summaries(self, query, sort, limit):
+        conversations = await self.db.conversations.aggregate([
+            {"$match": query},
+            {"$sort": dict(sort)},
+            {"$limit": limit},
+            {"$project": {
+                "_id": 0,
+                "id": 1,
+                "title": 1,
+                "created_at": 1,
+                "updated_at": 1,
+                # Archive stubs keep the counts their messages had
+                "message_count": {"$ifNull": ["$message_count", {"$size": {"$ifNull": ["$messages", []]}}]},
+                "last_message": {"$ifNull": ["$last_message", {"$arrayElemAt": ["$messages.content", -1]}]}
+            }}
+        ]).to_list(limit)
+
+        for conv in conversations:
+            if conv.get("last_message"):
+                conv["last_message"] = conv["last_message"][:PREVIEW_LENGTH]
+        return conversations
+
+    async def list_conversations(self, query, sort, limit):
+        return await self.db.conversations.find(query, {"_id": 0}).sort(sort).limit(limit).to_list(limit)
+
+    async def iter_conversations(self, batch_size=100):
+        cursor = self.db.conversations.find({}, {"_id": 0}, batch_size=batch_size).sort("id", ASCENDING)
+        async for conversation in cursor:
+            conversation.setdefault("messages", [])
+            yield conversation
+
+    async def delete_conversation(self, conversation_id):
+        result = await self.db.conversations.delete_one({"id": conversation_id})
+        return result.deleted_count > 0
+
+    async def stub_conversation(self, conversation_id, updated_at, stub):
+        result = await self.db.conversations.update_one(
+            {"id": conversation_id, "updated_at": updated_at, "archived": {"$ne": True}},
+            {"$set": stub, "$unset": {"messages": "", "summary": ""}}
+        )
+        return result.matched_count > 0
+
+    async def restore_conversation(self, conversation):
+        restored = {"messages": conversation.get("messages", [])}
+        if conversation.get("summary"):
+            restored["summary"] = conversation["summary"]
+        result = await self.db.conversations.update_one(
+            {"id": conversation["id"], "archived": True},
+            {
+                "$set": restored,
+                "$unset": {field: "" for field in STUB_FIELDS + ("message_count", "last_message")}
+            }
+        )
+        return result.matched_count > 0
+
+
+class CollectionMessageStore(MessageStore):
+    """Messages kept in their own collection, keyed by (conversation_id, seq).
+
+    The conversation document holds `message_count`, which doubles as the
+    sequence allocator, and a `last_message` preview for the sidebar.
+    """
+
+    name = "collection"
+
+    async def create_conversation(self, conversation: dict):
+        conversation = dict(conversation)
+        messages = conversation.pop("messages", [])
+        conversation["message_count"] = len(messages)
+        if messages:
+            conversation["last_message"] = messages[-1]["content"][:PREVIEW_LENGTH]
+        await self.db.conversations.insert_one(conversation)
+        if messages:
+            await self.db.messages.insert_many([
+                {**message, "conversation_id": conversation["id"], "seq": seq}
+                for seq, message in enumerate(messages)
+            ])
+
+    async def create_conversations(self, conversations):
+        if not conversations:
+            return []
+        documents = []
+        conversation_messages = []
+        for conversation in conversations:
+            conversation = dict(conversation)
+            messages = conversation.pop("messages", [])
+            conversation["message_count"] = len(messages)
+            if messages:
+                conversation["last_message"] = messages[-1]["content"][:PREVIEW_LENGTH]
+            documents.append(conversation)
+            conversation_messages.append(messages)
+
+        # Messages only for conversations that were actually created; a
+        # duplicate id must not gain messages its message_count does not know of
+        inserted = await insert_unordered_indexes(self.db.conversations, documents)
+        messages = [
+            {**message, "conversation_id": documents[index]["id"], "seq": seq}
+            for index in inserted
+            for seq, message in enumerate(conversation_messages[index])
+        ]
+        if messages:
+            await insert_unordered(self.db.messages, messages)
+        return [documents[index]["id"] for index in inserted]
+
+    async def append_messages(self, conversation_id, messages):
+        # Reserve a block of sequence numbers atomically, then write the whole
+        # block in one insert so related messages (a user turn and its reply)
+        # become visible together
+        conversation = await self.db.conversations.find_one_and_update(
+            {"id": conversation_id, "archived": {"$ne": True}},
+            {
+                "$inc": {"message_count": len(messages)},
+                "$set": {
+                    "updated_at": datetime.utcnow(),
+                    "last_message": messages[-1]["content"][:PREVIEW_LENGTH]
+                }
+            },
+            projection={"_id": 0, "message_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if not conversation:
+            return False
+
+        first_seq = conversation["message_count"] - len(messages)
+        await self.db.messages.insert_many([
+            {**message, "conversation_id": conversation_id, "seq": first_seq + i}
+            for i, message in enumerate(messages)
+        ])
+        return True
+
+    async def get_conversation(self, conversation_id, before=None, limit=None, after=None):
+        conversation = await self.db.conversations.find_one({"id": conversation_id}, {"_id": 0})
+        if not conversation:
+            return None
+
+        query = {"conversation_id": conversation_id}
+        if after is not None:
+            query["seq"] = {"$gt": after}
+        elif before is not None:
+            query["seq"] = {"$lt": before}
+        cursor = self.db.messages.find(query, {"_id": 0, "conversation_id": 0})
+        if after is not None:
+            cursor = cursor.sort("seq", ASCENDING)
+            messages = await (cursor.limit(limit).to_list(limit) if limit else cursor.to_list(None))
+        elif limit is None:
+            messages = await cursor.sort("seq", ASCENDING).to_list(None)
+        else:
+            messages = await cursor.sort("seq", -1).limit(limit).to_list(limit)
+            messages.reverse()
+
+        count = conversation.setdefault("message_count", 0)
+        conversation["messages"] = messages
+        if messages:
+            conversation["first_seq"] = messages[0]["seq"]
+        elif after is not None:
+            conversation["first_seq"] = min(after + 1, count)
+        else:
+            conversation["first_seq"] = count if before is None else max(0, min(before, count))
+        return conversation
+
+    async def get_recent_messages(self, conversation_ids, limit):
+        conversations = await self.db.conversations.find(
+            {"id": {"$in": conversation_ids}},
+            {"_id": 0, "id": 1, "message_count": 1, **{field: 1 for field in STUB_FIELDS}}
+        ).to_list(None)
+        by_id = {conversation["id"]: conversation for conversation in conversations}
+        windows = []
+        for conversation in conversations:
+            count = conversation.pop("message_count", 0)
+            conversation["messages"] = []
+            if count and not conversation.get("archived"):
+                windows.append({"conversation_id": conversation["id"], "seq": {"$gte": count - limit}})
+
+        if windows:
+            messages = self.db.messages.find(
+                {"$or": windows}, {"_id": 0}
+            ).sort([("conversation_id", ASCENDING), ("seq", ASCENDING)])
+            async for message in messages:
+                by_id[message.pop("conversation_id")]["messages"].append(message)
+        return conversations
+
+    async def list_summaries(self, query, sort, limit):
+        conversations = await self.db.conversations.find(
+            query,
+            {"_id": 0, "id": 1, "title": 1, "created_at": 1, "updated_at": 1, "message_count": 1, "last_message": 1}
+        ).sort(sort).limit(limit).to_list(limit)
+        for conv in conversations:
+            conv.setdefault("message_count", 0)
+        return conversations
+
+    async def list_conversations(self, query, sort, limit):
+        conversations = await self.db.conversations.find(query, {"_id": 0}).sort(sort).limit(limit).to_list(limit)
+        by_id = {conv["id"]: conv for conv in conversations}
+        for conv in conversations:
+            conv["messages"] = []
+
+        if by_id:
+            messages = self.db.messages.find(
+                {"conversation_id": {"$in": list(by_id)}}, {"_id": 0}
+            ).sort([("conversation_id", ASCENDING), ("seq", ASCENDING)])
+            async for message in messages:
+                by_id[message.pop("conversation_id")]["messages"].append(message)
+        return conversations
+
+    async def iter_conversations(self, batch_size=100):
+        cursor = self.db.conversations.find(
+            {}, {"_id": 0, "message_count": 0, "last_message": 0}, batch_size=batch_size
+        ).sort("id", ASCENDING)
+        async for conversation in cursor:
+            messages = self.db.messages.find(
+                {"conversation_id": conversation["id"]},
+                {"_id": 0, "conversation_id": 0, "seq": 0},
+                batch_size=batch_size
+            ).sort("seq", ASCENDING)
+            conversation["messages"] = [message async for message in messages]
+            yield conversation
+
+    async def delete_conversation(self, conversation_id):
+        result = await self.db.conversations.delete_one({"id": conversation_id})
+        if result.deleted_count == 0:
+            return False
+        await self.db.messages.delete_many({"conversation_id": conversation_id})
+        return True
+
+    async def stub_conversation(self, conversation_id, updated_at, stub):
+        result = await self.db.conversations.update_one(
+            {"id": conversation_id, "updated_at": updated_at, "archived": {"$ne": True}},
+            {"$set": stub, "$unset": {"summary": ""}}
+        )
+        if result.matched_count == 0:
+            return False
+        await self.db.messages.delete_many({"conversation_id": conversation_id})
+        return True
+
+    async def restore_conversation(self, conversation):
+        messages = conversation.get("messages", [])
+        if messages:
+            # Duplicates from an earlier, interrupted restore are skipped
+            await insert_unordered(self.db.messages, [
+                {**message, "conversation_id": conversation["id"], "seq": seq}
+                for seq, message in enumerate(messages)
+            ])
+        update = {"$unset": {field: "" for field in STUB_FIELDS}}
+        if conversation.get("summary"):
+            update["$set"] = {"summary": conversation["summary"]}
+        result = await self.db.conversations.update_one({"id": conversation["id"], "archived": True}, update)
+        return result.matched_count > 0
+
+
+MESSAGE_STORES = {
+    EmbeddedMessageStore.name: EmbeddedMessageStore,
+    CollectionMessageStore.name: CollectionMessageStore,
+}
+
+
+def create_message_store(name: str, db) -> MessageStore:
+    """Build the storage engine selected by name"""
+    try:
+        return MESSAGE_STORES[name](db)
+    except KeyError:
+        raise ValueError(f"Unknown message store '{name}', expected one of {sorted(MESSAGE_STORES)}")
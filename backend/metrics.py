@@ -0,0 +1,241 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (stage, seconds) spans recorded for the request being handled
+request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # bucket counts, then sum
+                series = self._series[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = self.header()
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {values[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format.
+
+    Collectors are callables returning {name: value} snapshots from components
+    that keep their own counters (queues, pools, caches). Each value is
+    exported as a gauge.
+    """
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Tuple[str, Callable[[], dict]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, prefix: str, collect: Callable[[], dict]):
+        self.collectors.append((prefix, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for prefix, collect in self.collectors:
+            for name, value in collect().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests handled", ("method", "route", "status")
+))
+HTTP_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "Time until the response started", ("method", "route")
+))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being handled"
+))
+STAGE_DURATION = registry.register(Histogram(
+    "chat_stage_duration_seconds", "Time spent in each stage of a request", ("stage",)
+))
+MONGO_DURATION = registry.register(Histogram(
+    "mongo_operation_duration_seconds", "MongoDB command latency", ("command", "outcome")
+))
+LLM_TOKENS = registry.register(Counter(
+    "llm_tokens_total", "Estimated tokens sent to and received from the LLM", ("direction",)
+))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage into the stage histogram and the current request's Server-Timing"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    entries = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class TimingMiddleware:
+    """ASGI middleware recording request metrics and adding a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings: List[Tuple[str, float]] = []
+        token = request_timings.set(timings)
+        status = {"code": 500}
+
+        def route_name():
+            endpoint = scope.get("endpoint")
+            return getattr(endpoint, "__name__", "unmatched")
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                status["code"] = message["status"]
+                HTTP_DURATION.observe(elapsed, method=scope["method"], route=route_name())
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, elapsed).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUESTS.inc(method=scope["method"], route=route_name(), status=status["code"])
+            request_timings.reset(token)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo listener feeding every command's latency into the Mongo histogram"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_DURATION.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        MONGO_DURATION.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Migrate conversations from embedded message arrays to the messages collection.
+
+Each conversation that still has a `messages` array gets its messages copied
+into the `messages` collection under (conversation_id, seq). Then the array is
+replaced by `message_count` and `last_message` on the conversation document.
+The migration is idempotent: messages already copied are skipped, so an
+interrupted run can simply be started again.
+
+Usage:
+    python migrate_messages.py [--batch-size 100] [--dry-run] [--reverse]
+
+Set MESSAGE_STORE=collection for the server once the migration has finished.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+
+from indexes import ensure_indexes
+from message_store import PREVIEW_LENGTH
+from settings import get_settings
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("migrate_messages")
+
+
+async def migrate_conversation(db, conversation: dict, dry_run: bool = False) -> int:
+    """Move one conversation's messages into the messages collection"""
+    conversation_id = conversation["id"]
+    messages = conversation.get("messages") or []
+    if dry_run:
+        return len(messages)
+
+    if messages:
+        try:
+            await db.messages.insert_many(
+                [
+                    {**message, "conversation_id": conversation_id, "seq": seq}
+                    for seq, message in enumerate(messages)
+                ],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            # Duplicate keys come from a previous, interrupted run
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    update = {"$set": {"message_count": len(messages)}, "$unset": {"messages": ""}}
+    if messages:
+        update["$set"]["last_message"] = messages[-1]["content"][:PREVIEW_LENGTH]
+    # Only drop the array if no message was appended while we were copying
+    await db.conversations.update_one(
+        {"id": conversation_id, "messages": {"$size": len(messages)}}, update
+    )
+    return len(messages)
+
+
+async def migrate(db, batch_size: int = 100, dry_run: bool = False):
+    await ensure_indexes(db)
+
+    conversations = 0
+    messages = 0
+    cursor = db.conversations.find({"messages": {"$exists": True}}, batch_size=batch_size)
+    async for conversation in cursor:
+        messages += await migrate_conversation(db, conversation, dry_run=dry_run)
+        conversations += 1
+        if conversations % batch_size == 0:
+            logger.info(f"Migrated {conversations} conversations ({messages} messages)")
+
+    action = "Would migrate" if dry_run else "Migrated"
+    logger.info(f"{action} {conversations} conversations ({messages} messages)")
+
+
+async def restore(db, batch_size: int = 100, dry_run: bool = False):
+    """Move messages back into embedded arrays, undoing `migrate`"""
+    conversations = 0
+    cursor = db.conversations.find({"messages": {"$exists": False}}, batch_size=batch_size)
+    async for conversation in cursor:
+        conversation_id = conversation["id"]
+        messages = await db.messages.find(
+            {"conversation_id": conversation_id}, {"_id": 0, "conversation_id": 0, "seq": 0}
+        ).sort("seq", 1).to_list(None)
+        conversations += 1
+        if dry_run:
+            continue
+        await db.conversations.update_one(
+            {"id": conversation_id},
+            {"$set": {"messages": messages}, "$unset": {"message_count": "", "last_message": ""}}
+        )
+        await db.messages.delete_many({"conversation_id": conversation_id})
+
+    action = "Would restore" if dry_run else "Restored"
+    logger.info(f"{action} {conversations} conversations")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move embedded conversation messages into the messages collection")
+    parser.add_argument("--batch-size", type=int, default=100, help="conversations fetched per cursor batch")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be migrated without writing")
+    parser.add_argument("--reverse", action="store_true", help="move messages back into embedded arrays")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = AsyncIOMotorClient(settings.mongo_url)
+    db = client[settings.db_name]
+    try:
+        run = restore if args.reverse else migrate
+        asyncio.run(run(db, batch_size=args.batch_size, dry_run=args.dry_run))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
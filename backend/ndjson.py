@@ -0,0 +1,62 @@
+import zlib
+from typing import AsyncIterator
+
+from fast_json import dumps
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Bytes gathered before a chunk is handed to the response
+FLUSH_SIZE = 64 * 1024
+
+
+async def encode(documents: AsyncIterator[dict], compress: bool = False) -> AsyncIterator[bytes]:
+    """Encode documents as newline-delimited JSON, optionally gzip-compressed
+
+    Output is produced in chunks of about FLUSH_SIZE bytes, so memory use
+    does not depend on how many documents the iterator yields.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    async for document in documents:
+        line = dumps(document) + b"\n"
+        buffer += compressor.compress(line) if compressor else line
+        if len(buffer) >= FLUSH_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if compressor:
+        buffer += compressor.flush()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into non-empty lines, decompressing it if it is gzip"""
+    decompressor = None
+    pending = b""
+    head = b""
+    first = True
+    async for chunk in chunks:
+        if first:
+            # Wait for enough bytes to tell gzip from plain text
+            head += chunk
+            if len(head) < len(GZIP_MAGIC):
+                continue
+            chunk, head, first = head, b"", False
+            if chunk.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(wbits=31)
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            if line.strip():
+                yield line
+    if decompressor:
+        pending += decompressor.flush()
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            if line.strip():
+                yield line
+    pending += head
+    if pending.strip():
+        yield pending
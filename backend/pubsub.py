@@ -0,0 +1,211 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from pymongo.errors import PyMongoError
+
+
+logger = logging.getLogger(__name__)
+
+# Topic carrying every conversation's events, for conversation lists
+LIST_TOPIC = "conversations"
+
+
+def conversation_topic(conversation_id: str) -> str:
+    return f"conversation:{conversation_id}"
+
+
+def conversation_updated(conversation_id: str, updated_at=None, title: Optional[str] = None) -> dict:
+    return {"type": "conversation.updated", "conversation_id": conversation_id, "updated_at": updated_at, "title": title}
+
+
+def conversation_deleted(conversation_id: str) -> dict:
+    return {"type": "conversation.deleted", "conversation_id": conversation_id}
+
+
+class Subscription:
+    """Events for a set of topics, buffered up to `maxsize`
+
+    A subscriber that falls behind does not hold up publishers: events that
+    do not fit are dropped and `lagged` is set, telling the consumer to
+    reload what it shows instead.
+    """
+
+    def __init__(self, pubsub: "PubSub", maxsize: int = 256):
+        self.pubsub = pubsub
+        self.topics: Set[str] = set()
+        self.lagged = False
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def subscribe(self, *topics: str):
+        for topic in topics:
+            self.topics.add(topic)
+            self.pubsub._subscribers.setdefault(topic, set()).add(self)
+
+    def unsubscribe(self, *topics: str):
+        for topic in topics:
+            self.topics.discard(topic)
+            subscribers = self.pubsub._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(self)
+                if not subscribers:
+                    del self.pubsub._subscribers[topic]
+
+    def close(self):
+        self.unsubscribe(*list(self.topics))
+
+    def deliver(self, event: dict):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+            self.dropped += 1
+            self.pubsub.dropped += 1
+
+    async def get(self) -> dict:
+        return await self._queue.get()
+
+    def clear(self):
+        """Forget buffered events, e.g. after telling the consumer to resync"""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self.lagged = False
+
+
+class PubSub:
+    """Fan-out of conversation events to the connections of this process.
+
+    Publishers call notify() after a write; every subscription to one of the
+    event's topics gets a copy. Delivery never blocks the publisher.
+    """
+
+    name = ""
+    # Whether events published by other workers reach this process
+    shared = False
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscription(self, maxsize: int = 256) -> Subscription:
+        return Subscription(self, maxsize)
+
+    def notify(self, event: dict):
+        """Announce a change to a conversation"""
+        raise NotImplementedError
+
+    def _fan_out(self, event: dict):
+        self.published += 1
+        receivers = set()
+        for topic in (LIST_TOPIC, conversation_topic(event["conversation_id"])):
+            receivers |= self._subscribers.get(topic, set())
+        for subscription in receivers:
+            subscription.deliver(event)
+        self.delivered += len(receivers)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "shared": self.shared,
+            "topics": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+class LocalPubSub(PubSub):
+    """Events published by this process only; enough for a single worker"""
+
+    name = "local"
+
+    def notify(self, event):
+        self._fan_out(event)
+
+
+class ChangeStreamPubSub(PubSub):
+    """Events read from a MongoDB change stream, so writes by any worker reach every connection
+
+    notify() is a no-op: the write itself shows up on the stream. Change
+    streams need a replica set or sharded cluster; on a standalone server
+    the watcher logs an error and no events are delivered.
+    """
+
+    name = "mongo"
+    shared = True
+
+    # Only changes a client would show: new or replaced conversations,
+    # updates that moved updated_at, and deletion tombstones
+    PIPELINE = [
+        {"$match": {"$or": [
+            {"ns.coll": "conversations", "operationType": {"$in": ["insert", "replace"]}},
+            {"ns.coll": "conversations", "updateDescription.updatedFields.updated_at": {"$exists": True}},
+            {"ns.coll": "conversation_tombstones", "operationType": {"$in": ["insert", "update", "replace"]}},
+        ]}},
+        {"$project": {"ns": 1, "fullDocument.id": 1, "fullDocument.title": 1, "fullDocument.updated_at": 1}},
+    ]
+
+    def __init__(self, db, retry_delay: float = 5):
+        super().__init__()
+        self.db = db
+        self.retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self, event):
+        pass
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch(), name="change-stream")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self):
+        resume_after = None
+        while True:
+            try:
+                async with self.db.watch(self.PIPELINE, full_document="updateLookup", resume_after=resume_after) as stream:
+                    async for change in stream:
+                        resume_after = stream.resume_token
+                        event = self._event(change)
+                        if event is not None:
+                            self._fan_out(event)
+            except PyMongoError as e:
+                logger.error(f"Conversation change stream failed, retrying in {self.retry_delay}s: {str(e)}")
+                await asyncio.sleep(self.retry_delay)
+
+    @staticmethod
+    def _event(change: dict) -> Optional[dict]:
+        document = change.get("fullDocument")
+        if not document or "id" not in document:
+            return None
+        if change["ns"]["coll"] == "conversation_tombstones":
+            return conversation_deleted(document["id"])
+        return conversation_updated(document["id"], document.get("updated_at"), document.get("title"))
+
+
+PUBSUB_BACKENDS = {
+    LocalPubSub.name: lambda db: LocalPubSub(),
+    ChangeStreamPubSub.name: lambda db: ChangeStreamPubSub(db),
+}
+
+
+def create_pubsub(name: str, db) -> PubSub:
+    """Build the pub/sub backend selected by name"""
+    try:
+        return PUBSUB_BACKENDS[name](db)
+    except KeyError:
+        raise ValueError(f"Unknown pub/sub backend '{name}', expected one of {sorted(PUBSUB_BACKENDS)}")
@@ -0,0 +1,155 @@
+import asyncio
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+
+# HTTP statuses worth retrying: timeouts, rate limits and server-side failures
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+# Exception class names used by provider SDKs for transient failures
+RETRYABLE_NAMES = ("Timeout", "RateLimit", "ServiceUnavailable", "APIConnection", "InternalServer", "Overloaded")
+
+
+class CircuitOpen(Exception):
+    """The provider is failing and no fallback model is available"""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"LLM provider unavailable for {model}, retry after {math.ceil(retry_after)}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed if simply tried again"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    name = type(error).__name__
+    return any(marker in name for marker in RETRYABLE_NAMES)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class ResiliencePolicy:
+    """Knobs for LLM calls; a hedge_after of 0 disables hedging, no fallback_model disables fallback"""
+
+    def __init__(
+        self,
+        timeout: float = 60.0,
+        max_attempts: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge_after: float = 0.0,
+        fallback_model: Optional[str] = None,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0,
+    ):
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.fallback_model = fallback_model
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+
+
+class CircuitBreaker:
+    """Stops calls to a model after `threshold` consecutive failures.
+
+    After `reset_timeout` the breaker lets a single probe call through
+    (half-open); its outcome closes the breaker or opens it again.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+        # Metrics
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """Whether a call may start now; in half-open state this claims the probe"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    def retry_after(self) -> float:
+        if self.state != "open":
+            return 1.0
+        return max(1.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def release(self):
+        """End a call that says nothing about the provider's health, e.g. a cancelled or rejected one
+
+        Frees the half-open probe so the next call can probe instead.
+        """
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+Call = Callable[[Any], Awaitable[Any]]
+
+
+async def hedged(call: Call, chat: Any, make_hedge: Callable[[], Any], timeout: float, hedge_after: float):
+    """Run `call(chat)` with a deadline, racing a second client if the first is slow
+
+    Returns (result, hedge_won). When the first call has not finished after
+    `hedge_after` seconds, `call(make_hedge())` starts alongside it and the
+    first success wins; the loser is cancelled.
+    """
+    async def attempt(client):
+        return await asyncio.wait_for(call(client), timeout)
+
+    tasks = [asyncio.ensure_future(attempt(chat))]
+    try:
+        if not hedge_after:
+            return await tasks[0], False
+
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return tasks[0].result(), False
+
+        tasks.append(asyncio.ensure_future(attempt(make_hedge())))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is tasks[1]
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
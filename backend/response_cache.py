@@ -0,0 +1,99 @@
+import hashlib
+import json
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+def normalize_prompt(text: str) -> str:
+    """Canonical form used for keying: NFC, trimmed, whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class ResponseCache:
+    """Exact-match cache of model responses for context-free prompts.
+
+    Entries are keyed on a hash of the provider, model, system message and
+    normalized prompt. The first tier is an in-process LRU with a TTL. When a
+    collection is given, entries are also written to Mongo, where a TTL index
+    on `expires_at` removes them, so every worker shares them and they
+    survive restarts.
+    """
+
+    def __init__(self, enabled: bool = False, max_entries: int = 1024, ttl: float = 3600, collection=None):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.collection = collection
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+        # Metrics
+        self.hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(provider: str, model: str, system_message: str, prompt: str) -> str:
+        payload = json.dumps([provider, model, system_message, normalize_prompt(prompt)])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            response, expires = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+            del self._entries[key]
+
+        if self.collection is not None:
+            doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            if doc:
+                remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+                self._remember(key, doc["response"], remaining)
+                self.mongo_hits += 1
+                return doc["response"]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: str):
+        if not response:
+            return
+        self._remember(key, response, self.ttl)
+        self.stores += 1
+        if self.collection is not None:
+            now = datetime.utcnow()
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"response": response, "created_at": now, "expires_at": now + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+
+    def _remember(self, key: str, response: str, ttl: float):
+        self._entries[key] = (response, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.mongo_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "mongo_tier": self.collection is not None,
+            "hits": self.hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.mongo_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,390 @@
+import heapq
+import logging
+import math
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import TEXT
+
+from indexes import ensure_indexes
+
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of a title match against a message match
+TITLE_WEIGHT = 3
+# Characters of message text returned around the first match
+SNIPPET_LENGTH = 160
+# Most recent messages scanned when looking for a snippet
+SNIPPET_SCAN_MESSAGES = 500
+# Upper bound on ranked candidates merged per query in the Mongo backend
+MAX_CANDIDATES = 1000
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its of on or that the this to was were "
+    "what when where which who will with you your".split()
+)
+
+# One text index per collection; the conversations index covers titles and,
+# for the embedded store, the message array. archived_text holds the message
+# text of archived conversations (see Archiver)
+TEXT_INDEXES = [
+    ("conversations", [("title", TEXT), ("messages.content", TEXT)],
+     {"weights": {"title": TITLE_WEIGHT, "messages.content": 1}, "name": "text_search"}),
+    ("messages", [("content", TEXT)], {"name": "text_search"}),
+    ("archived_text", [("content", TEXT)], {"name": "text_search"}),
+]
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords or single characters"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return [token for token in TOKEN_PATTERN.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+
+def make_snippet(text: str, terms: Iterable[str], length: int = SNIPPET_LENGTH) -> Optional[str]:
+    """Window of `text` around the earliest term match, or None if no term occurs"""
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms]
+    positions = [position for position in positions if position >= 0]
+    if not positions:
+        return None
+    first = min(positions)
+    start = max(0, first - length // 4)
+    # Begin on a word boundary
+    space = text.find(" ", start, first)
+    if start > 0 and space >= 0:
+        start = space + 1
+    end = min(len(text), start + length)
+    snippet = " ".join(text[start:end].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+def find_snippet(messages: List[dict], terms: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(message id, snippet) of the newest message mentioning a term"""
+    for message in reversed(messages):
+        snippet = make_snippet(message.get("content", ""), terms)
+        if snippet:
+            return message.get("id"), snippet
+    return None, None
+
+
+class SearchBackend:
+    """Ranked full-text search over conversation titles and messages.
+
+    `search` returns a page of {conversation_id, title, updated_at, score,
+    message_id, snippet} dicts plus the total number of matches. Backends
+    that keep their own index are told about writes through the `index_*`
+    and `remove` hooks; the others ignore them. Archived conversations are
+    read through `archiver`, when given, since their stubs hold no messages.
+    """
+
+    name = ""
+
+    def __init__(self, store, archiver=None):
+        self.store = store
+        self.db = store.db
+        self.archiver = archiver
+        self.queries = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    async def start(self):
+        pass
+
+    def index_conversation(self, conversation: dict):
+        pass
+
+    def index_messages(self, conversation_id: str, messages: List[dict]):
+        pass
+
+    def set_title(self, conversation_id: str, title: str):
+        pass
+
+    def remove(self, conversation_id: str):
+        pass
+
+    async def search(self, query: str, limit: int, offset: int = 0) -> Tuple[int, List[dict]]:
+        started = time.perf_counter()
+        try:
+            return await self._search(query, limit, offset)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+
+    async def _search(self, query: str, limit: int, offset: int) -> Tuple[int, List[dict]]:
+        raise NotImplementedError
+
+    async def add_snippets(self, results: List[dict], terms: List[str]):
+        """Fill in snippets the ranking step could not provide from stored messages"""
+        missing = [result for result in results if not result.get("snippet")]
+        if not missing:
+            return
+        # One query for the whole page rather than one per result
+        conversations = await self.store.get_recent_messages(
+            [result["conversation_id"] for result in missing], SNIPPET_SCAN_MESSAGES
+        )
+        by_id = {conversation["id"]: conversation for conversation in conversations}
+        for result in missing:
+            conversation = by_id.get(result["conversation_id"])
+            if conversation:
+                conversation = await self.load_archived(conversation)
+                messages = conversation["messages"][-SNIPPET_SCAN_MESSAGES:]
+                result["message_id"], result["snippet"] = find_snippet(messages, terms)
+
+    async def load_archived(self, conversation: dict, cache: bool = True) -> dict:
+        """`conversation` with an archived stub's messages read back from the archive"""
+        if not conversation.get("archived") or self.archiver is None:
+            return conversation
+        archived_at = conversation.get("archived_at") if cache else None
+        archived = await self.archiver.load(conversation["id"], archived_at)
+        if archived is None:
+            return conversation
+        return {**conversation, "messages": archived.get("messages", [])}
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "queries": self.queries,
+            "latency_avg": self.latency_total / self.queries if self.queries else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+
+class MongoTextSearch(SearchBackend):
+    """Search through MongoDB text indexes, ranked by textScore"""
+
+    name = "mongo"
+
+    async def start(self):
+        await ensure_indexes(self.db, TEXT_INDEXES)
+
+    async def _search(self, query, limit, offset):
+        text = {"$text": {"$search": query}}
+        score = {"$meta": "textScore"}
+
+        # Titles, and whole message arrays for the embedded store
+        hits: Dict[str, dict] = {}
+        cursor = self.db.conversations.find(
+            text, {"_id": 0, "id": 1, "title": 1, "updated_at": 1, "score": score}
+        ).sort([("score", score)]).limit(MAX_CANDIDATES)
+        async for conversation in cursor:
+            hits[conversation["id"]] = {
+                "conversation_id": conversation["id"],
+                "title": conversation["title"],
+                "updated_at": conversation.get("updated_at"),
+                "score": conversation["score"],
+            }
+
+        if self.store.name == "collection":
+            # Best-scoring message per conversation; scores add up with the title's
+            messages = await self.db.messages.aggregate([
+                {"$match": text},
+                {"$addFields": {"score": score}},
+                {"$sort": {"score": -1}},
+                {"$group": {
+                    "_id": "$conversation_id",
+                    "score": {"$sum": "$score"},
+                    "message_id": {"$first": "$id"},
+                    "content": {"$first": "$content"},
+                }},
+                {"$sort": {"score": -1}},
+                {"$limit": MAX_CANDIDATES},
+            ]).to_list(MAX_CANDIDATES)
+            for message in messages:
+                hit = hits.setdefault(message["_id"], {"conversation_id": message["_id"], "score": 0.0})
+                hit["score"] += message["score"]
+                hit["message_id"] = message["message_id"]
+                hit["content"] = message["content"]
+
+        if self.archiver is not None and self.archiver.index_text:
+            # Archived stubs hold no messages; their text is kept aside
+            cursor = self.db.archived_text.find(text, {"score": score}).sort([("score", score)]).limit(MAX_CANDIDATES)
+            async for archived in cursor:
+                hit = hits.setdefault(archived["_id"], {"conversation_id": archived["_id"], "score": 0.0})
+                hit["score"] += archived["score"]
+
+        ranked = sorted(hits.values(), key=lambda hit: hit["score"], reverse=True)
+        page = ranked[offset:offset + limit]
+
+        missing = [hit["conversation_id"] for hit in page if "title" not in hit]
+        if missing:
+            titles = self.db.conversations.find(
+                {"id": {"$in": missing}}, {"_id": 0, "id": 1, "title": 1, "updated_at": 1}
+            )
+            by_id = {conversation["id"]: conversation async for conversation in titles}
+            for hit in page:
+                conversation = by_id.get(hit["conversation_id"])
+                if conversation:
+                    hit.setdefault("title", conversation["title"])
+                    hit.setdefault("updated_at", conversation.get("updated_at"))
+                hit.setdefault("title", "")
+
+        terms = tokenize(query)
+        for hit in page:
+            content = hit.pop("content", None)
+            if content:
+                hit["snippet"] = make_snippet(content, terms)
+        await self.add_snippets(page, terms)
+        return len(ranked), page
+
+
+class InvertedIndexSearch(SearchBackend):
+    """In-process inverted index ranked with BM25, for Mongo deployments without text indexes.
+
+    The index is built from the store on startup in the background and kept
+    current through the write hooks. Each process holds its own copy, so it
+    suits single-worker deployments or ones that can afford the rebuild.
+    Archived conversations are indexed from their archived copies, so the
+    rebuild reads every archived blob once.
+    """
+
+    name = "memory"
+
+    # BM25 parameters
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, store, archiver=None, batch_size: int = 500):
+        super().__init__(store, archiver)
+        self.batch_size = batch_size
+        # term -> conversation id -> weighted term frequency
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        # conversation id -> {title, updated_at, length, terms}
+        self.documents: Dict[str, dict] = {}
+        self.total_length = 0.0
+        self.ready = False
+        self.build_seconds = 0.0
+
+    async def start(self):
+        started = time.perf_counter()
+        count = 0
+        async for conversation in self.store.iter_conversations(batch_size=self.batch_size):
+            # Past the archiver's cache, which would only churn
+            self.index_conversation(await self.load_archived(conversation, cache=False))
+            count += 1
+        self.ready = True
+        self.build_seconds = time.perf_counter() - started
+        logger.info(f"Search index built from {count} conversations in {self.build_seconds:.1f}s")
+
+    def _add_terms(self, conversation_id: str, tokens: List[str], weight: float):
+        document = self.documents[conversation_id]
+        for token, count in Counter(tokens).items():
+            postings = self.postings[token]
+            postings[conversation_id] = postings.get(conversation_id, 0.0) + count * weight
+        document["terms"].update(tokens)
+        document["length"] += len(tokens) * weight
+        self.total_length += len(tokens) * weight
+
+    def index_conversation(self, conversation):
+        conversation_id = conversation["id"]
+        self.remove(conversation_id)
+        self.documents[conversation_id] = {
+            "title": conversation.get("title", ""),
+            "updated_at": conversation.get("updated_at"),
+            "length": 0.0,
+            "terms": set(),
+        }
+        self._add_terms(conversation_id, tokenize(conversation.get("title", "")), TITLE_WEIGHT)
+        self.index_messages(conversation_id, conversation.get("messages") or [])
+
+    def index_messages(self, conversation_id, messages):
+        if conversation_id not in self.documents:
+            return
+        text = "\n".join(message.get("content", "") for message in messages)
+        self._add_terms(conversation_id, tokenize(text), 1)
+        self.documents[conversation_id]["updated_at"] = datetime.utcnow()
+
+    def set_title(self, conversation_id, title):
+        document = self.documents.get(conversation_id)
+        if document is None:
+            return
+        old_tokens = tokenize(document["title"])
+        for token in old_tokens:
+            postings = self.postings.get(token)
+            if postings and conversation_id in postings:
+                postings[conversation_id] -= TITLE_WEIGHT
+                if postings[conversation_id] <= 0:
+                    # The term only occurred in the old title
+                    del postings[conversation_id]
+                    document["terms"].discard(token)
+                    if not postings:
+                        del self.postings[token]
+        document["length"] -= len(old_tokens) * TITLE_WEIGHT
+        self.total_length -= len(old_tokens) * TITLE_WEIGHT
+        document["title"] = title
+        self._add_terms(conversation_id, tokenize(title), TITLE_WEIGHT)
+
+    def remove(self, conversation_id):
+        document = self.documents.pop(conversation_id, None)
+        if document is None:
+            return
+        for token in document["terms"]:
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(conversation_id, None)
+                if not postings:
+                    del self.postings[token]
+        self.total_length -= document["length"]
+
+    async def _search(self, query, limit, offset):
+        terms = list(dict.fromkeys(tokenize(query)))
+        count = len(self.documents)
+        if not terms or not count:
+            return 0, []
+
+        average_length = self.total_length / count or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for conversation_id, frequency in postings.items():
+                length = self.documents[conversation_id]["length"]
+                norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[conversation_id] += idf * frequency * (self.k1 + 1) / norm
+
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: item[1])
+        page = []
+        for conversation_id, score in top[offset:]:
+            document = self.documents[conversation_id]
+            page.append({
+                "conversation_id": conversation_id,
+                "title": document["title"],
+                "updated_at": document["updated_at"],
+                "score": round(score, 4),
+            })
+        await self.add_snippets(page, terms)
+        return len(scores), page
+
+    def stats(self):
+        return {
+            **super().stats(),
+            "ready": self.ready,
+            "conversations": len(self.documents),
+            "terms": len(self.postings),
+            "build_seconds": self.build_seconds,
+        }
+
+
+SEARCH_BACKENDS = {
+    MongoTextSearch.name: MongoTextSearch,
+    InvertedIndexSearch.name: InvertedIndexSearch,
+}
+
+
+def create_search_backend(name: str, store, archiver=None) -> SearchBackend:
+    """Build the search backend selected by name"""
+    try:
+        return SEARCH_BACKENDS[name](store, archiver)
+    except KeyError:
+        raise ValueError(f"Unknown search backend '{name}', expected one of {sorted(SEARCH_BACKENDS)}")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Run the API with one or more uvicorn worker processes.
+
+Each worker is a separate process with its own event loop, Mongo pool and
+LLM clients, so requests are spread over several cores. Process-local state
+does not carry across workers; with WORKERS above 1 set SHARED_STATE=mongo
+so rate limits and locks are shared, and prefer SEARCH_BACKEND=mongo, since
+the in-memory index only sees the writes of its own worker, and
+PUBSUB=mongo so /api/ws clients hear about every worker's writes. Prometheus
+metrics are per worker: /api/metrics reports the worker that answered.
+
+HOST, PORT and WORKERS come from .env or the environment, like every other
+setting; the command line overrides them.
+
+Usage:
+    python serve.py
+    python serve.py --workers 4 --port 8001
+    gunicorn -c gunicorn.conf.py server:app    # same layout under gunicorn
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import uvicorn
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from settings import get_settings
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the chat API under uvicorn")
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=settings.workers, help="worker processes")
+    args = parser.parse_args()
+
+    # Workers load their settings from the environment; keep the count consistent with ours
+    os.environ["WORKERS"] = str(args.workers)
+    uvicorn.run(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        app_dir=str(ROOT_DIR),
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,119 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-from dotenv import load_dotenv
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import HTTPConnection
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
-from pathlib import Path
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Union
 import uuid
-from datetime import datetime
+import base64
+from datetime import datetime, timezone
 import json
 import asyncio
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+import contextvars
+import math
+import zlib
+from functools import partial
+from settings import get_settings
+from health import StartupTracker
+from title_queue import TitleQueue
+from llm_pool import LlmClientPool, load_integration
+from resilience import CircuitOpen, ResiliencePolicy
+from admission import AdmissionController, AdmissionRejected, Ticket, current_client
+from context import ContextBuilder, estimate_tokens
+from response_cache import ResponseCache
+from idempotency import IdempotencyError, IdempotencyStore, SingleFlight, fingerprint
+from fast_json import FastJSONResponse
+import ndjson
+from metrics import LLM_TOKENS, MongoCommandTimer, TimingMiddleware, registry, span
+from message_store import create_message_store
+from indexes import check_queries, ensure_indexes, ensure_ttl
+from search import create_search_backend
+from shared_state import create_shared_state
+from sync import TombstoneLog, conditional_json
+from archive import Archiver, create_archive_backend, window
+from batch import BatchItem, BatchRunner, progress
+from pubsub import conversation_deleted, conversation_updated, create_pubsub
+from ws import ChatChannel, error_frame
+
+if TYPE_CHECKING:
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+
+settings = get_settings()
+
+# MongoDB connection; the driver connects on first use and the lifespan warms the pool
+client = AsyncIOMotorClient(
+    settings.mongo_url,
+    minPoolSize=settings.mongo_min_pool_size,
+    maxPoolSize=settings.mongo_max_pool_size,
+    connect=False,
+    event_listeners=[MongoCommandTimer()]
+)
+db = client[settings.db_name]
+
+# Storage engine for conversation messages: 'embedded' or 'collection'
+message_store = create_message_store(settings.message_store, db)
 
+# Counters and locks visible to every worker: 'memory' (this process) or 'mongo'
+shared_state = create_shared_state(settings.shared_state, db)
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+# Conversation change events for WebSocket clients: 'local' (this process) or 'mongo' (change streams)
+pubsub = create_pubsub(settings.pubsub, db)
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Idle conversations moved to compressed blobs: 'collection' or 'disk'; ARCHIVE_AFTER_DAYS=0 disables
+archiver = Archiver(
+    message_store,
+    create_archive_backend(settings.archive_backend, db, settings.archive_path),
+    idle_days=settings.archive_after_days,
+    batch_size=settings.archive_batch_size,
+    interval=settings.archive_interval,
+    cache_size=settings.archive_cache_size,
+    # Text indexes cannot see into the blobs
+    index_text=settings.search_backend == "mongo"
+)
+
+# Full-text search: 'mongo' (text indexes) or 'memory' (in-process inverted index)
+search_backend = create_search_backend(settings.search_backend, message_store, archiver)
+
+# Import and warm-up timings, and readiness for /api/health/ready
+startup = StartupTracker(retry_interval=settings.startup_retry_interval)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm Mongo and the LLM integration in parallel, then start background work"""
+    started = time.perf_counter()
+    warn_single_process_state()
+    await asyncio.gather(
+        startup.step("mongo", warm_mongo, settings.startup_timeout),
+        startup.step("llm", warm_llm, settings.startup_timeout),
+    )
+    title_queue.start()
+    await pubsub.start()
+    batch_runner.start()
+    archiver.start(lock=shared_state.lock)
+    spawn_background(start_search_backend())
+    startup.finish(started)
+    try:
+        yield
+    finally:
+        await startup.stop()
+        await archiver.stop()
+        await batch_runner.stop()
+        await pubsub.stop()
+        await title_queue.drain()
+        await llm_pool.aclose()
+        client.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -39,6 +128,12 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class StatusClientSummary(BaseModel):
+    client_name: str
+    count: int
+    first_seen: datetime
+    last_seen: datetime
+
 # Chat Models
 class ChatMessage(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -54,20 +149,146 @@ class Conversation(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class ConversationWindow(Conversation):
+    message_count: int = 0
+    first_seq: int = 0
+
+class SummaryVersion(BaseModel):
+    conversation_id: str
+    version: int
+    text: str
+    from_seq: int
+    upto_seq: int
+    created_at: datetime
+
+class ConversationSummary(BaseModel):
+    id: str
+    title: str
+    created_at: datetime
+    updated_at: datetime
+    message_count: int = 0
+    last_message: Optional[str] = None
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationSummary]
+    next_cursor: Optional[str] = None
+
+class ConversationChanges(BaseModel):
+    conversations: List[ConversationSummary]
+    deleted: List[str] = []
+    next_since: datetime
+    has_more: bool = False
+
 class SendMessageRequest(BaseModel):
     conversation_id: Optional[str] = None
     message: str
     title: Optional[str] = None
 
+class SearchResult(BaseModel):
+    conversation_id: str
+    title: str = ""
+    updated_at: Optional[datetime] = None
+    score: float
+    message_id: Optional[str] = None
+    snippet: Optional[str] = None
+
+class SearchPage(BaseModel):
+    query: str
+    total: int
+    results: List[SearchResult]
+    next_offset: Optional[int] = None
+
 class StreamChatResponse(BaseModel):
     content: str
     is_final: bool = False
 
 # Constants
+# Conversation fields used internally and never returned by the API
+INTERNAL_FIELDS = ("summary", "auto_title")
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_PAGE_SIZE = 1000
+DEFAULT_STATUS_LIMIT = 100
+# Documents per Mongo cursor batch when exporting, and per insert_many when importing
+EXPORT_BATCH_SIZE = settings.export_batch_size
+IMPORT_CHUNK_SIZE = settings.import_chunk_size
+# Invalid lines reported back by an import
+MAX_IMPORT_ERRORS = 20
 GEMINI_API_KEY = "your api key"
 AI_AVATAR = "https://images.unsplash.com/photo-1631882456892-54a30e92fe4f?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NDQ2MzR8MHwxfHNlYXJjaHwyfHxyb2JvdCUyMGF2YXRhcnxlbnwwfHx8fDE3NTIzMTY5NDh8MA&ixlib=rb-4.1.0&q=85"
+CHAT_SYSTEM_MESSAGE = "You are a helpful AI assistant. Provide clear, accurate, and helpful responses. Format your responses using markdown when appropriate."
+TITLE_SYSTEM_MESSAGE = "Generate a short, descriptive title (max 50 characters) for this conversation based on the user's first message. Return only the title, nothing else."
 USER_AVATAR = "https://images.unsplash.com/photo-1633332755192-727a05c4013d?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NTY2NzR8MHwxfHNlYXJjaHwxfHx1c2VyJTIwYXZhdGFyfGVufDB8fHx8MTc1MjMxNjk1N3ww&ixlib=rb-4.1.0&q=85"
 
+# Admission control for provider calls; LLM_RPM/LLM_TPM of 0 leave rates unlimited
+admission = AdmissionController(
+    max_concurrency=settings.llm_max_concurrency,
+    per_client=settings.llm_max_per_client,
+    max_queue=settings.llm_max_queue,
+    queue_timeout=settings.llm_queue_timeout,
+    requests_per_minute=settings.llm_rpm,
+    tokens_per_minute=settings.llm_tpm,
+    shared=shared_state
+)
+
+# Shared LLM clients and HTTP connection pool
+llm_pool = LlmClientPool(
+    GEMINI_API_KEY,
+    max_clients=settings.llm_max_clients,
+    max_connections=settings.llm_max_connections,
+    admission=admission,
+    policy=ResiliencePolicy(
+        timeout=settings.llm_timeout,
+        max_attempts=settings.llm_max_attempts,
+        backoff_base=settings.llm_backoff_base,
+        backoff_max=settings.llm_backoff_max,
+        hedge_after=settings.llm_hedge_after,
+        fallback_model=settings.llm_fallback_model,
+        breaker_threshold=settings.llm_breaker_threshold,
+        breaker_reset=settings.llm_breaker_reset
+    )
+)
+
+# Opt-in cache of first-turn responses; RESPONSE_CACHE_MONGO=1 adds a shared Mongo tier
+response_cache = ResponseCache(
+    enabled=settings.response_cache,
+    max_entries=settings.response_cache_size,
+    ttl=settings.response_cache_ttl,
+    collection=db.response_cache if settings.response_cache_mongo else None
+)
+
+# Completed /chat/send results replayed for retries carrying the same Idempotency-Key
+idempotency = IdempotencyStore(
+    db.idempotency_keys,
+    ttl=settings.idempotency_ttl
+)
+
+# Deleted conversation ids reported to ?since= delta syncs
+tombstones = TombstoneLog(
+    db.conversation_tombstones,
+    ttl=settings.sync_tombstone_ttl
+)
+
+# Concurrent identical sends share one LLM call and one stored turn
+single_flight = SingleFlight()
+
+# Background tasks that must outlive the request that started them
+background_tasks = set()
+
+def spawn_background(coro) -> asyncio.Task:
+    """Run a coroutine detached from the request, keeping a reference until it finishes
+
+    The task does not inherit the request's admission client, so LLM calls
+    it makes count against the global limits only, not the caller's share.
+    """
+    context = contextvars.copy_context()
+    context.run(current_client.set, None)
+    task = asyncio.create_task(coro, context=context)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -80,171 +301,963 @@ async def create_status_check(input: StatusCheckCreate):
     _ = await db.status_checks.insert_one(status_obj.dict())
     return status_obj
 
+def naive_utc(value: datetime) -> datetime:
+    """Timestamps are stored as naive UTC; convert aware query parameters to match"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def status_query(client_name: Optional[str], since: Optional[datetime], until: Optional[datetime]) -> dict:
+    query = {}
+    if client_name:
+        query["client_name"] = client_name
+    if since or until:
+        query["timestamp"] = {}
+        if since:
+            query["timestamp"]["$gte"] = naive_utc(since)
+        if until:
+            query["timestamp"]["$lt"] = naive_utc(until)
+    return query
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    client_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_STATUS_LIMIT, ge=1, le=MAX_PAGE_SIZE)
+):
+    """Most recent status checks first, optionally for one client and a [since, until) range
+
+    Checks older than STATUS_RETENTION seconds are removed by a TTL index.
+    """
+    with span("mongo_read"):
+        status_checks = await db.status_checks.find(
+            status_query(client_name, since, until), {"_id": 0}
+        ).sort("timestamp", -1).limit(limit).to_list(limit)
+    return FastJSONResponse(status_checks)
+
+@api_router.get("/status/summary", response_model=List[StatusClientSummary])
+async def get_status_summary(
+    client_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_STATUS_LIMIT, ge=1, le=MAX_PAGE_SIZE)
+):
+    """Check count and first/last seen time per client, most recently seen first
+
+    Aggregated in Mongo, so dashboards get one row per client instead of
+    every check.
+    """
+    with span("mongo_read"):
+        summary = await db.status_checks.aggregate([
+            {"$match": status_query(client_name, since, until)},
+            {"$group": {
+                "_id": "$client_name",
+                "count": {"$sum": 1},
+                "first_seen": {"$min": "$timestamp"},
+                "last_seen": {"$max": "$timestamp"}
+            }},
+            {"$sort": {"last_seen": -1, "_id": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "client_name": "$_id", "count": 1, "first_seen": 1, "last_seen": 1}}
+        ]).to_list(limit)
+    return FastJSONResponse(summary)
 
 # Chat Routes
-@api_router.get("/conversations", response_model=List[Conversation])
-async def get_conversations():
-    """Get all conversations for the user"""
-    conversations = await db.conversations.find().sort("updated_at", -1).to_list(1000)
-    result = []
-    for conv in conversations:
-        # Convert MongoDB _id to string and remove it
-        if '_id' in conv:
-            del conv['_id']
-        
-        # Convert messages
-        messages = []
-        for msg in conv.get('messages', []):
-            if '_id' in msg:
-                del msg['_id']
-            messages.append(ChatMessage(**msg))
-        
-        conv['messages'] = messages
-        result.append(Conversation(**conv))
-    
-    return result
+def public_document(conversation: dict) -> dict:
+    """Drop the bookkeeping fields a stored conversation carries for the server only"""
+    for field in INTERNAL_FIELDS:
+        conversation.pop(field, None)
+    return conversation
 
-@api_router.get("/conversations/{conversation_id}", response_model=Conversation)
-async def get_conversation(conversation_id: str):
-    """Get a specific conversation"""
-    conversation = await db.conversations.find_one({"id": conversation_id})
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # Convert MongoDB _id to string and remove it
-    if '_id' in conversation:
-        del conversation['_id']
-    
-    # Convert messages
-    messages = []
-    for msg in conversation.get('messages', []):
-        if '_id' in msg:
-            del msg['_id']
-        messages.append(ChatMessage(**msg))
-    
-    conversation['messages'] = messages
-    return Conversation(**conversation)
+async def hydrate(conversation: dict) -> dict:
+    """Fill in the messages of an archived conversation from the archive"""
+    if not conversation.get("archived"):
+        return conversation
+    archived = await archiver.load(conversation["id"], conversation.get("archived_at"))
+    if archived is None:
+        logger.error(f"Archived conversation {conversation['id']} is missing from the archive")
+        return conversation
+    # The stub's own fields win: titles can still change after archiving
+    return {**archived, **{key: value for key, value in conversation.items() if key != "messages"}, "messages": archived["messages"]}
 
-@api_router.post("/chat/send")
-async def send_message(request: SendMessageRequest):
-    """Send a message and get AI response"""
+def encode_cursor(conversation: dict) -> str:
+    """Build an opaque keyset cursor from the last conversation of a page"""
+    payload = json.dumps({"u": conversation["updated_at"].isoformat(), "id": conversation["id"]})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str) -> dict:
+    """Turn a keyset cursor back into a Mongo filter for the next page"""
     try:
-        conversation_id = request.conversation_id
-        
-        # Create user message
-        user_message = ChatMessage(
-            role="user",
-            content=request.message,
-            avatar=USER_AVATAR
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        updated_at = datetime.fromisoformat(payload["u"])
+        conversation_id = payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {
+        "$or": [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "id": {"$lt": conversation_id}}
+        ]
+    }
+
+@api_router.get("/conversations", response_model=Union[ConversationPage, ConversationChanges, List[Conversation]])
+async def get_conversations(
+    http_request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    full: bool = False
+):
+    """Get a page of conversation summaries, newest first
+
+    Pass the returned next_cursor to fetch the following page. With
+    full=true the conversations are returned with all of their messages as a
+    plain list, as this endpoint did originally.
+
+    With since=<updated_at> only conversations changed after that time are
+    returned, oldest change first, with the ids of conversations deleted
+    since then. Poll again with the returned next_since. Responses carry an
+    ETag; a matching If-None-Match gets an empty 304.
+    """
+    if since is not None:
+        if cursor or full:
+            raise HTTPException(status_code=400, detail="since cannot be combined with cursor or full")
+        return await get_conversation_changes(http_request, since, limit)
+
+    query = decode_cursor(cursor) if cursor else {}
+    sort = [("updated_at", -1), ("id", -1)]
+
+    if full:
+        with span("mongo_read"):
+            conversations = await message_store.list_conversations(query, sort, limit)
+        with span("archive_read"):
+            conversations = [await hydrate(conv) for conv in conversations]
+        with span("serialize"):
+            return conditional_json(http_request, [public_document(conv) for conv in conversations])
+
+    with span("mongo_read"):
+        conversations = await message_store.list_summaries(query, sort, limit)
+
+    with span("serialize"):
+        next_cursor = encode_cursor(conversations[-1]) if len(conversations) == limit else None
+        return conditional_json(http_request, {"conversations": conversations, "next_cursor": next_cursor})
+
+async def get_conversation_changes(http_request: Request, since: datetime, limit: int):
+    """Conversations updated and deleted after `since`, for delta syncs"""
+    since = naive_utc(since)
+    if not tombstones.covers(since):
+        raise HTTPException(status_code=410, detail="Sync cursor expired, reload the conversation list")
+
+    with span("mongo_read"):
+        conversations = await message_store.list_summaries(
+            {"updated_at": {"$gt": since}}, [("updated_at", 1), ("id", 1)], limit
         )
-        
-        if conversation_id:
-            # Update existing conversation
-            conversation = await db.conversations.find_one({"id": conversation_id})
-            if not conversation:
-                raise HTTPException(status_code=404, detail="Conversation not found")
-            
-            # Add user message to conversation
-            await db.conversations.update_one(
-                {"id": conversation_id},
-                {
-                    "$push": {"messages": user_message.dict()},
-                    "$set": {"updated_at": datetime.utcnow()}
-                }
-            )
-        else:
-            # Create new conversation
-            conversation_id = str(uuid.uuid4())
-            title = request.title or (request.message[:50] + "..." if len(request.message) > 50 else request.message)
-            
-            new_conversation = Conversation(
-                id=conversation_id,
-                title=title,
-                messages=[user_message]
-            )
-            
-            await db.conversations.insert_one(new_conversation.dict())
-        
-        # Generate AI response using Gemini
-        chat = LlmChat(
-            api_key=GEMINI_API_KEY,
-            session_id=conversation_id,
-            system_message="You are a helpful AI assistant. Provide clear, accurate, and helpful responses. Format your responses using markdown when appropriate."
-        ).with_model("gemini", "gemini-2.0-flash")
-        
-        user_msg = UserMessage(text=request.message)
-        ai_response = await chat.send_message(user_msg)
-        
-        # Create AI message
-        ai_message = ChatMessage(
-            role="assistant",
-            content=ai_response,
-            avatar=AI_AVATAR
+        deleted = await tombstones.deleted_since(since)
+
+    has_more = len(conversations) == limit
+    if has_more:
+        # Hold back the conversations sharing the last timestamp, which may
+        # continue past this page, so next_since cannot skip any of them
+        last = conversations[-1]["updated_at"]
+        earlier = [conv for conv in conversations if conv["updated_at"] < last]
+        conversations = earlier or conversations
+
+    with span("serialize"):
+        next_since = conversations[-1]["updated_at"] if conversations else since
+        return conditional_json(http_request, {
+            "conversations": conversations,
+            "deleted": deleted,
+            "next_since": next_since,
+            "has_more": has_more,
+        })
+
+async def export_documents() -> AsyncIterator[dict]:
+    async for conversation in message_store.iter_conversations(batch_size=EXPORT_BATCH_SIZE):
+        yield public_document(await hydrate(conversation))
+
+@api_router.get("/conversations/export")
+async def export_conversations(gzip: bool = False):
+    """Stream every conversation with its messages as NDJSON, one per line
+
+    The Mongo cursor is read in batches and encoded as it goes, so memory
+    stays flat regardless of how many conversations are stored. With
+    gzip=true the body is a .ndjson.gz file.
+    """
+    filename = "conversations.ndjson.gz" if gzip else "conversations.ndjson"
+    return StreamingResponse(
+        ndjson.encode(export_documents(), compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.post("/conversations/import")
+async def import_conversations(request: Request):
+    """Bulk-load conversations from an NDJSON body, plain or gzip-compressed
+
+    Each line is validated as a Conversation and written with insert_many
+    in chunks of IMPORT_CHUNK_SIZE. Conversations whose id already exists
+    are skipped, so re-importing an export is harmless.
+    """
+    received = 0
+    invalid = 0
+    imported = 0
+    errors = []
+    chunk = []
+
+    async def flush():
+        nonlocal imported
+        with span("mongo_write"):
+            inserted = set(await message_store.create_conversations(chunk))
+        imported += len(inserted)
+        # Skipped duplicates keep the stored copy, which is already indexed
+        for conversation in chunk:
+            if conversation["id"] in inserted:
+                # Only the first of a repeated id was inserted
+                inserted.discard(conversation["id"])
+                search_backend.index_conversation(conversation)
+        chunk.clear()
+
+    try:
+        async for line in ndjson.lines(request.stream()):
+            received += 1
+            try:
+                chunk.append(Conversation(**json.loads(line)).dict())
+            except (ValueError, TypeError) as e:
+                invalid += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append(f"line {received}: {str(e).splitlines()[0]}")
+                continue
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                await flush()
+        if chunk:
+            await flush()
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Invalid gzip body")
+    except Exception as e:
+        logger.error(f"Error importing conversations: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Import failed after {imported} conversations")
+
+    return {
+        "received": received,
+        "imported": imported,
+        "skipped": received - invalid - imported,
+        "invalid": invalid,
+        "errors": errors
+    }
+
+@api_router.post("/batch", status_code=202)
+async def submit_batch(request: Request):
+    """Queue a batch job from an NDJSON body, plain or gzip-compressed
+
+    Each line is {"message", "custom_id"?, "system_message"?}. Prompts are
+    answered by background workers without creating conversations or
+    titles; poll GET /api/batch/{job_id} for progress and read the answers
+    from GET /api/batch/{job_id}/results.
+    """
+    job_id = await batch_runner.create_job()
+    received = 0
+    invalid = 0
+    total = 0
+    errors = []
+    chunk = []
+    opened = False
+
+    async def flush():
+        nonlocal total
+        with span("mongo_write"):
+            await batch_runner.add_items(job_id, total, chunk)
+        total += len(chunk)
+        chunk.clear()
+
+    try:
+        async for line in ndjson.lines(request.stream()):
+            received += 1
+            try:
+                chunk.append(BatchItem(**json.loads(line)))
+            except (ValueError, TypeError) as e:
+                invalid += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append(f"line {received}: {str(e).splitlines()[0]}")
+                continue
+            if total + len(chunk) > settings.batch_max_items:
+                raise HTTPException(status_code=413, detail=f"A batch holds at most {settings.batch_max_items} prompts")
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                await flush()
+        if chunk:
+            await flush()
+        if total == 0:
+            raise HTTPException(status_code=400, detail={"message": "No valid prompts in the batch", "errors": errors})
+        await batch_runner.open_job(job_id, total)
+        opened = True
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Invalid gzip body")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error receiving batch: {str(e)}")
+        raise HTTPException(status_code=500, detail="Batch upload failed")
+    finally:
+        # Items of an unfinished upload may already be running; drop them with the job
+        if not opened:
+            await batch_runner.discard(job_id)
+
+    return {"job_id": job_id, "total": total, "invalid": invalid, "errors": errors}
+
+@api_router.get("/batch/{job_id}")
+async def get_batch(job_id: str):
+    """Progress of a batch job, with its throughput and estimated time left"""
+    job = await batch_runner.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return FastJSONResponse(progress(job))
+
+@api_router.get("/batch/{job_id}/results")
+async def get_batch_results(job_id: str, after: Optional[int] = Query(None, ge=0), gzip: bool = False):
+    """Stream the finished items of a batch job as NDJSON, in upload order
+
+    Results can be read while the job runs; pass after=<last index read>
+    to continue from where a previous read stopped.
+    """
+    if await batch_runner.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    filename = f"batch-{job_id}.ndjson.gz" if gzip else f"batch-{job_id}.ndjson"
+    return StreamingResponse(
+        ndjson.encode(batch_runner.results(job_id, after, batch_size=EXPORT_BATCH_SIZE), compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.delete("/batch/{job_id}")
+async def cancel_batch(job_id: str):
+    """Cancel a batch job; results already produced are kept"""
+    job = await batch_runner.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return FastJSONResponse(progress(job))
+
+@api_router.get("/conversations/{conversation_id}", response_model=ConversationWindow)
+async def get_conversation(
+    conversation_id: str,
+    http_request: Request,
+    before: Optional[int] = Query(None, ge=0),
+    after_seq: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE)
+):
+    """Get a specific conversation
+
+    Without parameters every message is returned. Use limit to get only the
+    latest messages, and before=<first_seq> to page back through older ones.
+    after_seq=<seq of the last message held> returns only newer messages,
+    the first limit of them if given. Responses carry an ETag; a matching
+    If-None-Match gets an empty 304.
+    """
+    if before is not None and after_seq is not None:
+        raise HTTPException(status_code=400, detail="before and after_seq cannot be combined")
+
+    with span("mongo_read"):
+        conversation = await message_store.get_conversation(
+            conversation_id, before=before, limit=limit, after=after_seq
         )
-        
-        # Add AI message to conversation
-        await db.conversations.update_one(
-            {"id": conversation_id},
-            {
-                "$push": {"messages": ai_message.dict()},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if conversation.get("archived"):
+        with span("archive_read"):
+            conversation = window(await hydrate(conversation), before=before, limit=limit, after=after_seq)
+
+    with span("serialize"):
+        return conditional_json(http_request, public_document(conversation))
+
+@api_router.get("/conversations/{conversation_id}/summaries", response_model=List[SummaryVersion])
+async def get_conversation_summaries(conversation_id: str):
+    """Rolling summary versions of a long conversation, newest first"""
+    summaries = await context_builder.list_summaries(conversation_id)
+    if not summaries and not await db.conversations.count_documents({"id": conversation_id}, limit=1):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return summaries
+
+async def store_turn(
+    request: SendMessageRequest,
+    conversation_id: str,
+    user_message: ChatMessage,
+    ai_message: ChatMessage
+):
+    """Persist the user message and its reply in a single write
+
+    Both messages land together, so a conversation never holds a user
+    message whose reply is still being generated or has failed.
+    """
+    messages = [user_message.dict(), ai_message.dict()]
+
+    if request.conversation_id:
+        if not await message_store.append_messages(conversation_id, messages):
+            # An archived conversation takes writes again once restored, here or by another worker
+            await archiver.restore(conversation_id)
+            if not await message_store.append_messages(conversation_id, messages):
+                raise HTTPException(status_code=404, detail="Conversation not found")
+        search_backend.index_messages(conversation_id, messages)
+        pubsub.notify(conversation_updated(conversation_id, ai_message.timestamp))
+        return
+
+    # Create new conversation
+    title = request.title or default_title(request.message)
+
+    new_conversation = Conversation(
+        id=conversation_id,
+        title=title,
+        messages=[user_message, ai_message]
+    )
+
+    # The title stays a placeholder for generate_title until the user renames it
+    await message_store.create_conversation({**new_conversation.dict(), "auto_title": True})
+    search_backend.index_conversation(new_conversation.dict())
+    pubsub.notify(conversation_updated(conversation_id, new_conversation.updated_at, title))
+
+async def call_llm(chat: "LlmChat", user_msg: "UserMessage", stage: str = "llm") -> str:
+    """Send one message through the pool, recording its latency and token estimate"""
+    with span(stage):
+        response = await llm_pool.send(chat, user_msg)
+    LLM_TOKENS.inc(estimate_tokens(user_msg.text), direction="prompt")
+    LLM_TOKENS.inc(estimate_tokens(response), direction="completion")
+    return response
+
+async def complete_once(session_id: str, system_message: str, text: str, stage: str = "llm_aux") -> str:
+    """One-off completion outside any conversation history"""
+    chat = llm_pool.get(session_id, system_message, cache=False)
+    return await call_llm(chat, llm_pool.message(text), stage=stage)
+
+# Prompt assembly for follow-up turns; CONTEXT_MAX_MESSAGES=0 leaves history to the integration
+context_builder = ContextBuilder(
+    message_store,
+    max_messages=settings.context_max_messages,
+    token_budget=settings.context_token_budget,
+    complete=complete_once if settings.context_summary else None,
+    spawn=spawn_background,
+    summary_segment=settings.context_summary_segment,
+    summary_versions=settings.context_summary_versions,
+    state=shared_state,
+    restore=archiver.restore
+)
+
+# Batch jobs: prompts answered without conversations or titles, resumable across restarts
+batch_runner = BatchRunner(
+    db.batch_jobs,
+    db.batch_items,
+    partial(complete_once, stage="batch"),
+    system_message=CHAT_SYSTEM_MESSAGE,
+    concurrency=settings.batch_concurrency,
+    lease=settings.batch_lease,
+    max_attempts=settings.batch_max_attempts,
+    retention=settings.batch_retention
+)
+
+# One WebSocket per browser tab, carrying all of its conversations
+chat_channel = ChatChannel(
+    pubsub,
+    max_streams=settings.ws_max_streams,
+    queue_size=settings.ws_queue_size,
+    send_timeout=settings.ws_send_timeout
+)
+
+async def prepare_chat(conversation_id: str, request: SendMessageRequest):
+    """Pick the chat client and build the prompt for a turn
+
+    Follow-up turns get a bounded, token-budgeted history assembled from
+    storage, sent through a client without integration-side history so the
+    prompt size stays flat as the conversation grows. Reading that history
+    (or touching the conversation when there is none to read) is also the
+    existence check, so a missing conversation fails before the model runs.
+    """
+    if request.conversation_id:
+        if context_builder.enabled:
+            context = await context_builder.build(conversation_id, request.message, CHAT_SYSTEM_MESSAGE)
+            if context is None:
+                raise HTTPException(status_code=404, detail="Conversation not found")
+            # A session of its own, so the integration adds no history to the built prompt
+            chat = llm_pool.get(f"context_{conversation_id}_{uuid.uuid4().hex}", CHAT_SYSTEM_MESSAGE, cache=False)
+            return chat, llm_pool.message(context.text)
+
+        if not await message_store.touch(conversation_id):
+            raise HTTPException(status_code=404, detail="Conversation not found")
+
+    # The client is kept for later turns only while it holds the history;
+    # with the context builder every turn brings its own
+    chat = llm_pool.get(conversation_id, CHAT_SYSTEM_MESSAGE, cache=not context_builder.enabled)
+    return chat, llm_pool.message(request.message)
+
+def response_cache_key(request: SendMessageRequest) -> Optional[str]:
+    """Cache key for the turn, or None when the response must not be cached
+
+    Only the first message of a conversation is cacheable; later turns
+    depend on the conversation's history.
+    """
+    if not response_cache.enabled or request.conversation_id:
+        return None
+    return ResponseCache.make_key(llm_pool.provider, llm_pool.model, CHAT_SYSTEM_MESSAGE, request.message)
+
+def default_title(message: str) -> str:
+    """Title a new conversation gets until a better one is generated"""
+    return message[:50] + "..." if len(message) > 50 else message
+
+async def generate_title(conversation_id: str, message: str):
+    """Generate a better title based on the user's first message
+
+    The title sent with the first message is a placeholder, replaced
+    only while `auto_title` is still set; a rename clears it, so a title the
+    user chose is never overwritten.
+    """
+    title_response = await complete_once(
+        f"title_{conversation_id}", TITLE_SYSTEM_MESSAGE, f"User's message: {message}", stage="title"
+    )
+
+    if title_response and len(title_response) <= 50:
+        # Bump updated_at so delta syncs pick up the new title
+        updated_at = datetime.utcnow()
+        result = await db.conversations.update_one(
+            {"id": conversation_id, "auto_title": True},
+            {"$set": {"title": title_response.strip(), "updated_at": updated_at}, "$unset": {"auto_title": ""}}
         )
-        
-        # Update conversation title if it's a new conversation
-        if not request.conversation_id:
-            # Generate a better title based on the conversation
-            title_chat = LlmChat(
-                api_key=GEMINI_API_KEY,
-                session_id=f"title_{conversation_id}",
-                system_message="Generate a short, descriptive title (max 50 characters) for this conversation based on the user's first message. Return only the title, nothing else."
-            ).with_model("gemini", "gemini-2.0-flash")
-            
-            title_msg = UserMessage(text=f"User's message: {request.message}")
-            title_response = await title_chat.send_message(title_msg)
-            
-            if title_response and len(title_response) <= 50:
-                await db.conversations.update_one(
-                    {"id": conversation_id},
-                    {"$set": {"title": title_response.strip()}}
-                )
-        
+        if result.matched_count == 0:
+            return
+        search_backend.set_title(conversation_id, title_response.strip())
+        pubsub.notify(conversation_updated(conversation_id, updated_at, title_response.strip()))
+
+async def stream_ai_response(
+    chat: "LlmChat", user_msg: "UserMessage", ticket: Optional[Ticket] = None
+) -> AsyncIterator[str]:
+    """Yield response text deltas as the model produces them.
+
+    Uses the integration's incremental API when it provides one, and falls
+    back to a single chunk holding the full completion otherwise.
+    """
+    LLM_TOKENS.inc(estimate_tokens(user_msg.text), direction="prompt")
+    async with llm_pool.slot(user_msg.text, ticket=ticket) as ticket:
+        async for delta in llm_pool.stream(chat, user_msg):
+            if delta:
+                LLM_TOKENS.inc(estimate_tokens(delta), direction="completion")
+                ticket.consume_tokens(estimate_tokens(delta))
+                yield delta
+
+title_queue = TitleQueue(
+    generate_title,
+    maxsize=settings.title_queue_size,
+    workers=settings.title_queue_workers,
+    max_attempts=settings.title_queue_attempts
+)
+
+def identify_client(http_request: HTTPConnection) -> str:
+    """Key for per-client admission limits: the caller's address
+
+    The address is the peer's, which uvicorn's proxy_headers replaces with
+    X-Forwarded-For only for trusted proxies (FORWARDED_ALLOW_IPS), so callers
+    cannot pick their own key. X-Client-Id is used instead only with
+    TRUST_CLIENT_ID, behind a proxy that sets it and drops callers' copies.
+    """
+    if settings.trust_client_id:
+        client_id = http_request.headers.get("x-client-id")
+        if client_id:
+            return f"id:{client_id}"
+    return f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+
+async def complete_turn(request: SendMessageRequest) -> dict:
+    """Generate the reply to a message and store both; the body of /chat/send"""
+    # Create user message
+    user_message = ChatMessage(
+        role="user",
+        content=request.message,
+        avatar=USER_AVATAR
+    )
+
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+
+    # Generate AI response using Gemini
+    cache_key = response_cache_key(request)
+    ai_response = await response_cache.get(cache_key) if cache_key else None
+    if ai_response is None:
+        with span("context"):
+            chat, user_msg = await prepare_chat(conversation_id, request)
+        ai_response = await call_llm(chat, user_msg)
+        if cache_key:
+            await response_cache.set(cache_key, ai_response)
+
+    # Create AI message
+    ai_message = ChatMessage(
+        role="assistant",
+        content=ai_response,
+        avatar=AI_AVATAR
+    )
+
+    # Add both messages to the conversation
+    with span("mongo_write"):
+        await store_turn(request, conversation_id, user_message, ai_message)
+
+    # Generate a better title in the background if it's a new conversation
+    if not request.conversation_id:
+        title_queue.submit(conversation_id, request.message)
+
+    with span("serialize"):
         return {
             "conversation_id": conversation_id,
             "user_message": user_message.dict(),
             "ai_message": ai_message.dict()
         }
-        
+
+async def complete_turn_once(request: SendMessageRequest, key: Optional[str], request_hash: str) -> dict:
+    """Run a turn at most once per idempotency key, replaying the stored result for retries"""
+    if key:
+        stored = await idempotency.claim(key, request_hash)
+        if stored is not None:
+            return stored
+
+    try:
+        # Encode now so a replay returns exactly the same body, not datetimes rounded by Mongo
+        result = jsonable_encoder(await complete_turn(request))
+    except BaseException:
+        if key:
+            await idempotency.release(key)
+        raise
+
+    if key:
+        await idempotency.complete(key, result)
+    return result
+
+@api_router.post("/chat/send")
+async def send_message(request: SendMessageRequest, http_request: Request):
+    """Send a message and get AI response
+
+    Send an Idempotency-Key header to make retries safe: a repeated request
+    with the same key gets the stored result instead of a second reply.
+    Identical requests from the same client that arrive while one is being
+    answered share its result, with or without a key.
+    """
+    client_id = identify_client(http_request)
+    current_client.set(client_id)
+    request_hash = fingerprint(request.conversation_id, request.message, request.title)
+    key = http_request.headers.get("idempotency-key")
+    if key:
+        key = f"{client_id}:{key}"
+
+    try:
+        return await single_flight.run(
+            f"{key or client_id}:{request_hash}",
+            lambda: complete_turn_once(request, key, request_hash)
+        )
+    except (HTTPException, AdmissionRejected, CircuitOpen, IdempotencyError):
+        raise
     except Exception as e:
         logger.error(f"Error in send_message: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
+async def produce_ai_stream(
+    conversation_id: str,
+    request: SendMessageRequest,
+    user_message: ChatMessage,
+    chat: "LlmChat",
+    user_msg: "UserMessage",
+    queue: asyncio.Queue,
+    ticket: Optional[Ticket] = None
+):
+    """Run the model for a streamed turn and persist the turn when it ends.
+
+    Runs as a background task so the turn is generated and stored even if
+    the client disconnects before the stream finishes. A provider error
+    ends the stream with an "error" item instead of "done", and nothing is
+    stored: a partial reply must not read as a complete one. "done" is sent
+    only once the turn is stored; a failed write, e.g. because the
+    conversation was deleted meanwhile, ends the stream with "error" too.
+    """
+    chunks = []
+    try:
+        cache_key = response_cache_key(request)
+        cached = await response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            chunks.append(cached)
+            queue.put_nowait(("delta", cached))
+        else:
+            with span("llm"):
+                async for delta in stream_ai_response(chat, user_msg, ticket):
+                    chunks.append(delta)
+                    queue.put_nowait(("delta", delta))
+            if cache_key and chunks:
+                await response_cache.set(cache_key, "".join(chunks))
+    except Exception as e:
+        logger.error(f"Error in chat stream for {conversation_id}: {str(e)}")
+        queue.put_nowait(("error", e))
+        return
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+    ai_message = None
+    try:
+        if chunks:
+            ai_message = ChatMessage(
+                role="assistant",
+                content="".join(chunks),
+                avatar=AI_AVATAR
+            )
+            await store_turn(request, conversation_id, user_message, ai_message)
+
+            if not request.conversation_id:
+                title_queue.submit(conversation_id, request.message)
+    except Exception as e:
+        logger.error(f"Error persisting chat stream for {conversation_id}: {str(e)}")
+        queue.put_nowait(("error", e))
+        return
+    queue.put_nowait(("done", ai_message))
+
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """Format a single Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n"
+
+async def begin_stream(request: SendMessageRequest):
+    """Admit a streamed turn and start generating it; returns the queue its deltas arrive on"""
+    user_message = ChatMessage(
+        role="user",
+        content=request.message,
+        avatar=USER_AVATAR
+    )
+
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    try:
+        with span("context"):
+            chat, user_msg = await prepare_chat(conversation_id, request)
+        # Admit before the stream starts, while a 429 can still be returned
+        with span("admission"):
+            ticket = await llm_pool.admit(user_msg.text)
+    except (HTTPException, AdmissionRejected, CircuitOpen):
+        raise
+    except Exception as e:
+        logger.error(f"Error starting chat stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
+
+    queue = asyncio.Queue()
+    spawn_background(produce_ai_stream(conversation_id, request, user_message, chat, user_msg, queue, ticket))
+    return conversation_id, user_message, queue
+
+@api_router.post("/chat/stream")
+async def stream_message(request: SendMessageRequest, http_request: Request):
+    """Send a message and stream the AI response as Server-Sent Events"""
+    current_client.set(identify_client(http_request))
+    conversation_id, user_message, queue = await begin_stream(request)
+
+    async def event_stream():
+        yield sse_event(json.dumps(jsonable_encoder({
+            "conversation_id": conversation_id,
+            "user_message": user_message
+        })), event="start")
+
+        while True:
+            kind, payload = await queue.get()
+            if kind == "delta":
+                yield sse_event(StreamChatResponse(content=payload).json())
+            elif kind == "error":
+                frame = error_frame(payload)
+                yield sse_event(json.dumps({"status": frame["status"], "detail": frame["detail"]}), event="error")
+                return
+            else:
+                yield sse_event(StreamChatResponse(content="", is_final=True).json())
+                yield sse_event(json.dumps(jsonable_encoder({
+                    "conversation_id": conversation_id,
+                    "ai_message": payload
+                })), event="done")
+                return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """Sends, streamed replies and conversation updates for many conversations over one socket
+
+    See ChatChannel for the frames. Turns are admitted under the same
+    client key as HTTP requests from the same caller.
+    """
+    client_id = identify_client(websocket)
+
+    async def start_turn(frame: dict):
+        current_client.set(client_id)
+        request = SendMessageRequest(**{key: value for key, value in frame.items() if key in SendMessageRequest.model_fields})
+        conversation_id, user_message, queue = await begin_stream(request)
+        return conversation_id, jsonable_encoder(user_message), queue
+
+    await chat_channel.serve(websocket, start_turn)
+
+@api_router.get("/search", response_model=SearchPage)
+async def search_conversations(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0)
+):
+    """Search conversation titles and messages, best matches first
+
+    Each result names the conversation and, when a message matched, carries
+    its id and a snippet around the match. Pass next_offset to get the
+    following page.
+    """
+    try:
+        with span("search"):
+            total, results = await search_backend.search(q, limit, offset)
+    except Exception as e:
+        logger.error(f"Error searching for {q!r}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Search failed")
+
+    with span("serialize"):
+        next_offset = offset + limit if offset + limit < total else None
+        return FastJSONResponse({"query": q, "total": total, "results": results, "next_offset": next_offset})
+
+@api_router.get("/health/live")
+async def health_live():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok", "uptime_seconds": startup.stats()["uptime_seconds"]}
+
+@api_router.get("/health/ready")
+async def health_ready():
+    """Readiness: startup finished and MongoDB answers; 503 until then"""
+    mongo_ok = False
+    if startup.ready:
+        try:
+            await asyncio.wait_for(client.admin.command("ping"), 1.0)
+            mongo_ok = True
+        except Exception as e:
+            logger.error(f"Readiness check failed to reach MongoDB: {str(e)}")
+    ready = startup.ready and mongo_ok
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting" if not startup.finished else "unavailable",
+                 "mongo": mongo_ok, **startup.stats(), "steps": startup.steps}
+    )
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics for requests, stages, Mongo, the LLM and background queues"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/metrics/title-queue")
+async def get_title_queue_metrics():
+    """Title generation queue depth and latency"""
+    return title_queue.stats()
+
+@api_router.get("/metrics/admission")
+async def get_admission_metrics():
+    """LLM admission queue, slots and rejections"""
+    return admission.stats()
+
+@api_router.get("/metrics/idempotency")
+async def get_idempotency_metrics():
+    """Replayed and coalesced /chat/send requests"""
+    return {**idempotency.stats(), **single_flight.stats()}
+
+@api_router.get("/metrics/llm-pool")
+async def get_llm_pool_metrics():
+    """LLM client reuse and concurrency"""
+    return llm_pool.stats()
+
+@api_router.get("/metrics/response-cache")
+async def get_response_cache_metrics():
+    """Response cache hit and miss counters"""
+    return response_cache.stats()
+
+@api_router.get("/metrics/search")
+async def get_search_metrics():
+    """Search backend query latency and index size"""
+    return search_backend.stats()
+
+@api_router.get("/metrics/shared-state")
+async def get_shared_state_metrics():
+    """State shared between workers; counters here are for this worker only"""
+    return {**shared_state.stats(), "workers": settings.workers, "pid": os.getpid()}
+
+@api_router.get("/metrics/context")
+async def get_context_metrics():
+    """Prompt assembly and rolling summary counters"""
+    return context_builder.stats()
+
+@api_router.get("/metrics/batch")
+async def get_batch_metrics():
+    """Batch items processed by this worker"""
+    return batch_runner.stats()
+
+@api_router.get("/metrics/ws")
+async def get_ws_metrics():
+    """WebSocket connections and the pub/sub feeding them, for this worker"""
+    return {**chat_channel.stats(), "pubsub": pubsub.stats()}
+
+@api_router.get("/metrics/archive")
+async def get_archive_metrics():
+    """Conversations moved to and restored from cold storage by this worker"""
+    return archiver.stats()
+
 @api_router.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """Delete a conversation"""
-    result = await db.conversations.delete_one({"id": conversation_id})
-    if result.deleted_count == 0:
+    if not await message_store.delete_conversation(conversation_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
+    search_backend.remove(conversation_id)
+    await archiver.remove(conversation_id)
+    await context_builder.delete_summaries(conversation_id)
+    await tombstones.record(conversation_id)
+    pubsub.notify(conversation_deleted(conversation_id))
     return {"message": "Conversation deleted successfully"}
 
 @api_router.put("/conversations/{conversation_id}/title")
 async def update_conversation_title(conversation_id: str, title: str):
     """Update conversation title"""
+    updated_at = datetime.utcnow()
     result = await db.conversations.update_one(
         {"id": conversation_id},
-        {"$set": {"title": title, "updated_at": datetime.utcnow()}}
+        {"$set": {"title": title, "updated_at": updated_at}, "$unset": {"auto_title": ""}}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Conversation not found")
+    search_backend.set_title(conversation_id, title)
+    pubsub.notify(conversation_updated(conversation_id, updated_at, title))
     return {"message": "Title updated successfully"}
 
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.exception_handler(IdempotencyError)
+async def idempotency_error_handler(request: Request, exc: IdempotencyError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+registry.add_collector("title_queue", title_queue.stats)
+registry.add_collector("llm_pool", llm_pool.stats)
+registry.add_collector("admission", admission.stats)
+registry.add_collector("idempotency", idempotency.stats)
+registry.add_collector("single_flight", single_flight.stats)
+registry.add_collector("response_cache", response_cache.stats)
+registry.add_collector("search", search_backend.stats)
+registry.add_collector("startup", startup.stats)
+registry.add_collector("shared_state", shared_state.stats)
+registry.add_collector("archive", archiver.stats)
+registry.add_collector("context", context_builder.stats)
+registry.add_collector("batch", batch_runner.stats)
+registry.add_collector("ws", chat_channel.stats)
+registry.add_collector("pubsub", pubsub.stats)
+
+app.add_middleware(TimingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -260,6 +1273,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+def warn_single_process_state():
+    """Point out settings that only work within one process when running several workers"""
+    if settings.workers <= 1:
+        return
+    if not shared_state.shared:
+        logger.warning(f"Running {settings.workers} workers with SHARED_STATE={shared_state.name}: rate limits and summary locks apply per worker")
+    if search_backend.name == "memory":
+        logger.warning(f"Running {settings.workers} workers with SEARCH_BACKEND=memory: each worker only indexes its own writes")
+    if not pubsub.shared:
+        logger.warning(f"Running {settings.workers} workers with PUBSUB={pubsub.name}: WebSocket clients only see updates made through their own worker")
+
+async def warm_mongo():
+    """Open the connection pool and make sure the indexes exist"""
+    await client.admin.command("ping")
+    await ensure_indexes(db)
+    await ensure_ttl(db, "status_checks", "timestamp", settings.status_retention)
+    if settings.check_indexes:
+        for scan in await check_queries(db):
+            logger.warning(f"Query on {scan['collection']} still scans the collection: filter={scan['filter']} sort={scan['sort']}")
+
+async def warm_llm():
+    """Import the LLM integration off the event loop and open the shared HTTP pool"""
+    await asyncio.to_thread(load_integration)
+    llm_pool.start()
+
+async def start_search_backend():
+    # Building the index can take a while on large databases; serve meanwhile
+    try:
+        await search_backend.start()
+    except Exception as e:
+        logger.error(f"Error starting {search_backend.name} search backend: {str(e)}")
+
+startup.import_seconds = time.perf_counter() - IMPORT_STARTED
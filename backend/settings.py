@@ -0,0 +1,129 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Literal, Mapping, Optional
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field, field_validator
+
+
+ROOT_DIR = Path(__file__).parent
+
+
+class Settings(BaseModel):
+    """Server configuration, read from environment variables of the same name in upper case.
+
+    Every value is validated when the settings are loaded, so a typo in the
+    environment stops the process at startup with a list of the offending
+    variables instead of failing on the first request that needs them.
+    """
+
+    # Server processes started by serve.py; with more than one, use shared_state=mongo
+    host: str = "0.0.0.0"
+    port: int = Field(8001, ge=1, le=65535)
+    workers: int = Field(1, ge=1)
+    # Counters, locks and caches shared between workers: per-process or in a Mongo collection
+    shared_state: Literal["memory", "mongo"] = "memory"
+
+    # MongoDB
+    mongo_url: str
+    db_name: str
+    mongo_min_pool_size: int = Field(4, ge=0)
+    mongo_max_pool_size: int = Field(100, ge=1)
+    # Storage engine for conversation messages
+    message_store: Literal["embedded", "collection"] = "embedded"
+    # Full-text search: text indexes or an in-process inverted index
+    search_backend: Literal["mongo", "memory"] = "mongo"
+    check_indexes: bool = False
+
+    # LLM admission control; rates of 0 are unlimited
+    llm_max_concurrency: int = Field(32, ge=1)
+    llm_max_per_client: int = Field(4, ge=1)
+    llm_max_queue: int = Field(256, ge=0)
+    llm_queue_timeout: float = Field(10, ge=0)
+    llm_rpm: float = Field(0, ge=0)
+    llm_tpm: float = Field(0, ge=0)
+    # Key per-client limits on X-Client-Id; only behind a proxy that sets it and drops callers' copies
+    trust_client_id: bool = False
+
+    # LLM clients and resilience; a hedge delay of 0 disables hedging
+    llm_max_clients: int = Field(1024, ge=1)
+    llm_max_connections: int = Field(100, ge=1)
+    llm_timeout: float = Field(60, gt=0)
+    llm_max_attempts: int = Field(3, ge=1)
+    llm_backoff_base: float = Field(0.5, ge=0)
+    llm_backoff_max: float = Field(8, ge=0)
+    llm_hedge_after: float = Field(0, ge=0)
+    llm_fallback_model: Optional[str] = None
+    llm_breaker_threshold: int = Field(5, ge=1)
+    llm_breaker_reset: float = Field(30, ge=0)
+
+    # Response cache for first turns
+    response_cache: bool = False
+    response_cache_size: int = Field(1024, ge=1)
+    response_cache_ttl: float = Field(3600, gt=0)
+    response_cache_mongo: bool = False
+
+    idempotency_ttl: float = Field(86400, gt=0)
+    # Seconds status check pings are kept before the TTL index removes them
+    status_retention: int = Field(7 * 86400, gt=0)
+    # How long deletions are remembered for ?since= delta syncs
+    sync_tombstone_ttl: float = Field(7 * 86400, gt=0)
+
+    # Conversation events for WebSocket clients; use mongo (change streams, needs a replica set) with several workers
+    pubsub: Literal["local", "mongo"] = "local"
+    ws_max_streams: int = Field(8, ge=1)
+    ws_queue_size: int = Field(256, ge=1)
+    ws_send_timeout: float = Field(10, gt=0)
+
+    # Cold storage for idle conversations; 0 days keeps everything in the hot collections
+    archive_after_days: float = Field(0, ge=0)
+    archive_backend: Literal["collection", "disk"] = "collection"
+    archive_path: str = str(ROOT_DIR / "archive")
+    archive_interval: float = Field(3600, gt=0)
+    archive_batch_size: int = Field(100, ge=1)
+    archive_cache_size: int = Field(64, ge=1)
+
+    # Prompt history; 0 messages leaves history to the integration
+    context_max_messages: int = Field(20, ge=0)
+    context_token_budget: int = Field(4000, ge=1)
+    context_summary: bool = False
+    # Dropped messages are summarized in segments of this many; versions kept per conversation
+    context_summary_segment: int = Field(10, ge=1)
+    context_summary_versions: int = Field(10, ge=1)
+
+    title_queue_size: int = Field(1000, ge=1)
+    title_queue_workers: int = Field(2, ge=1)
+    title_queue_attempts: int = Field(3, ge=1)
+
+    # Batch jobs: workers per process, seconds an item is held before others may retry it
+    batch_concurrency: int = Field(4, ge=1)
+    batch_lease: float = Field(300, gt=0)
+    batch_max_attempts: int = Field(3, ge=1)
+    batch_max_items: int = Field(100000, ge=1)
+    batch_retention: float = Field(7 * 86400, gt=0)
+
+    export_batch_size: int = Field(100, ge=1)
+    import_chunk_size: int = Field(500, ge=1)
+
+    # Longest each startup warm-up step may take before the server gives up on it
+    startup_timeout: float = Field(30, gt=0)
+    # Seconds between retries of required warm-up steps that failed
+    startup_retry_interval: float = Field(5, gt=0)
+
+    @field_validator("llm_fallback_model", mode="before")
+    @classmethod
+    def empty_is_none(cls, value):
+        return value or None
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        values = {name: environ[name.upper()] for name in cls.model_fields if name.upper() in environ}
+        return cls(**values)
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Load .env and the environment once per process"""
+    load_dotenv(ROOT_DIR / '.env')
+    return Settings.from_env()
@@ -0,0 +1,190 @@
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class SharedState:
+    """Counters, locks and small cached values shared by the server's workers.
+
+    Every key carries a TTL so state left behind by a worker that died goes
+    away on its own. `shared` tells whether the state is visible to other
+    processes; components keep their own in-process bookkeeping when it is
+    not, since a second copy in memory would add nothing.
+    """
+
+    name = "base"
+    shared = False
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = 60) -> int:
+        """Add `amount` to a counter and return the new value; `ttl` starts when the counter is created"""
+        raise NotImplementedError
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        """Take the lock `key` for at most `ttl` seconds; returns a token for `release`, or None if it is held"""
+        raise NotImplementedError
+
+    async def release(self, key: str, token: str):
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def lock(self, key: str, ttl: float):
+        """Hold `key` while the block runs, without waiting; yields whether it was acquired"""
+        token = await self.acquire(key, ttl)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                await self.release(key, token)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "shared": self.shared}
+
+
+class MemoryState(SharedState):
+    """State in this process only; fine for a single worker"""
+
+    name = "memory"
+
+    def __init__(self):
+        # key -> (value, expires at on the monotonic clock)
+        self._entries: Dict[str, tuple] = {}
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    async def get(self, key: str) -> Any:
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (value, time.monotonic() + ttl)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = 60) -> int:
+        entry = self._live(key)
+        value = (entry[0] if entry else 0) + amount
+        self._entries[key] = (value, entry[1] if entry else time.monotonic() + ttl)
+        return value
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        if self._live(key):
+            return None
+        token = uuid.uuid4().hex
+        self._entries[key] = (token, time.monotonic() + ttl)
+        return token
+
+    async def release(self, key: str, token: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == token:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        return {**super().stats(), "keys": len(self._entries)}
+
+
+class MongoState(SharedState):
+    """State in a Mongo collection, shared by every worker without another service.
+
+    Documents are {_id, value, expires_at}. A TTL index on `expires_at`
+    removes expired keys eventually; reads filter on it as well, since the
+    TTL monitor only runs about once a minute.
+    """
+
+    name = "mongo"
+    shared = True
+
+    def __init__(self, collection):
+        self.collection = collection
+
+        # Metrics
+        self.operations = 0
+        self.lock_conflicts = 0
+
+    @staticmethod
+    def _expires(ttl: float) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=ttl)
+
+    async def _drop_expired(self, key: str):
+        await self.collection.delete_one({"_id": key, "expires_at": {"$lte": datetime.utcnow()}})
+
+    async def get(self, key: str) -> Any:
+        self.operations += 1
+        doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        return doc["value"] if doc else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self.operations += 1
+        await self.collection.update_one(
+            {"_id": key}, {"$set": {"value": value, "expires_at": self._expires(ttl)}}, upsert=True
+        )
+
+    async def delete(self, key: str):
+        self.operations += 1
+        await self.collection.delete_one({"_id": key})
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = 60) -> int:
+        self.operations += 1
+        await self._drop_expired(key)
+        update = {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": self._expires(ttl)}}
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker created the counter between our lookup and insert
+            doc = await self.collection.find_one_and_update(
+                {"_id": key}, update, return_document=ReturnDocument.AFTER
+            )
+        return doc["value"]
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        self.operations += 1
+        await self._drop_expired(key)
+        token = uuid.uuid4().hex
+        try:
+            await self.collection.insert_one({"_id": key, "value": token, "expires_at": self._expires(ttl)})
+        except DuplicateKeyError:
+            self.lock_conflicts += 1
+            return None
+        return token
+
+    async def release(self, key: str, token: str):
+        self.operations += 1
+        await self.collection.delete_one({"_id": key, "value": token})
+
+    def stats(self) -> dict:
+        return {**super().stats(), "operations": self.operations, "lock_conflicts": self.lock_conflicts}
+
+
+SHARED_STATES = {
+    "memory": lambda db: MemoryState(),
+    "mongo": lambda db: MongoState(db.shared_state),
+}
+
+
+def create_shared_state(name: str, db) -> SharedState:
+    """Build the shared state backend selected by name"""
+    try:
+        return SHARED_STATES[name](db)
+    except KeyError:
+        raise ValueError(f"Unknown shared state backend '{name}', expected one of {sorted(SHARED_STATES)}")
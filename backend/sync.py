@@ -0,0 +1,66 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from fast_json import FastJSONResponse, dumps
+
+
+def etag_for(body: bytes) -> str:
+    """Strong validator for a response body"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison, which per RFC 9110 ignores the weak prefix"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def conditional_json(request: Request, content: Any) -> Response:
+    """JSON response with an ETag, or an empty 304 when the client's copy is current
+
+    Cache-Control: no-cache lets browsers keep the body but revalidate it on
+    every request, so unchanged data costs a few hundred bytes per poll.
+    """
+    body = dumps(content)
+    etag = etag_for(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=FastJSONResponse.media_type, headers=headers)
+
+
+class TombstoneLog:
+    """Ids of deleted conversations, so delta syncs can tell clients to drop them.
+
+    Tombstones are kept for `ttl` and removed by a TTL index on `expires_at`;
+    a sync cursor older than that can no longer be answered as a delta and
+    the client has to reload the full list.
+    """
+
+    def __init__(self, collection, ttl: float = 7 * 86400):
+        self.collection = collection
+        self.ttl = ttl
+
+    def covers(self, since: datetime) -> bool:
+        """Whether every deletion after `since` is still on record"""
+        return since >= datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    async def record(self, conversation_id: str):
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"id": conversation_id},
+            {"$set": {"deleted_at": now, "expires_at": now + timedelta(seconds=self.ttl)}},
+            upsert=True
+        )
+
+    async def deleted_since(self, since: datetime) -> List[str]:
+        cursor = self.collection.find({"deleted_at": {"$gt": since}}, {"_id": 0, "id": 1})
+        return [doc["id"] async for doc in cursor]
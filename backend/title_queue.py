@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+TitleHandler = Callable[[str, str], Awaitable[None]]
+
+
+class TitleQueue:
+    """Bounded background queue that generates conversation titles.
+
+    Jobs are deduplicated per conversation: while a conversation has a title
+    job waiting or running, further submissions for it are ignored. Failed
+    jobs are retried with exponential backoff before being dropped.
+    """
+
+    def __init__(
+        self,
+        handler: TitleHandler,
+        maxsize: int = 1000,
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.maxsize = maxsize
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._pending: Dict[str, float] = {}
+        self._tasks = []
+        self._closing = False
+
+        # Metrics
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        """Start the worker tasks"""
+        if self._tasks:
+            return
+        self._closing = False
+        # Bind a fresh queue to the running loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._pending.clear()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"title-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    def submit(self, conversation_id: str, message: str) -> bool:
+        """Queue a title job; returns False if it was deduplicated or rejected"""
+        if self._closing:
+            self.rejected += 1
+            return False
+        if conversation_id in self._pending:
+            self.deduplicated += 1
+            return False
+        try:
+            self._queue.put_nowait((conversation_id, message))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"Title queue full, dropping title job for {conversation_id}")
+            return False
+        self._pending[conversation_id] = time.monotonic()
+        self.submitted += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            conversation_id, message = await self._queue.get()
+            try:
+                await self._run(conversation_id, message)
+            finally:
+                enqueued_at = self._pending.pop(conversation_id, None)
+                if enqueued_at is not None:
+                    latency = time.monotonic() - enqueued_at
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+                self._queue.task_done()
+
+    async def _run(self, conversation_id: str, message: str):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.handler(conversation_id, message)
+                self.completed += 1
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self.failed += 1
+                    logger.error(f"Title generation failed for {conversation_id} after {attempt} attempts: {str(e)}")
+                    return
+                self.retries += 1
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def drain(self, timeout: Optional[float] = 10.0):
+        """Stop accepting jobs, wait for queued ones to finish, then stop the workers"""
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Title queue drain timed out with {self._queue.qsize()} jobs left")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        """Queue depth, throughput counters and job latency in seconds"""
+        finished = self.completed + self.failed
+        return {
+            "depth": self._queue.qsize(),
+            "in_flight": len(self._pending) - self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "workers": len(self._tasks),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_avg": self.latency_total / finished if finished else 0.0,
+            "latency_max": self.latency_max,
+        }
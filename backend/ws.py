@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import math
+from contextlib import suppress
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from starlette.exceptions import HTTPException
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from admission import AdmissionRejected
+from fast_json import dumps
+from pubsub import LIST_TOPIC, PubSub, conversation_topic
+from resilience import CircuitOpen
+
+
+logger = logging.getLogger(__name__)
+
+# Starts a streamed turn from a "send" frame: (conversation_id, user_message, queue of
+# ("delta", text) ending with ("done", ai_message or None) or ("error", exception))
+StartTurn = Callable[[dict], Awaitable[Tuple[str, dict, asyncio.Queue]]]
+
+# Close code for a client that stopped reading; it may reconnect and resync
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+def error_frame(exc: Exception, request_id: Optional[str] = None) -> dict:
+    """The error frame for a failed send, with the status the HTTP endpoints would use"""
+    frame = {"type": "error", "request_id": request_id}
+    if isinstance(exc, HTTPException):
+        return {**frame, "status": exc.status_code, "detail": exc.detail}
+    if isinstance(exc, AdmissionRejected):
+        return {**frame, "status": 429, "detail": str(exc), "retry_after": math.ceil(exc.retry_after)}
+    if isinstance(exc, CircuitOpen):
+        return {**frame, "status": 503, "detail": str(exc), "retry_after": math.ceil(exc.retry_after)}
+    if isinstance(exc, ValueError):
+        return {**frame, "status": 422, "detail": str(exc).splitlines()[0]}
+    return {**frame, "status": 500, "detail": f"Error processing message: {str(exc)}"}
+
+
+class ChatChannel:
+    """Serves /api/ws connections: several conversations over one socket.
+
+    Client frames are JSON objects with a "type":
+
+    - send: {"request_id", "message", "conversation_id"?, "title"?} starts a
+      streamed turn, answered with start, delta... and done frames tagged
+      with the same request_id. Any number of turns, up to `max_streams`,
+      can run at once on one connection.
+    - subscribe / unsubscribe: {"conversation_ids": [...], "list": bool}
+      picks the conversations whose conversation.updated and
+      conversation.deleted events are forwarded; "list" is every
+      conversation, for the sidebar.
+    - ping: answered with pong.
+
+    Everything to the client goes through one bounded queue of
+    `queue_size` frames. When the client reads slowly, streams merge their
+    pending deltas into fewer, larger frames, and events that do not fit
+    are dropped in favour of a single resync frame, after which the client
+    reloads with ?since=. A client that takes longer than `send_timeout` to
+    accept a frame is disconnected.
+    """
+
+    def __init__(
+        self,
+        pubsub: PubSub,
+        max_streams: int = 8,
+        queue_size: int = 256,
+        send_timeout: float = 10,
+    ):
+        self.pubsub = pubsub
+        self.max_streams = max_streams
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+
+        # Metrics
+        self.connections = 0
+        self.connected = 0
+        self.frames_sent = 0
+        self.deltas_merged = 0
+        self.resyncs = 0
+        self.slow_disconnects = 0
+
+    async def serve(self, websocket: WebSocket, start_turn: StartTurn):
+        """Run one connection until either side closes it"""
+        await websocket.accept()
+        connection = ChatConnection(self, websocket, start_turn)
+        self.connections += 1
+        self.connected += 1
+        try:
+            await connection.run()
+        finally:
+            self.connected -= 1
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "connections": self.connections,
+            "frames_sent": self.frames_sent,
+            "deltas_merged": self.deltas_merged,
+            "resyncs": self.resyncs,
+            "slow_disconnects": self.slow_disconnects,
+        }
+
+
+class ChatConnection:
+    """State of one socket: its outbound queue, subscription and running streams"""
+
+    def __init__(self, channel: ChatChannel, websocket: WebSocket, start_turn: StartTurn):
+        self.channel = channel
+        self.websocket = websocket
+        self.start_turn = start_turn
+        self.outbound: asyncio.Queue = asyncio.Queue(maxsize=channel.queue_size)
+        self.subscription = channel.pubsub.subscription(channel.queue_size)
+        self.streams: Set[asyncio.Task] = set()
+
+    async def run(self):
+        reader = asyncio.create_task(self._read())
+        writer = asyncio.create_task(self._write())
+        events = asyncio.create_task(self._relay_events())
+        try:
+            done, _ = await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+            if writer in done and isinstance(writer.exception(), asyncio.TimeoutError):
+                self.channel.slow_disconnects += 1
+                with suppress(Exception):
+                    await asyncio.wait_for(self.websocket.close(CLOSE_TRY_AGAIN_LATER), 1)
+        finally:
+            self.subscription.close()
+            # Turns already started keep running and are stored; only their frames stop
+            tasks = [reader, writer, events, *self.streams]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def put(self, frame: dict):
+        """Queue a frame for the client, waiting while the queue is full"""
+        await self.outbound.put(frame)
+
+    async def _write(self):
+        while True:
+            frame = await self.outbound.get()
+            await asyncio.wait_for(self.websocket.send_text(dumps(frame).decode()), self.channel.send_timeout)
+            self.channel.frames_sent += 1
+
+    async def _read(self):
+        with suppress(WebSocketDisconnect):
+            while True:
+                text = await self.websocket.receive_text()
+                try:
+                    frame = json.loads(text)
+                    kind = frame.get("type")
+                except (ValueError, AttributeError):
+                    await self.put({"type": "error", "status": 400, "detail": "Frames must be JSON objects"})
+                    continue
+
+                if kind == "send":
+                    await self._send(frame)
+                elif kind in ("subscribe", "unsubscribe"):
+                    topics = [conversation_topic(str(conversation_id)) for conversation_id in frame.get("conversation_ids") or []]
+                    if frame.get("list"):
+                        topics.append(LIST_TOPIC)
+                    if kind == "subscribe":
+                        self.subscription.subscribe(*topics)
+                    else:
+                        self.subscription.unsubscribe(*topics)
+                elif kind == "ping":
+                    await self.put({"type": "pong"})
+                else:
+                    await self.put({"type": "error", "status": 400, "detail": f"Unknown frame type {kind!r}"})
+
+    async def _send(self, frame: dict):
+        request_id = frame.get("request_id")
+        if len(self.streams) >= self.channel.max_streams:
+            await self.put({
+                "type": "error", "request_id": request_id, "status": 429,
+                "detail": f"At most {self.channel.max_streams} turns can stream on one connection"
+            })
+            return
+        task = asyncio.create_task(self._stream(request_id, frame))
+        self.streams.add(task)
+        task.add_done_callback(self.streams.discard)
+
+    async def _stream(self, request_id: Optional[str], frame: dict):
+        try:
+            conversation_id, user_message, queue = await self.start_turn(frame)
+        except Exception as e:
+            await self.put(error_frame(e, request_id))
+            return
+
+        tag = {"request_id": request_id, "conversation_id": conversation_id}
+        await self.put({"type": "start", **tag, "user_message": user_message})
+        pending = None
+        while True:
+            kind, payload = pending or await queue.get()
+            pending = None
+            if kind == "delta":
+                # Merge whatever arrived while the client was catching up
+                parts = [payload]
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    if item[0] != "delta":
+                        pending = item
+                        break
+                    parts.append(item[1])
+                self.channel.deltas_merged += len(parts) - 1
+                await self.put({"type": "delta", **tag, "content": "".join(parts)})
+            elif kind == "error":
+                await self.put({**error_frame(payload, request_id), **tag})
+                return
+            else:
+                await self.put({"type": "done", **tag, "ai_message": jsonable_encoder(payload)})
+                return
+
+    async def _relay_events(self):
+        while True:
+            event = await self.subscription.get()
+            if self.subscription.lagged:
+                self.subscription.clear()
+                self.channel.resyncs += 1
+                await self.put({"type": "resync"})
+                continue
+            await self.put(event)
@@ -79,11 +79,11 @@ class BackendTester:
             
             if response.status_code == 200:
                 data = response.json()
-                if isinstance(data, list):
-                    self.log_test("Get Conversations (Empty)", True, f"Returned {len(data)} conversations")
+                if isinstance(data, dict) and isinstance(data.get('conversations'), list) and 'next_cursor' in data:
+                    self.log_test("Get Conversations (Empty)", True, f"Returned {len(data['conversations'])} conversations")
                     return True
                 else:
-                    self.log_test("Get Conversations (Empty)", False, f"Expected list, got: {type(data)}")
+                    self.log_test("Get Conversations (Empty)", False, f"Expected a page with conversations and next_cursor, got: {data}")
                     return False
             else:
                 self.log_test("Get Conversations (Empty)", False, f"HTTP {response.status_code}: {response.text}")
@@ -270,7 +270,8 @@ class BackendTester:
     def test_get_conversations_with_data(self):
         """Test 6: Get conversations (should now have data)"""
         try:
-            response = self.session.get(f"{API_URL}/conversations")
+            # full=true returns whole conversations, messages included, as a plain list
+            response = self.session.get(f"{API_URL}/conversations", params={"full": "true"})
             
             if response.status_code == 200:
                 data = response.json()
@@ -34,13 +34,13 @@ const API = `${BACKEND_URL}/api`;
 
 // API Functions
 const api = {
-  async getConversations() {
+  async getConversations(cursor = null) {
     try {
-      const response = await axios.get(`${API}/conversations`);
+      const response = await axios.get(`${API}/conversations`, { params: cursor ? { cursor } : {} });
       return response.data;
     } catch (error) {
       console.error('Error fetching conversations:', error);
-      return [];
+      return { conversations: [], next_cursor: null };
     }
   },
 
@@ -55,12 +55,25 @@ const api = {
   },
 
   async sendMessage(conversationId, message, title = null) {
+    // Same key on the retry, so the server replays the first reply instead of answering twice
+    const idempotencyKey = window.crypto?.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    const payload = {
+      conversation_id: conversationId,
+      message,
+      title
+    };
+    const config = { headers: { 'Idempotency-Key': idempotencyKey } };
     try {
-      const response = await axios.post(`${API}/chat/send`, {
-        conversation_id: conversationId,
-        message,
-        title
-      });
+      let response;
+      try {
+        response = await axios.post(`${API}/chat/send`, payload, config);
+      } catch (error) {
+        // Retry once when the request never got an answer, e.g. a dropped connection
+        if (error.response) throw error;
+        response = await axios.post(`${API}/chat/send`, payload, config);
+      }
       return response.data;
     } catch (error) {
       console.error('Error sending message:', error);
@@ -86,6 +99,9 @@ export const Sidebar = ({
   onSelectConversation, 
   onNewChat, 
   onDeleteConversation,
+  onLoadMore,
+  hasMore,
+  loadingMore,
   darkMode, 
   toggleDarkMode,
   sidebarOpen,
@@ -112,6 +128,11 @@ export const Sidebar = ({
   };
 
   const getLastMessage = (conversation) => {
+    if (conversation.last_message) {
+      return conversation.last_message.length > 50
+        ? conversation.last_message.substring(0, 50) + '...'
+        : conversation.last_message;
+    }
     if (conversation.messages && conversation.messages.length > 0) {
       const lastMessage = conversation.messages[conversation.messages.length - 1];
       return lastMessage.content.length > 50 
@@ -121,6 +142,14 @@ export const Sidebar = ({
     return 'No messages';
   };
 
+  // Fetch the next page when the list is scrolled near its end
+  const handleScroll = (e) => {
+    const { scrollTop, scrollHeight, clientHeight } = e.currentTarget;
+    if (hasMore && !loadingMore && scrollHeight - scrollTop - clientHeight < 200) {
+      onLoadMore();
+    }
+  };
+
   const handleDeleteConversation = async (e, conversationId) => {
     e.stopPropagation();
     if (window.confirm('Delete this conversation?')) {
@@ -188,7 +217,7 @@ export const Sidebar = ({
       </div>
 
       {/* Conversations */}
-      <div className="flex-1 overflow-y-auto px-4 pb-4">
+      <div className="flex-1 overflow-y-auto px-4 pb-4" onScroll={handleScroll}>
         {filteredConversations.length === 0 ? (
           <div className={`text-center py-8 ${darkMode ? 'text-gray-400' : 'text-gray-500'}`}>
             <MessageSquare className="w-8 h-8 mx-auto mb-2 opacity-50" />
@@ -246,6 +275,15 @@ export const Sidebar = ({
             ))}
           </div>
         )}
+        {hasMore && (
+          <button
+            onClick={onLoadMore}
+            disabled={loadingMore}
+            className={`w-full mt-2 py-2 text-sm rounded-lg ${darkMode ? 'text-gray-400 hover:bg-gray-800' : 'text-gray-500 hover:bg-gray-50'} transition-colors`}
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
 
       {/* Footer */}
@@ -648,6 +686,8 @@ export const ChatApp = () => {
   const [isTyping, setIsTyping] = useState(false);
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // Load conversations on component mount
   useEffect(() => {
@@ -657,8 +697,9 @@ export const ChatApp = () => {
   const loadConversations = async () => {
     try {
       setLoading(true);
-      const convs = await api.getConversations();
-      setConversations(convs);
+      const page = await api.getConversations();
+      setConversations(page.conversations);
+      setNextCursor(page.next_cursor);
     } catch (error) {
       console.error('Error loading conversations:', error);
     } finally {
@@ -666,6 +707,24 @@ export const ChatApp = () => {
     }
   };
 
+  const loadMoreConversations = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const page = await api.getConversations(nextCursor);
+      // A conversation updated since the first page may show up again further down
+      setConversations(convs => {
+        const seen = new Set(convs.map(conv => conv.id));
+        return [...convs, ...page.conversations.filter(conv => !seen.has(conv.id))];
+      });
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error('Error loading more conversations:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const toggleDarkMode = () => {
     setDarkMode(!darkMode);
   };
@@ -723,7 +782,7 @@ export const ChatApp = () => {
         
         setConversations(conversations.map(conv => 
           conv.id === currentConversation.id 
-            ? { ...conv, updated_at: updatedConversation.updated_at }
+            ? { ...conv, updated_at: updatedConversation.updated_at, last_message: response.ai_message.content }
             : conv
         ));
       } else {
@@ -772,6 +831,9 @@ export const ChatApp = () => {
         onSelectConversation={handleSelectConversation}
         onNewChat={handleNewChat}
         onDeleteConversation={handleDeleteConversation}
+        onLoadMore={loadMoreConversations}
+        hasMore={Boolean(nextCursor)}
+        loadingMore={loadingMore}
         darkMode={darkMode}
         toggleDarkMode={toggleDarkMode}
         sidebarOpen={sidebarOpen}
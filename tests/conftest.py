@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import fake_llm  # noqa: E402
+
+# Before anything imports the LLM integration
+fake_llm.install(latency=0, tokens_per_second=0)
+
+SETTINGS = ("latency", "tokens_per_second", "response_tokens", "failure_rate", "hang_rate", "model_failure_rates")
+
+
+@pytest.fixture(autouse=True)
+def fake_chat():
+    """FakeLlmChat with instant answers; settings changed by a test are put back afterwards"""
+    chat = fake_llm.FakeLlmChat
+    saved = {name: getattr(chat, name) for name in SETTINGS}
+    chat.configure(latency=0, tokens_per_second=0, failure_rate=0.0, hang_rate=0.0, model_failure_rates={})
+    chat.calls = 0
+    yield chat
+    chat.configure(**saved)
+
+
+@pytest.fixture(scope="session")
+def server():
+    """server.py on mongomock, imported once; its module-level state is shared by the tests"""
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    os.environ.update({"MONGO_URL": "mongodb://tests", "DB_NAME": "tests", "SEARCH_BACKEND": "memory"})
+    import server
+    return server
+
+
+@pytest.fixture
+def client(server):
+    """A started app over an empty database"""
+    from fastapi.testclient import TestClient
+
+    async def clear():
+        for name in await server.db.list_collection_names():
+            await server.db[name].delete_many({})
+
+    asyncio.run(clear())
+    for conversation_id in list(getattr(server.search_backend, "documents", ())):
+        server.search_backend.remove(conversation_id)
+    with TestClient(server.app) as client:
+        yield client
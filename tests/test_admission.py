@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, TokenBucket, current_client
+from llm_pool import LlmClientPool
+
+
+def test_per_client_limit_leaves_room_for_other_clients():
+    async def run():
+        controller = AdmissionController(max_concurrency=4, per_client=1, queue_timeout=0.05)
+        first = await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as raised:
+            await controller.acquire("a")
+        other = await controller.acquire("b")
+        return controller, raised.value, first, other
+
+    controller, rejected, first, other = asyncio.run(run())
+    assert rejected.reason == "client_busy"
+    assert rejected.retry_after >= 1
+    assert controller.in_flight == 2
+    first.release()
+    other.release()
+    assert controller.stats()["clients"] == 0
+    assert controller.in_flight == 0
+
+
+def test_waiter_is_admitted_when_a_slot_frees_up():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, queue_timeout=1)
+        first = await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0.01)
+        assert controller.waiting == 1
+        first.release()
+        second = await waiter
+        second.release()
+        return controller
+
+    controller = asyncio.run(run())
+    assert controller.admitted == 2
+    assert controller.waiting == 0
+    assert controller.rejected == 0
+
+
+def test_full_queue_rejects_instead_of_waiting():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1)
+        ticket = await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as raised:
+            await controller.acquire("b")
+        ticket.release()
+        return raised.value
+
+    assert asyncio.run(run()).reason == "queue_full"
+
+
+def test_rate_limit_rejects_with_the_time_until_quota_is_back():
+    async def run():
+        controller = AdmissionController(requests_per_minute=1, queue_timeout=1)
+        (await controller.acquire("a")).release()
+        with pytest.raises(AdmissionRejected) as raised:
+            await controller.acquire("a")
+        return raised.value
+
+    rejected = asyncio.run(run())
+    assert rejected.reason == "rate_limited"
+    assert 50 < rejected.retry_after <= 60
+
+
+def test_token_bucket_debit_refund_and_consume():
+    bucket = TokenBucket(per_minute=600)
+    assert bucket.reserve(600) == 0
+    assert bucket.reserve(60) == pytest.approx(6, abs=0.1)
+    bucket.refund(60)
+    assert bucket.level == pytest.approx(0, abs=1)
+    bucket.consume(60)
+    assert bucket.reserve(0) == 0
+    assert TokenBucket(per_minute=0).reserve(10 ** 6) == 0
+
+
+def test_ticket_release_is_idempotent():
+    async def run():
+        controller = AdmissionController(max_concurrency=1)
+        ticket = await controller.acquire("a")
+        ticket.release()
+        ticket.release()
+        (await asyncio.wait_for(controller.acquire("a"), 1)).release()
+        return controller
+
+    assert asyncio.run(run()).in_flight == 0
+
+
+def test_pool_admits_calls_for_the_current_client():
+    async def run():
+        pool = LlmClientPool("test-key")
+        pool.admission = AdmissionController(per_client=1, queue_timeout=0.05)
+        pool.admission.start()
+        current_client.set("ip:10.0.0.1")
+        async with pool.slot("hello"):
+            with pytest.raises(AdmissionRejected):
+                await pool.admit("hello")
+            # Background work has no client and only takes a global slot
+            current_client.set(None)
+            (await pool.admit("hello")).release()
+        return pool.admission
+
+    admission = asyncio.run(run())
+    assert admission.admitted == 2
+    assert admission.rejected == 1
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from archive import Archiver, CollectionArchive
+from indexes import ensure_indexes
+from message_store import create_message_store
+
+
+def conversation(conversation_id="c1", count=2) -> dict:
+    idle = datetime.utcnow() - timedelta(days=30)
+    return {
+        "id": conversation_id,
+        "title": "Test",
+        "created_at": idle,
+        "updated_at": idle,
+        "messages": [{"id": f"m{i}", "role": "user", "content": f"message {i}"} for i in range(count)],
+    }
+
+
+@pytest.fixture(params=["embedded", "collection"])
+def store(request):
+    db = AsyncMongoMockClient().test
+    asyncio.run(ensure_indexes(db))
+    return create_message_store(request.param, db)
+
+
+def workers(store, count=2):
+    """Archivers of separate processes sharing one database"""
+    backend = CollectionArchive(store.db.conversation_archive)
+    return [Archiver(store, backend, idle_days=1) for _ in range(count)]
+
+
+async def stub(store, conversation_id="c1") -> dict:
+    return await store.db.conversations.find_one({"id": conversation_id})
+
+
+def test_cached_copy_is_served_while_the_stub_is_unchanged(store):
+    (archiver,) = workers(store, 1)
+
+    async def run():
+        await store.create_conversation(conversation())
+        assert await archiver.archive("c1")
+        archived_at = (await stub(store))["archived_at"]
+        first = await archiver.load("c1", archived_at)
+        second = await archiver.load("c1", archived_at)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert second is first
+    assert len(first["messages"]) == 2
+    assert archiver.reads == 2 and archiver.cache_hits == 1
+
+
+def test_copy_rearchived_by_another_worker_is_read_again(store):
+    reader, writer = workers(store)
+
+    async def run():
+        await store.create_conversation(conversation())
+        assert await writer.archive("c1")
+        stale = await reader.load("c1", (await stub(store))["archived_at"])
+
+        # Another worker takes a new turn and archives the conversation again
+        assert await writer.restore("c1")
+        await store.append_messages("c1", [{"id": "m2", "role": "user", "content": "later"}])
+        await store.db.conversations.update_one({"id": "c1"}, {"$set": {"updated_at": datetime.utcnow() - timedelta(days=2)}})
+        await asyncio.sleep(0.002)
+        assert await writer.archive("c1")
+
+        return stale, await reader.load("c1", (await stub(store))["archived_at"])
+
+    stale, fresh = asyncio.run(run())
+    assert len(stale["messages"]) == 2
+    assert [message["id"] for message in fresh["messages"]] == ["m0", "m1", "m2"]
+    assert reader.cache_hits == 0
+
@@ -0,0 +1,188 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from admission import AdmissionRejected
+from batch import BatchItem, BatchRunner
+from indexes import ensure_indexes
+
+
+@pytest.fixture
+def db():
+    db = AsyncMongoMockClient().test
+    asyncio.run(ensure_indexes(db))
+    return db
+
+
+def runner(db, complete=None, **options) -> BatchRunner:
+    async def echo(session_id, system_message, message):
+        return f"re: {message}"
+
+    return BatchRunner(db.batch_jobs, db.batch_items, complete or echo, poll_interval=0.01, **options)
+
+
+async def submit(runner: BatchRunner, *messages) -> str:
+    job_id = await runner.create_job()
+    await runner.add_items(job_id, 0, [BatchItem(message=message) for message in messages])
+    await runner.open_job(job_id, len(messages))
+    return job_id
+
+
+async def finished(runner: BatchRunner, job_id: str) -> dict:
+    for _ in range(500):
+        job = await runner.get_job(job_id)
+        if job["status"] == "completed":
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_a_claimed_item_is_leased_to_one_worker(db):
+    first, second = runner(db), runner(db)
+
+    async def run():
+        await submit(first, "hello")
+        return await first._claim(), await second._claim()
+
+    claimed, other = asyncio.run(run())
+    assert claimed["status"] == "running"
+    assert claimed["attempts"] == 1
+    assert claimed["lease_until"] > datetime.utcnow()
+    assert other is None
+
+
+def test_an_expired_lease_is_claimed_again(db):
+    first, second = runner(db), runner(db)
+
+    async def run():
+        job_id = await submit(first, "hello")
+        stale = await first._claim()
+        # The first worker died holding the item
+        await db.batch_items.update_one({"_id": stale["_id"]}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+        retried = await second._claim()
+        await second._run(retried)
+        # A late result from the first worker does not count twice
+        await first._finish(stale, response="late")
+        return retried, await first.get_job(job_id), await db.batch_items.find_one({"_id": stale["_id"]})
+
+    retried, job, item = asyncio.run(run())
+    assert retried["attempts"] == 2
+    assert job["status"] == "completed"
+    assert job["completed"] == 1
+    assert item["response"] == "re: hello"
+
+
+def test_items_past_max_attempts_are_given_up(db):
+    batch = runner(db, max_attempts=1)
+
+    async def run():
+        job_id = await submit(batch, "hello")
+        for _ in range(2):
+            item = await batch._claim()
+            await db.batch_items.update_one({"_id": item["_id"]}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+        await batch._run(item)
+        return await batch.get_job(job_id), await db.batch_items.find_one({"_id": item["_id"]})
+
+    job, item = asyncio.run(run())
+    assert job["status"] == "completed" and job["failed"] == 1
+    assert item["error"] == "Gave up after 1 attempts"
+
+
+def test_stop_hands_unfinished_items_back_for_the_next_start(db):
+    blocked = asyncio.Event()
+
+    async def hang(session_id, system_message, message):
+        blocked.set()
+        await asyncio.sleep(10)
+
+    async def run():
+        stopping = runner(db, hang, concurrency=1)
+        stopping.start()
+        job_id = await submit(stopping, "hello")
+        await asyncio.wait_for(blocked.wait(), 1)
+        await stopping.stop()
+        handed_back = await db.batch_items.find_one({})
+
+        resumed = runner(db)
+        resumed.start()
+        try:
+            job = await finished(resumed, job_id)
+        finally:
+            await resumed.stop()
+        return handed_back, job, await db.batch_items.find_one({})
+
+    handed_back, job, item = asyncio.run(run())
+    assert handed_back["status"] == "pending"
+    assert handed_back["attempts"] == 0
+    assert "lease_until" not in handed_back
+    assert job["completed"] == 1
+    assert item["attempts"] == 1
+    assert item["response"] == "re: hello"
+
+
+def test_rejected_calls_are_deferred_without_using_an_attempt(db):
+    calls = []
+
+    async def busy_once(session_id, system_message, message):
+        calls.append(message)
+        if len(calls) == 1:
+            raise AdmissionRejected("concurrency", 0)
+        return "done"
+
+    batch = runner(db, busy_once, max_attempts=1)
+
+    async def run():
+        job_id = await submit(batch, "hello")
+        await batch._run(await batch._claim())
+        deferred = await db.batch_items.find_one({})
+        await batch._run(await batch._claim())
+        return deferred, await batch.get_job(job_id)
+
+    deferred, job = asyncio.run(run())
+    assert deferred["status"] == "pending"
+    assert deferred["attempts"] == 0
+    assert batch.deferred == 1
+    assert job["status"] == "completed" and job["completed"] == 1
+    assert calls == ["hello", "hello"]
+
+
+def test_a_job_whose_items_finished_during_the_upload_finishes_on_open(db):
+    batch = runner(db)
+
+    async def run():
+        job_id = await batch.create_job()
+        await batch.add_items(job_id, 0, [BatchItem(message="a"), BatchItem(message="b")])
+        for _ in range(2):
+            await batch._run(await batch._claim())
+        receiving = await batch.get_job(job_id)
+        await batch.open_job(job_id, 2)
+        return receiving, await batch.get_job(job_id)
+
+    receiving, job = asyncio.run(run())
+    assert receiving["status"] == "receiving"
+    assert job["status"] == "completed" and job["completed"] == 2
+    assert job["expires_at"] > datetime.utcnow()
+
+
+def test_a_job_finishes_once_when_finishers_race(db):
+    batch = runner(db)
+    expired = []
+
+    async def record_expire(job_id):
+        expired.append(job_id)
+
+    batch._expire = record_expire
+
+    async def run():
+        job_id = await batch.create_job()
+        await db.batch_jobs.update_one({"id": job_id}, {"$set": {"status": "running", "total": 2, "completed": 2}})
+        # Both finishers read the job after the last result was counted
+        job = await batch.get_job(job_id)
+        await asyncio.gather(batch._maybe_finish(job), batch._maybe_finish(job))
+        return job_id, await batch.get_job(job_id)
+
+    job_id, job = asyncio.run(run())
+    assert job["status"] == "completed"
+    assert expired == [job_id]
@@ -0,0 +1,50 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+
+def test_cursor_round_trips_to_the_next_page_filter(server):
+    updated_at = datetime(2024, 5, 1, 12, 30, 15, 123000)
+    cursor = server.encode_cursor({"id": "c7", "updated_at": updated_at, "title": "ignored"})
+
+    assert server.decode_cursor(cursor) == {
+        "$or": [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "id": {"$lt": "c7"}},
+        ]
+    }
+
+
+@pytest.mark.parametrize("payload", [b"not json", b'{"id": "c1"}', b'{"u": "yesterday", "id": "c1"}', b"[]"])
+def test_malformed_cursors_are_rejected(server, payload):
+    with pytest.raises(HTTPException) as raised:
+        server.decode_cursor(base64.urlsafe_b64encode(payload).decode())
+    assert raised.value.status_code == 400
+
+
+def test_invalid_cursor_is_a_400(client):
+    assert client.get("/api/conversations", params={"cursor": "%%%"}).status_code == 400
+
+
+def test_keyset_pages_cover_conversations_sharing_a_timestamp(server, client):
+    now = datetime.utcnow().replace(microsecond=0)
+    # Five conversations updated in the same instant, between a newer and an older one
+    times = {"newest": now + timedelta(seconds=1), "oldest": now - timedelta(seconds=1)}
+    times.update({f"same{i}": now for i in range(5)})
+    for conversation_id, updated_at in times.items():
+        client.portal.call(server.message_store.create_conversation, {
+            "id": conversation_id, "title": conversation_id, "created_at": updated_at, "updated_at": updated_at, "messages": []
+        })
+
+    seen, cursor = [], None
+    for _ in range(len(times)):
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/conversations", params=params).json()
+        seen += [conversation["id"] for conversation in page["conversations"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == ["newest", "same4", "same3", "same2", "same1", "same0", "oldest"]
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from health import StartupTracker
+
+
+def flaky(failures: int):
+    """Warm-up work that fails `failures` times, then succeeds"""
+    calls = []
+
+    async def work():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ConnectionError("connection refused")
+
+    return work, calls
+
+
+def test_ready_once_every_required_step_succeeded():
+    async def run():
+        tracker = StartupTracker()
+        optional, _ = flaky(10)
+        await tracker.step("mongo", flaky(0)[0], 1)
+        await tracker.step("extra", optional, 1, required=False)
+        assert not tracker.ready
+        tracker.finish(time.perf_counter())
+        ready = tracker.ready
+        await tracker.stop()
+        return tracker, ready
+
+    tracker, ready = asyncio.run(run())
+    assert ready
+    assert tracker.steps["extra"]["error"] == "connection refused"
+
+
+def test_failed_required_step_is_retried_until_ready():
+    work, calls = flaky(2)
+
+    async def run():
+        tracker = StartupTracker(retry_interval=0.01)
+        await tracker.step("mongo", work, 1)
+        tracker.finish(time.perf_counter())
+        assert not tracker.ready
+        for _ in range(100):
+            if tracker.ready:
+                break
+            await asyncio.sleep(0.01)
+        await tracker.stop()
+        return tracker
+
+    tracker = asyncio.run(run())
+    assert tracker.ready
+    assert len(calls) == 3
+    assert tracker.steps["mongo"]["attempts"] == 3
+    assert tracker.steps["mongo"]["error"] is None
+
+
+def test_timed_out_step_is_retried():
+    attempts = []
+
+    async def work():
+        attempts.append(1)
+        if len(attempts) == 1:
+            await asyncio.sleep(10)
+
+    async def run():
+        tracker = StartupTracker(retry_interval=0.01)
+        assert not await tracker.step("llm", work, 0.01)
+        tracker.finish(time.perf_counter())
+        for _ in range(100):
+            if tracker.ready:
+                break
+            await asyncio.sleep(0.01)
+        await tracker.stop()
+        return tracker.ready
+
+    assert asyncio.run(run())
+
+
+def test_server_warms_up_and_reports_ready(client):
+    response = client.get("/api/health/ready")
+    assert response.status_code == 200
+    assert response.json()["steps"]["mongo"]["ok"]
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from idempotency import IdempotencyStore, KeyInProgress, KeyReused, SingleFlight, fingerprint
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": len(calls)}
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.run("key", work) for _ in range(5)))
+        again = await flight.run("key", work)
+        return flight, results, again
+
+    flight, results, again = asyncio.run(run())
+    assert results == [{"answer": 1}] * 5
+    assert results[0] is results[4]
+    # Once the call finished the key is free, so a later caller starts anew
+    assert again == {"answer": 2}
+    assert flight.stats() == {"in_flight": 0, "leaders": 2, "followers": 4}
+
+
+def test_single_flight_keys_are_independent():
+    async def run():
+        flight = SingleFlight()
+
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.run("a", lambda: work("a")), flight.run("b", lambda: work("b")))
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_single_flight_shares_the_error():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("provider down")
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(flight.run("key", fail), flight.run("key", fail), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, ValueError) and first is second
+
+
+def test_single_flight_outlives_a_cancelled_caller():
+    async def run():
+        flight = SingleFlight()
+        finished = asyncio.Event()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            finished.set()
+            return "done"
+
+        leader = asyncio.create_task(flight.run("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.run("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, finished.is_set()
+
+    assert asyncio.run(run()) == ("done", True)
+
+
+def test_fingerprint_depends_on_every_part():
+    assert fingerprint("c1", "hello", None) == fingerprint("c1", "hello", None)
+    assert fingerprint("c1", "hello", None) != fingerprint("c1", "hello", "title")
+    assert fingerprint("c1", "hello", None) != fingerprint("c2", "hello", None)
+
+
+@pytest.fixture
+def store():
+    return IdempotencyStore(AsyncMongoMockClient().test.idempotency_keys)
+
+
+def test_completed_key_replays_the_stored_response(store):
+    async def run():
+        assert await store.claim("client:key", "hash") is None
+        await store.complete("client:key", {"reply": "hi"})
+        return await store.claim("client:key", "hash")
+
+    assert asyncio.run(run()) == {"reply": "hi"}
+    assert store.claimed == 1
+    assert store.replayed == 1
+
+
+def test_key_in_progress_and_reused_keys_are_refused(store):
+    async def run():
+        await store.claim("client:key", "hash")
+        with pytest.raises(KeyInProgress):
+            await store.claim("client:key", "hash")
+        with pytest.raises(KeyReused):
+            await store.claim("client:key", "other-hash")
+
+    asyncio.run(run())
+    assert store.conflicts == 2
+
+
+def test_released_key_can_be_claimed_again(store):
+    async def run():
+        await store.claim("client:key", "hash")
+        await store.release("client:key")
+        return await store.claim("client:key", "hash")
+
+    assert asyncio.run(run()) is None
+    assert store.claimed == 2
+
+
+def test_expired_pending_claim_is_taken_over(store):
+    store.pending_ttl = -1
+
+    async def run():
+        await store.claim("client:key", "hash")
+        return await store.claim("client:key", "hash")
+
+    assert asyncio.run(run()) is None
+    assert store.claimed == 2
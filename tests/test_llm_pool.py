@@ -0,0 +1,52 @@
+from llm_pool import LlmClientPool
+
+
+def test_cached_clients_are_reused_per_session():
+    pool = LlmClientPool("test-key", max_clients=2)
+    first = pool.get("s1", "system")
+    assert pool.get("s1", "system") is first
+    assert pool.get("s1", "other system") is not first
+
+    pool.get("s2", "system")
+    assert pool.get("s1", "system") is not first
+    assert pool.stats()["evicted"] == 2
+
+
+def test_uncached_clients_are_always_new_and_not_kept():
+    pool = LlmClientPool("test-key")
+    cached = pool.get("s1", "system")
+    fresh = pool.get("s1", "system", cache=False)
+
+    assert fresh is not cached
+    assert fresh.session_id == "s1"
+    assert pool.stats()["clients"] == 1
+
+
+def chat(client, conversation_id=None, message="Tell me more"):
+    response = client.post("/api/chat/send", json={"conversation_id": conversation_id, "message": message})
+    assert response.status_code == 200
+    return response.json()["conversation_id"]
+
+
+def test_context_built_turns_leave_no_clients_behind(server, client):
+    before = server.llm_pool.stats()
+    conversation_id = chat(client, message="Hello there")
+    for _ in range(3):
+        chat(client, conversation_id)
+
+    stats = server.llm_pool.stats()
+    assert server.context_builder.enabled
+    assert stats["clients"] == before["clients"]
+    assert stats["reused"] == before["reused"]
+
+
+def test_integration_history_reuses_the_conversation_client(server, client, monkeypatch):
+    monkeypatch.setattr(server.context_builder, "max_messages", 0)
+    before = server.llm_pool.stats()
+    conversation_id = chat(client, message="Hello there, integration")
+    for _ in range(3):
+        chat(client, conversation_id)
+
+    stats = server.llm_pool.stats()
+    assert stats["clients"] == before["clients"] + 1
+    assert stats["reused"] == before["reused"] + 3
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from archive import window
+from indexes import ensure_indexes
+from message_store import PREVIEW_LENGTH, create_message_store
+
+COUNT = 7
+WINDOWS = [
+    {},
+    {"limit": 3},
+    {"limit": 10},
+    {"before": 5},
+    {"before": 5, "limit": 2},
+    {"before": 2, "limit": 5},
+    {"before": 0, "limit": 3},
+    {"before": 20, "limit": 3},
+    {"after": 2},
+    {"after": 2, "limit": 2},
+    {"after": 5, "limit": 4},
+    {"after": 6, "limit": 2},
+    {"after": 30},
+]
+
+
+def conversation(conversation_id="c1", count=COUNT) -> dict:
+    now = datetime.utcnow()
+    return {
+        "id": conversation_id,
+        "title": "Test",
+        "created_at": now,
+        "updated_at": now,
+        "messages": [{"id": f"m{i}", "role": "user", "content": f"message {i}"} for i in range(count)],
+    }
+
+
+@pytest.fixture(params=["embedded", "collection"])
+def store(request):
+    db = AsyncMongoMockClient().test
+    asyncio.run(ensure_indexes(db))
+    return create_message_store(request.param, db)
+
+
+@pytest.mark.parametrize("params", WINDOWS, ids=lambda params: ",".join(f"{k}={v}" for k, v in params.items()) or "all")
+def test_window_positions(params):
+    full = conversation()
+    result = window(full, **params)
+    ids = [int(message["id"][1:]) for message in result["messages"]]
+
+    assert result["message_count"] == COUNT
+    assert ids == list(range(result["first_seq"], result["first_seq"] + len(ids)))
+    if "after" in params:
+        assert result["first_seq"] == min(params["after"] + 1, COUNT)
+    else:
+        end = min(params.get("before", COUNT), COUNT)
+        assert ids[-1:] == ([end - 1] if end else [])
+    if params.get("limit"):
+        assert len(ids) <= params["limit"]
+
+
+@pytest.mark.parametrize("params", WINDOWS, ids=lambda params: ",".join(f"{k}={v}" for k, v in params.items()) or "all")
+def test_stores_read_the_same_window_as_an_archived_conversation(store, params):
+    full = conversation()
+
+    async def run():
+        await store.create_conversation(full)
+        return await store.get_conversation("c1", **params)
+
+    stored = asyncio.run(run())
+    expected = window(full, **params)
+    assert [message["id"] for message in stored["messages"]] == [message["id"] for message in expected["messages"]]
+    assert stored["first_seq"] == expected["first_seq"]
+    assert stored["message_count"] == COUNT
+
+
+def test_appended_messages_continue_the_sequence(store):
+    async def run():
+        await store.create_conversation(conversation(count=2))
+        appended = await store.append_messages("c1", [
+            {"id": "m2", "role": "user", "content": "question"},
+            {"id": "m3", "role": "assistant", "content": "x" * (PREVIEW_LENGTH * 2)},
+        ])
+        missing = await store.append_messages("nope", [{"id": "m0", "role": "user", "content": "hi"}])
+        return appended, missing, await store.get_conversation("c1", after=1), await store.list_summaries({}, [("id", 1)], 10)
+
+    appended, missing, tail, summaries = asyncio.run(run())
+    assert appended and not missing
+    assert [message["id"] for message in tail["messages"]] == ["m2", "m3"]
+    assert tail["first_seq"] == 2
+    assert summaries[0]["message_count"] == 4
+    assert summaries[0]["last_message"] == "x" * PREVIEW_LENGTH
+
+
+def test_bulk_create_skips_existing_conversations(store):
+    async def run():
+        await store.create_conversation(conversation(count=2))
+        created = await store.create_conversations([conversation(count=5), conversation("c2", count=3)])
+        return created, await store.get_conversation("c1"), await store.get_conversation("c2")
+
+    created, existing, new = asyncio.run(run())
+    assert created == ["c2"]
+    assert existing["message_count"] == 2
+    assert len(existing["messages"]) == 2
+    assert len(new["messages"]) == 3
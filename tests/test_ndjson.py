@@ -0,0 +1,83 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+import ndjson
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def collect(iterator) -> list:
+    async def run():
+        return [item async for item in iterator]
+
+    return asyncio.run(run())
+
+
+def split(data: bytes, size: int) -> list:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+DOCUMENTS = [{"id": f"c{i}", "title": f"Conversation {i}", "messages": []} for i in range(50)]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_encoded_documents_read_back_line_by_line(compress, monkeypatch):
+    monkeypatch.setattr(ndjson, "FLUSH_SIZE", 256)
+    chunks = collect(ndjson.encode(stream(*DOCUMENTS), compress=compress))
+    body = b"".join(chunks)
+
+    assert body.startswith(ndjson.GZIP_MAGIC) == compress
+    if compress:
+        assert gzip.decompress(body).count(b"\n") == len(DOCUMENTS)
+    else:
+        assert len(chunks) > 1
+    assert [json.loads(line) for line in collect(ndjson.lines(stream(*split(body, 7))))] == DOCUMENTS
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 1000])
+def test_gzip_is_detected_however_the_body_is_chunked(size):
+    body = gzip.compress(b'{"a": 1}\n{"b": 2}')
+    assert collect(ndjson.lines(stream(*split(body, size)))) == [b'{"a": 1}', b'{"b": 2}']
+
+
+def test_lines_split_across_chunks_are_joined_and_blank_lines_dropped():
+    chunks = [b'{"a"', b': 1}\n\n  \n{"b":', b" 2}\r\n", b"", b'{"c": 3}']
+    assert collect(ndjson.lines(stream(*chunks))) == [b'{"a": 1}', b'{"b": 2}\r', b'{"c": 3}']
+    assert collect(ndjson.lines(stream(b"x"))) == [b"x"]
+    assert collect(ndjson.lines(stream())) == []
+
+
+def ndjson_body(*documents) -> bytes:
+    return b"".join(json.dumps(document).encode() + b"\n" for document in documents)
+
+
+def test_import_reports_invalid_lines(client):
+    body = ndjson_body({"id": "c1", "title": "Fine"}) + b"not json\n" + ndjson_body({"id": "c2"})
+    result = client.post("/api/conversations/import", content=body).json()
+
+    assert result["received"] == 3
+    assert result["imported"] == 1
+    assert result["invalid"] == 2
+    assert [error.split(":")[0] for error in result["errors"]] == ["line 2", "line 3"]
+
+
+def test_reimport_skips_existing_conversations_and_keeps_their_index(client):
+    first = ndjson_body({"id": "c1", "title": "Original sourdough"}, {"id": "c2", "title": "Other"})
+    assert client.post("/api/conversations/import", content=gzip.compress(first)).json()["imported"] == 2
+
+    again = ndjson_body({"id": "c1", "title": "Replacement baguette"}, {"id": "c3", "title": "New"}, {"id": "c3", "title": "Twice"})
+    result = client.post("/api/conversations/import", content=again).json()
+    assert result["imported"] == 1
+    assert result["skipped"] == 2
+
+    assert client.get("/api/conversations/c1").json()["title"] == "Original sourdough"
+    assert client.get("/api/search", params={"q": "baguette"}).json()["total"] == 0
+    assert client.get("/api/search", params={"q": "sourdough"}).json()["total"] == 1
+    assert client.get("/api/search", params={"q": "twice"}).json()["total"] == 0
+    assert client.get("/api/search", params={"q": "new"}).json()["total"] == 1
@@ -0,0 +1,274 @@
+import asyncio
+
+import pytest
+
+import fake_llm
+import llm_pool
+import resilience
+from llm_pool import LlmClientPool
+from resilience import CircuitBreaker, CircuitOpen, ResiliencePolicy, backoff_delay, hedged
+
+PRIMARY = "primary-model"
+FALLBACK = "fallback-model"
+
+
+def make_pool(**policy) -> LlmClientPool:
+    settings = {"timeout": 1.0, "max_attempts": 3, "backoff_base": 0.01, "backoff_max": 0.05}
+    settings.update(policy)
+    return LlmClientPool("test-key", model=PRIMARY, policy=ResiliencePolicy(**settings))
+
+
+async def send(pool: LlmClientPool, chat=None) -> str:
+    pool.admission.start()
+    chat = chat or pool.get("session", "You are a test")
+    return await pool.send(chat, pool.message("hello"))
+
+
+def rolls(monkeypatch, *values):
+    """Make FakeLlmChat's failure and hang rolls come out as `values`, then never fail"""
+    values = iter(values)
+    monkeypatch.setattr(fake_llm.random, "random", lambda: next(values, 0.99))
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Backoff delays the pool asked for; the pool does not actually wait"""
+    asked = []
+
+    def record(attempt, base, cap):
+        asked.append((attempt, base, cap))
+        return 0
+
+    monkeypatch.setattr(llm_pool, "backoff_delay", record)
+    return asked
+
+
+def test_backoff_delay_is_jittered_below_the_capped_exponential():
+    for attempt, ceiling in [(0, 0.5), (1, 1.0), (2, 2.0), (5, 8.0), (10, 8.0)]:
+        samples = [backoff_delay(attempt, 0.5, 8.0) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in samples)
+        assert len(set(samples)) > 1
+
+
+def test_transient_failure_is_retried_with_backoff(fake_chat, monkeypatch, delays):
+    fake_chat.configure(failure_rate=0.5)
+    rolls(monkeypatch, 0.0, 0.0)
+    pool = make_pool()
+
+    assert asyncio.run(send(pool)).startswith("the model")
+    assert fake_chat.calls == 3
+    assert pool.retries == 2
+    assert delays == [(0, 0.01, 0.05), (1, 0.01, 0.05)]
+
+
+def test_retries_stop_after_max_attempts(fake_chat, delays):
+    fake_chat.configure(failure_rate=1.0)
+    pool = make_pool(max_attempts=2, breaker_threshold=10)
+
+    with pytest.raises(fake_llm.FakeProviderError):
+        asyncio.run(send(pool))
+    assert fake_chat.calls == 2
+    assert pool.retries == 1
+
+
+def test_non_retryable_error_is_not_retried(fake_chat, monkeypatch, delays):
+    monkeypatch.setattr(fake_llm.FakeProviderError, "status_code", 400)
+    fake_chat.configure(failure_rate=1.0)
+    pool = make_pool()
+
+    with pytest.raises(fake_llm.FakeProviderError):
+        asyncio.run(send(pool))
+    assert fake_chat.calls == 1
+    assert delays == []
+
+
+def test_slow_attempt_times_out_and_is_retried(fake_chat, monkeypatch, delays):
+    fake_chat.configure(hang_rate=0.5)
+    rolls(monkeypatch, 0.0)
+    pool = make_pool(timeout=0.05)
+
+    assert asyncio.run(send(pool))
+    assert pool.timeouts == 1
+    assert pool.retries == 1
+
+
+def test_breaker_opens_after_consecutive_failures(fake_chat, delays):
+    fake_chat.configure(failure_rate=1.0)
+    pool = make_pool(max_attempts=1, breaker_threshold=2)
+
+    for _ in range(2):
+        with pytest.raises(fake_llm.FakeProviderError):
+            asyncio.run(send(pool))
+    with pytest.raises(CircuitOpen) as raised:
+        asyncio.run(send(pool))
+
+    assert fake_chat.calls == 2
+    assert raised.value.model == PRIMARY
+    assert pool.stats()["breakers_open"] == 1
+
+
+def test_breaker_half_open_lets_one_probe_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+    now[0] += 30
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    # A failed probe opens the breaker again for a full reset period
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.opened == 2
+
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_rejected_prompts_do_not_open_the_breaker(fake_chat, monkeypatch, delays):
+    monkeypatch.setattr(fake_llm.FakeProviderError, "status_code", 400)
+    fake_chat.configure(failure_rate=1.0)
+    pool = make_pool(breaker_threshold=3)
+
+    for _ in range(3):
+        with pytest.raises(fake_llm.FakeProviderError):
+            asyncio.run(send(pool))
+    fake_chat.configure(failure_rate=0.0)
+
+    assert asyncio.run(send(pool)).startswith("the model")
+    assert pool.breaker(PRIMARY).state == "closed"
+
+
+def test_cancelled_probe_frees_the_half_open_breaker(fake_chat):
+    pool = make_pool(max_attempts=1, breaker_threshold=1, breaker_reset=30)
+    breaker = pool.breaker(PRIMARY)
+    breaker.record_failure()
+    # Due for a probe
+    breaker.opened_at -= 30
+
+    async def run():
+        chat = pool.get("session", "You are a test")
+        chat.latency = 10
+        probe = asyncio.create_task(send(pool, chat))
+        await asyncio.sleep(0.01)
+        assert breaker.probing
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        chat.latency = 0
+        return await send(pool, chat)
+
+    assert asyncio.run(run()).startswith("the model")
+    assert breaker.state == "closed"
+    assert not breaker.probing
+
+
+def test_hedge_wins_over_a_stuck_attempt(fake_chat):
+    pool = make_pool(hedge_after=0.01)
+    chat = pool.get("session", "You are a test")
+    chat.latency = 10
+
+    async def run():
+        result = await send(pool, chat)
+        # Let the cancelled loser unwind
+        await asyncio.sleep(0.01)
+        return result, asyncio.all_tasks() - {asyncio.current_task()}
+
+    result, leftover = asyncio.run(run())
+    assert result.startswith("the model")
+    assert pool.hedges == 1
+    assert pool.hedge_wins == 1
+    # The stuck attempt was cancelled, not left running
+    assert leftover == set()
+
+
+def test_hedge_loses_to_a_first_attempt_that_finishes_first(fake_chat):
+    fake_chat.configure(latency=10)
+    pool = make_pool(hedge_after=0.01)
+    chat = pool.get("session", "You are a test")
+    chat.latency = 0.05
+
+    async def run():
+        result = await send(pool, chat)
+        # Let the cancelled loser unwind
+        await asyncio.sleep(0.01)
+        return result, asyncio.all_tasks() - {asyncio.current_task()}
+
+    result, leftover = asyncio.run(run())
+    assert result.startswith("the model")
+    assert fake_chat.calls == 2
+    assert pool.hedges == 1
+    assert pool.hedge_wins == 0
+    assert leftover == set()
+
+
+def test_hedge_uses_a_client_of_its_own():
+    clients = []
+
+    async def call(client):
+        clients.append(client)
+        await asyncio.sleep(10 if len(clients) == 1 else 0)
+        return client
+
+    first = object()
+    result, hedge_won = asyncio.run(hedged(call, first, object, timeout=1, hedge_after=0.01))
+    assert hedge_won
+    assert result is clients[1] and result is not first
+
+
+def test_fallback_model_answers_when_the_primary_fails(fake_chat, delays):
+    fake_chat.configure(model_failure_rates={PRIMARY: 1.0})
+    pool = make_pool(max_attempts=2, fallback_model=FALLBACK)
+
+    assert asyncio.run(send(pool)).startswith("the model")
+    assert pool.fallbacks == 1
+    assert fake_chat.calls == 3
+    assert pool.breaker(FALLBACK).state == "closed"
+
+
+def test_open_breaker_goes_straight_to_the_fallback(fake_chat, delays):
+    fake_chat.configure(model_failure_rates={PRIMARY: 1.0})
+    pool = make_pool(max_attempts=1, breaker_threshold=1, fallback_model=FALLBACK)
+
+    asyncio.run(send(pool))
+    calls = fake_chat.calls
+    asyncio.run(send(pool))
+
+    assert pool.breaker(PRIMARY).state == "open"
+    assert pool.fallbacks == 2
+    # The second call skipped the primary entirely
+    assert fake_chat.calls == calls + 1
+
+
+def test_no_fallback_when_the_fallback_also_fails(fake_chat, delays):
+    fake_chat.configure(failure_rate=1.0)
+    pool = make_pool(max_attempts=1, fallback_model=FALLBACK)
+
+    with pytest.raises(fake_llm.FakeProviderError):
+        asyncio.run(send(pool))
+    assert pool.fallbacks == 1
+    assert fake_chat.calls == 2
+
+
+def test_stream_falls_back_before_the_first_delta(fake_chat, delays):
+    fake_chat.configure(model_failure_rates={PRIMARY: 1.0}, response_tokens=3)
+    pool = make_pool(max_attempts=1, fallback_model=FALLBACK)
+
+    async def run():
+        pool.admission.start()
+        chat = pool.get("session", "You are a test")
+        return [delta async for delta in pool.stream(chat, pool.message("hello"))]
+
+    assert "".join(asyncio.run(run())) == "the model returns"
+    assert pool.fallbacks == 1
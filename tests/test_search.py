@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from archive import Archiver, CollectionArchive
+from indexes import ensure_indexes
+from message_store import create_message_store
+from search import InvertedIndexSearch, make_snippet, tokenize
+
+
+def conversation(conversation_id, title, *contents) -> dict:
+    now = datetime.utcnow() - timedelta(days=30)
+    return {
+        "id": conversation_id,
+        "title": title,
+        "created_at": now,
+        "updated_at": now,
+        "messages": [{"id": f"{conversation_id}-m{i}", "role": "user", "content": content} for i, content in enumerate(contents)],
+    }
+
+
+@pytest.fixture(params=["embedded", "collection"])
+def store(request):
+    db = AsyncMongoMockClient().test
+    asyncio.run(ensure_indexes(db))
+    return create_message_store(request.param, db)
+
+
+def indexed(store, *conversations) -> InvertedIndexSearch:
+    search = InvertedIndexSearch(store)
+    for conv in conversations:
+        search.index_conversation(conv)
+    return search
+
+
+def test_tokenize_drops_stopwords_and_single_characters():
+    assert tokenize("What is the Plan, Bob? A 2nd x-ray") == ["plan", "bob", "2nd", "ray"]
+    assert tokenize("ＦＵＬＬ width") == ["full", "width"]
+    assert tokenize(None) == []
+
+
+def test_make_snippet_windows_the_first_match():
+    text = " ".join(f"word{i}" for i in range(100)) + " needle  and   more text after it" + " tail" * 50
+    snippet = make_snippet(text, ["needle"], length=60)
+
+    assert snippet.startswith("…word") and snippet.endswith("…")
+    assert "needle and more" in snippet
+    assert len(snippet) <= 62
+    assert make_snippet("Needle first", ["needle"]) == "Needle first"
+    assert make_snippet("nothing here", ["needle"]) is None
+
+
+def test_bm25_ranks_titles_and_frequent_terms_higher(store):
+    search = indexed(
+        store,
+        conversation("title", "Sourdough", "feeding schedule"),
+        conversation("once", "Baking", "sourdough feeding"),
+        conversation("padded", "Baking", "sourdough feeding with a much longer message around the one mention"),
+        conversation("none", "Gardening", "tomatoes"),
+    )
+
+    total, page = asyncio.run(search.search("sourdough", 10))
+    assert total == 3
+    # A title match weighs more than a message match; longer documents are normalized down
+    assert [result["conversation_id"] for result in page] == ["title", "once", "padded"]
+    assert page[0]["score"] > page[1]["score"] > page[2]["score"]
+
+    total, page = asyncio.run(search.search("sourdough", 1, offset=1))
+    assert total == 3
+    assert [result["conversation_id"] for result in page] == ["once"]
+
+    # Rarer terms count for more
+    total, page = asyncio.run(search.search("schedule feeding", 10))
+    assert page[0]["conversation_id"] == "title"
+
+
+def test_set_title_and_remove_keep_the_index_consistent(store):
+    search = indexed(store, conversation("c1", "Old name", "shared words"), conversation("c2", "Other", "shared"))
+
+    search.set_title("c1", "Fresh title")
+    assert "old" not in search.postings and "name" not in search.postings
+    assert search.documents["c1"]["title"] == "Fresh title"
+    assert search.total_length == sum(document["length"] for document in search.documents.values())
+    assert asyncio.run(search.search("fresh", 10))[1][0]["title"] == "Fresh title"
+    assert asyncio.run(search.search("old", 10)) == (0, [])
+
+    search.remove("c1")
+    assert set(search.postings) == {"other", "shared"}
+    assert search.postings["shared"] == {"c2": 1.0}
+    assert search.total_length == search.documents["c2"]["length"]
+
+    search.remove("c2")
+    search.remove("missing")
+    assert not search.postings and not search.documents
+    assert search.total_length == 0
+
+
+def test_snippets_for_a_page_are_read_in_one_batch(store, monkeypatch):
+    conversations = [conversation(f"c{i}", "Chat", "intro", f"the answer is {i}", "outro") for i in range(3)]
+
+    async def run():
+        for conv in conversations:
+            await store.create_conversation(conv)
+        search = indexed(store, *conversations)
+
+        async def one_by_one(*args, **kwargs):
+            raise AssertionError("snippets read one conversation at a time")
+
+        monkeypatch.setattr(store, "get_conversation", one_by_one)
+        return await search.search("answer", 10)
+
+    total, page = asyncio.run(run())
+    assert total == 3
+    assert sorted((result["message_id"], result["snippet"]) for result in page) == [
+        (f"c{i}-m1", f"the answer is {i}") for i in range(3)
+    ]
+
+
+def test_archived_conversations_are_indexed_and_snippeted(store):
+    archiver = Archiver(store, CollectionArchive(store.db.conversation_archive), idle_days=1, index_text=True)
+
+    async def run():
+        await store.create_conversation(conversation("c1", "Trip", "pack the telescope", "and a tent"))
+        await store.create_conversation(conversation("c2", "Recipes", "bake bread"))
+        assert await archiver.archive("c1")
+        archived_text = await store.db.archived_text.find_one({"_id": "c1"})
+
+        search = InvertedIndexSearch(store, archiver)
+        await search.start()
+        found = await search.search("telescope", 10)
+
+        assert await archiver.restore("c1")
+        return archived_text, found, await store.db.archived_text.count_documents({})
+
+    archived_text, (total, page), left = asyncio.run(run())
+    assert archived_text["content"] == ["pack the telescope", "and a tent"]
+    assert total == 1
+    assert page[0]["conversation_id"] == "c1"
+    assert page[0]["message_id"] == "c1-m0"
+    assert "telescope" in page[0]["snippet"]
+    assert left == 0
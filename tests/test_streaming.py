@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+
+def events(body: str):
+    """(event, data) pairs of a Server-Sent Events body"""
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        event, data = "message", None
+        for line in block.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        parsed.append((event, data))
+    return parsed
+
+
+@pytest.fixture
+def conversation_id(client):
+    response = client.post("/api/chat/send", json={"message": "Hello there", "title": "Hello there"})
+    return response.json()["conversation_id"]
+
+
+@pytest.fixture
+def deleted_mid_stream(server, monkeypatch):
+    """Delete the conversation after the reply is generated, before it is stored"""
+    store_turn = server.store_turn
+
+    async def delete_then_store(request, conversation_id, *args):
+        await server.message_store.delete_conversation(conversation_id)
+        await store_turn(request, conversation_id, *args)
+
+    monkeypatch.setattr(server, "store_turn", delete_then_store)
+
+
+def test_stream_ends_with_done_once_the_turn_is_stored(client, conversation_id):
+    response = client.post("/api/chat/stream", json={"conversation_id": conversation_id, "message": "More please"})
+    kinds = [event for event, _ in events(response.text)]
+
+    assert kinds[0] == "start" and kinds[-1] == "done"
+    stored = client.get(f"/api/conversations/{conversation_id}").json()
+    assert stored["messages"][-1]["content"] == events(response.text)[-1][1]["ai_message"]["content"]
+
+
+def test_stream_reports_an_error_when_the_turn_cannot_be_stored(client, conversation_id, deleted_mid_stream):
+    response = client.post("/api/chat/stream", json={"conversation_id": conversation_id, "message": "More please"})
+    parsed = events(response.text)
+
+    assert [event for event, _ in parsed if event != "message"] == ["start", "error"]
+    assert parsed[-1][1]["status"] == 404
+    assert client.get(f"/api/conversations/{conversation_id}").status_code == 404
+
+
+def test_socket_reports_an_error_when_the_turn_cannot_be_stored(client, conversation_id, deleted_mid_stream):
+    with client.websocket_connect("/api/ws") as socket:
+        socket.send_json({"type": "send", "request_id": "r1", "conversation_id": conversation_id, "message": "More"})
+        frames = []
+        while not frames or frames[-1]["type"] not in ("done", "error"):
+            frames.append(socket.receive_json())
+
+    assert frames[0]["type"] == "start"
+    assert frames[-1]["type"] == "error"
+    assert frames[-1]["status"] == 404
+    assert frames[-1]["request_id"] == "r1"
+    assert frames[-1]["conversation_id"] == conversation_id
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+from starlette.requests import Request
+
+from sync import TombstoneLog, conditional_json, etag_for, etag_matches
+
+
+def request(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_etag_matches_lists_weak_tags_and_wildcard():
+    etag = etag_for(b"{}")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_conditional_json_answers_a_current_copy_with_304():
+    first = conditional_json(request(), {"conversations": [], "next_cursor": None})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = conditional_json(request(etag), {"conversations": [], "next_cursor": None})
+    assert again.status_code == 304
+    assert again.body == b""
+    assert again.headers["etag"] == etag
+
+    changed = conditional_json(request(etag), {"conversations": [{"id": "c1"}], "next_cursor": None})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_tombstones_since_a_time_and_their_horizon():
+    log = TombstoneLog(AsyncMongoMockClient().test.conversation_tombstones, ttl=3600)
+    before = datetime.utcnow() - timedelta(seconds=1)
+
+    async def run():
+        await log.record("c1")
+        await log.record("c1")
+        return await log.deleted_since(before), await log.deleted_since(datetime.utcnow())
+
+    deleted, none = asyncio.run(run())
+    assert deleted == ["c1"]
+    assert none == []
+    assert log.covers(before)
+    assert not log.covers(datetime.utcnow() - timedelta(hours=2))
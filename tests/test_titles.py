@@ -0,0 +1,38 @@
+def wait_for_titles(server, client):
+    client.portal.call(server.title_queue._queue.join)
+
+
+def first_send(client, message):
+    # The sidebar's payload for a new chat: the first 50 characters as a provisional title
+    response = client.post("/api/chat/send", json={"conversation_id": None, "message": message, "title": message[:50]})
+    assert response.status_code == 200
+    return response.json()["conversation_id"]
+
+
+def test_generated_title_replaces_the_provisional_one(server, client):
+    message = "Explain how the garbage collector decides when to run a full collection cycle"
+    assert len(message) > 50
+    conversation_id = first_send(client, message)
+    wait_for_titles(server, client)
+
+    conversation = client.get(f"/api/conversations/{conversation_id}").json()
+    assert conversation["title"] == "Benchmark conversation"
+    assert "auto_title" not in conversation
+
+
+def test_generated_title_replaces_a_short_provisional_one(server, client):
+    conversation_id = first_send(client, "Hi there")
+    wait_for_titles(server, client)
+
+    assert client.get(f"/api/conversations/{conversation_id}").json()["title"] == "Benchmark conversation"
+
+
+def test_rename_before_the_title_is_generated_is_kept(server, client):
+    # No background title job, so the one generated below runs after the rename
+    client.portal.call(server.title_queue.drain)
+    conversation_id = first_send(client, "Explain how the garbage collector decides when to run a full collection cycle")
+    response = client.put(f"/api/conversations/{conversation_id}/title", params={"title": "Mine"})
+    assert response.status_code == 200
+
+    client.portal.call(server.generate_title, conversation_id, "Explain how the garbage collector works")
+    assert client.get(f"/api/conversations/{conversation_id}").json()["title"] == "Mine"